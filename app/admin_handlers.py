@@ -1,19 +1,31 @@
 # app/admin_handlers.py - admin handlers for the bot (wrapped functions)
-from telegram import Update, InputFile
+from telegram import Update, InputFile, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
-from db import fetch, fetchrow
-import tempfile, csv, os
+from db import fetch, fetchval, iterate
+from exports import build_export_query, ENCODERS, WATERMARK_QUERY
+from stats import get_stats, format_stats
+from bulk_import import import_file, format_from_name
+from allocation import repack_bookings, format_plan
+import refdata
+import broadcast
+import tempfile, os
+import logging
 
 from bot_constants import MASTER_PASSWORD
 
-admin_sessions = {}
+logger = logging.getLogger(__name__)
+
+CLIENTS_PAGE_SIZE = int(os.getenv('CLIENTS_PAGE_SIZE', 20))
+# keeps a full page well under Telegram's 4096-character message limit
+CLIENT_LINE_MAX = 180
 
 async def admin_cmd_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     args = context.args
     if args:
         if args[0] == MASTER_PASSWORD:
-            admin_sessions[update.message.from_user.id] = True
-            await update.message.reply_text('Admin authenticated. Use /admin_stats, /list_clients, /export_bookings')
+            # kept in user_data so it survives restarts through the persistence
+            context.user_data['is_admin'] = True
+            await update.message.reply_text('Admin authenticated. Use /admin_stats, /list_clients, /export_bookings, /repack, /broadcast, or send a CSV/NDJSON file captioned /import')
             return
         else:
             await update.message.reply_text('Wrong password.')
@@ -21,45 +33,167 @@ async def admin_cmd_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text('Send /admin <password> to authenticate.')
 
 async def admin_stats_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    uid = update.message.from_user.id
-    if not admin_sessions.get(uid):
+    if not context.user_data.get('is_admin'):
         await update.message.reply_text('Not authenticated. Use /admin <password>.')
         return
-    total_pets = await fetchrow('SELECT COUNT(*) FROM pets')
-    total_bookings = await fetchrow('SELECT COUNT(*) FROM bookings')
-    revenue = await fetchrow('SELECT COALESCE(SUM(estimated_price),0) FROM bookings')
-    s = f"Stats:\nPets: {total_pets['count']}\nBookings: {total_bookings['count']}\nEstimated revenue: ${float(revenue['coalesce']):.2f}"
-    await update.message.reply_text(s)
+    await update.message.reply_text(format_stats(await get_stats()))
+
+def _clients_query(after=None, before=None, search=None):
+    clauses, args = [], []
+    if search:
+        args.append(f'%{search}%')
+        clauses.append(f'(o.name ILIKE ${len(args)} OR o.phone ILIKE ${len(args)})')
+    if after is not None:
+        args.append(after)
+        clauses.append(f'o.id > ${len(args)}')
+    if before is not None:
+        args.append(before)
+        clauses.append(f'o.id < ${len(args)}')
+    where = ' WHERE ' + ' AND '.join(clauses) if clauses else ''
+    # one extra row tells whether there is another page in that direction
+    args.append(CLIENTS_PAGE_SIZE + 1)
+    order = 'DESC' if before is not None else 'ASC'
+    sql = f'''SELECT o.id, o.name, o.phone, string_agg(p.name || ' #' || p.id, ', ' ORDER BY p.id) AS pets
+        FROM (SELECT o.id, o.name, o.phone FROM owners o{where} ORDER BY o.id {order} LIMIT ${len(args)}) o
+        LEFT JOIN pets p ON p.owner_id = o.id
+        GROUP BY o.id, o.name, o.phone ORDER BY o.id'''
+    return sql, args
+
+async def _clients_page(after=None, before=None, search=None):
+    sql, args = _clients_query(after, before, search)
+    rows = await fetch(sql, *args)
+    if before is not None:
+        has_prev, has_next = len(rows) > CLIENTS_PAGE_SIZE, True
+        rows = rows[-CLIENTS_PAGE_SIZE:]
+    else:
+        has_prev, has_next = after is not None, len(rows) > CLIENTS_PAGE_SIZE
+        rows = rows[:CLIENTS_PAGE_SIZE]
+    if not rows:
+        return ('No clients found.' if search else 'No clients yet.'), None
+    lines = [f"Clients{f' matching {search!r}' if search else ''}:"]
+    for r in rows:
+        line = f"Owner #{r['id']}: {r['name']} ({r['phone']}) — Pets: {r['pets'] or 'none'}"
+        lines.append(line if len(line) <= CLIENT_LINE_MAX else line[:CLIENT_LINE_MAX - 1] + '…')
+    nav = []
+    if has_prev:
+        nav.append(InlineKeyboardButton('< Prev', callback_data=f"clients:prev:{rows[0]['id']}"))
+    if has_next:
+        nav.append(InlineKeyboardButton('Next >', callback_data=f"clients:next:{rows[-1]['id']}"))
+    return '\n'.join(lines), (InlineKeyboardMarkup([nav]) if nav else None)
 
 async def list_clients_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    uid = update.message.from_user.id
-    if not admin_sessions.get(uid):
+    if not context.user_data.get('is_admin'):
         await update.message.reply_text('Not authenticated. Use /admin <password>.')
         return
-    rows = await fetch('SELECT o.id as owner_id, o.name, o.phone, p.id as pet_id, p.name as pet_name FROM owners o LEFT JOIN pets p ON p.owner_id=o.id ORDER BY o.id')
-    s = 'Clients and pets:\n'
-    for r in rows:
-        s += f"Owner #{r['owner_id']}: {r['name']} ({r['phone']}) — Pet #{r['pet_id']}: {r['pet_name']}\n"
-    await update.message.reply_text(s)
+    # /list_clients [name or phone fragment]
+    search = ' '.join(context.args or []).strip() or None
+    context.user_data['clients_search'] = search
+    text, markup = await _clients_page(search=search)
+    await update.message.reply_text(text, reply_markup=markup)
+
+async def list_clients_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    if not context.user_data.get('is_admin'):
+        await query.answer('Not authenticated.')
+        return
+    await query.answer()
+    _, direction, owner_id = query.data.split(':')
+    search = context.user_data.get('clients_search')
+    if direction == 'next':
+        text, markup = await _clients_page(after=int(owner_id), search=search)
+    else:
+        text, markup = await _clients_page(before=int(owner_id), search=search)
+    await query.edit_message_text(text, reply_markup=markup)
 
 async def export_bookings_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    uid = update.message.from_user.id
-    if not admin_sessions.get(uid):
+    if not context.user_data.get('is_admin'):
         await update.message.reply_text('Not authenticated. Use /admin <password>.')
         return
-    rows = await fetch('''SELECT b.id, o.name as owner_name, p.name as pet_name, k.code as kennel_code, b.start_date, b.end_date, f.name as food_name, b.food_quantity, b.feeding_frequency_per_day, b.services, b.estimated_price, b.created_at FROM bookings b JOIN pets p ON p.id=b.pet_id JOIN owners o ON o.id=p.owner_id LEFT JOIN kennels k ON k.id=b.kennel_id LEFT JOIN foods f ON f.id=b.food_id ORDER BY b.created_at DESC''')
-    tmp = tempfile.NamedTemporaryFile(delete=False, suffix='.csv')
+    # /export_bookings [watermark] [csv|ndjson]
+    since, fmt = None, 'csv'
+    for arg in context.args or []:
+        if arg.isdigit():
+            since = int(arg)
+        elif arg in ENCODERS:
+            fmt = arg
+        else:
+            await update.message.reply_text('Usage: /export_bookings [watermark] [csv|ndjson]')
+            return
+    watermark = await fetchval(WATERMARK_QUERY)
+    query, args = build_export_query(since=since)
+    encode, _ = ENCODERS[fmt]
+    tmp = tempfile.NamedTemporaryFile(delete=False, suffix=f'.{fmt}')
     try:
-        writer = csv.writer(tmp)
-        writer.writerow(['booking_id','owner','pet','kennel','start_date','end_date','food','food_qty','freq_per_day','services','estimated_price','created_at'])
-        for r in rows:
-            writer.writerow([r['id'], r['owner_name'], r['pet_name'], r['kennel_code'], r['start_date'], r['end_date'], r['food_name'], r['food_quantity'], r['feeding_frequency_per_day'], r['services'], float(r['estimated_price']) if r['estimated_price'] else '', r['created_at']])
-        tmp.flush()
+        async for chunk in encode(iterate(query, *args)):
+            tmp.write(chunk)
         tmp.close()
         with open(tmp.name, 'rb') as f:
-            await update.message.reply_document(document=InputFile(f, filename='bookings.csv'))
+            await update.message.reply_document(document=InputFile(f, filename=f'bookings.{fmt}'), caption=f'Next watermark: {watermark}')
     finally:
         try:
             os.unlink(tmp.name)
         except:
             pass
+
+async def import_document_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # a CSV/NDJSON document sent with the caption /import
+    if not context.user_data.get('is_admin'):
+        await update.message.reply_text('Not authenticated. Use /admin <password>.')
+        return
+    doc = update.message.document
+    fmt = format_from_name(doc.file_name)
+    if fmt is None:
+        await update.message.reply_text('Send a .csv or .ndjson file with the caption /import.')
+        return
+    tmp = tempfile.NamedTemporaryFile(delete=False, suffix=f'.{fmt}')
+    tmp.close()
+    try:
+        await (await doc.get_file()).download_to_drive(tmp.name)
+        report = await import_file(tmp.name, fmt)
+        await update.message.reply_text(report.summary())
+    except Exception:
+        logger.exception('import_document_handler')
+        await update.message.reply_text('Import failed; nothing was saved.')
+    finally:
+        try:
+            os.unlink(tmp.name)
+        except:
+            pass
+
+async def repack_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not context.user_data.get('is_admin'):
+        await update.message.reply_text('Not authenticated. Use /admin <password>.')
+        return
+    # /repack shows the plan, /repack apply commits it
+    apply = (context.args or [''])[0] == 'apply'
+    try:
+        plan = await repack_bookings(apply)
+    except Exception:
+        logger.exception('repack_handler')
+        await update.message.reply_text('Re-pack failed; no booking was changed.')
+        return
+    codes = {k['id']: k['code'] for k in await refdata.get_kennels(active_only=False)}
+    await update.message.reply_text(format_plan(plan, codes))
+
+async def broadcast_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not context.user_data.get('is_admin'):
+        await update.message.reply_text('Not authenticated. Use /admin <password>.')
+        return
+    # /broadcast <text> messages every registered owner
+    text = update.message.text.partition(' ')[2].strip()
+    if not text:
+        await update.message.reply_text('Usage: /broadcast <message>')
+        return
+    chat_id = update.effective_chat.id
+
+    async def run():
+        try:
+            n = await broadcast.announce(text)
+            await broadcast.broadcaster.drain()
+            await context.bot.send_message(chat_id, f'Broadcast sent to {n} owners.')
+        except Exception:
+            logger.exception('broadcast_handler')
+            await context.bot.send_message(chat_id, 'Broadcast failed part way; see the logs.')
+
+    context.application.create_task(run())
+    await update.message.reply_text('Broadcast started; I will report when it is done.')
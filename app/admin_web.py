@@ -1,12 +1,25 @@
-# app/admin_web.py - Admin UI + Stripe endpoints
+# app/admin_web.py - Admin UI, Stripe endpoints and (in webhook mode) the bot's update intake
 import os
 from fastapi import FastAPI, Request, HTTPException, Form
-from fastapi.responses import HTMLResponse, StreamingResponse, PlainTextResponse, RedirectResponse
-import csv, io, asyncio
+from fastapi.responses import HTMLResponse, StreamingResponse, PlainTextResponse, RedirectResponse, Response
+import asyncio
 from dotenv import load_dotenv
-from db import get_pool
-from datetime import datetime
+from db import get_pool, iterate, fetchval, execute, statement_cache_stats
+import payment_events
+import refdata
+import stats
+from stats import get_stats, get_occupancy
+from analytics import GRANULARITIES
+from metrics import registry, CONTENT_TYPE
+from exports import build_export_query, gzip_chunks, ENCODERS, WATERMARK_QUERY
+from bulk_import import import_file, IMPORT_FORMATS
+from allocation import repack_bookings
+import tempfile
+from datetime import date, datetime, timedelta
+import hmac
+import logging
 import stripe
+from telegram import Update
 
 load_dotenv()
 MASTER_PASSWORD = os.getenv('MASTER_PASSWORD', 'supersecretmasterpass')
@@ -14,11 +27,59 @@ STRIPE_API_KEY = os.getenv('STRIPE_API_KEY')
 STRIPE_WEBHOOK_SECRET = os.getenv('STRIPE_WEBHOOK_SECRET')
 APP_HOST = os.getenv('APP_HOST', 'http://localhost')
 APP_PORT = os.getenv('APP_PORT', '8080')
+EXPORT_PREFETCH = int(os.getenv('EXPORT_PREFETCH', 500))
+# BOT_MODE=webhook runs the bot inside this server, BOT_MODE=sharded in BOT_WORKERS
+# worker processes fed from here (dispatcher.py); Telegram posts updates to /telegram
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+TELEGRAM_WEBHOOK_SECRET = os.getenv('TELEGRAM_WEBHOOK_SECRET', '')
+# public https base URL registered with Telegram; unset to skip set_webhook (local benchmarks)
+TELEGRAM_WEBHOOK_URL = os.getenv('TELEGRAM_WEBHOOK_URL')
+
+logger = logging.getLogger(__name__)
 
 if STRIPE_API_KEY:
     stripe.api_key = STRIPE_API_KEY
 
 app = FastAPI()
+bot_application = None
+bot_dispatcher = None
+payment_consumer = None
+
+@app.on_event('startup')
+async def startup():
+    global bot_application, bot_dispatcher, payment_consumer
+    await get_pool()
+    await refdata.start_listener()
+    await stats.start_listener()
+    # keep a reference: the loop only holds tasks weakly
+    payment_consumer = asyncio.create_task(payment_events.run_consumer())
+    if BOT_MODE not in ('webhook', 'sharded'):
+        return
+    if not TELEGRAM_WEBHOOK_SECRET:
+        raise RuntimeError(f'BOT_MODE={BOT_MODE} needs TELEGRAM_WEBHOOK_SECRET')
+    if BOT_MODE == 'sharded':
+        from dispatcher import ShardedDispatcher
+        bot_dispatcher = ShardedDispatcher()
+        bot_dispatcher.start()
+    else:
+        import bot
+        bot_application = await bot.start_application(polling=False)
+    if TELEGRAM_WEBHOOK_URL:
+        from telegram import Bot
+        async with Bot(os.getenv('BOT_TOKEN')) as tg:
+            await tg.set_webhook(TELEGRAM_WEBHOOK_URL.rstrip('/') + '/telegram', secret_token=TELEGRAM_WEBHOOK_SECRET, allowed_updates=Update.ALL_TYPES)
+    logger.info('Bot running in %s mode', BOT_MODE)
+
+@app.on_event('shutdown')
+async def shutdown():
+    if payment_consumer is not None:
+        payment_consumer.cancel()
+        await asyncio.gather(payment_consumer, return_exceptions=True)
+    if bot_application is not None:
+        import bot
+        await bot.stop_application(bot_application)
+    if bot_dispatcher is not None:
+        await asyncio.get_running_loop().run_in_executor(None, bot_dispatcher.stop)
 
 def check_token(token: str):
     return token == MASTER_PASSWORD
@@ -27,42 +88,84 @@ def check_token(token: str):
 async def index(request: Request, token: str = ''):
     if not check_token(token):
         raise HTTPException(status_code=401, detail='Unauthorized - provide ?token=MASTER_PASSWORD')
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        total_pets = await conn.fetchval('SELECT COUNT(*) FROM pets')
-        total_bookings = await conn.fetchval('SELECT COUNT(*) FROM bookings')
-        revenue = await conn.fetchval('SELECT COALESCE(SUM(estimated_price),0) FROM bookings')
-        kennels = await conn.fetch('SELECT id, code, size, daily_price, is_active FROM kennels ORDER BY id')
+    stats = await get_stats()
     html = f"""<html><head><title>PetHotel Admin</title></head><body>
     <h1>PetHotel - Admin</h1>
-    <p>Total pets: {total_pets}</p>
-    <p>Total bookings: {total_bookings}</p>
-    <p>Estimated revenue: ${float(revenue):.2f}</p>
+    <p>Total pets: {stats['pets']}</p>
+    <p>Total bookings: {stats['bookings']} (paid {stats['paid_bookings']}, unpaid {stats['unpaid_bookings']})</p>
+    <p>Estimated revenue: ${stats['revenue']:.2f} (paid ${stats['paid_revenue']:.2f}, unpaid ${stats['unpaid_revenue']:.2f})</p>
     <h2>Kennels</h2>
     <ul>
     """
-    for k in kennels:
-        html += f"<li>{k['code']} ({k['size']}) - ${k['daily_price']} - {'active' if k['is_active'] else 'inactive'}</li>"
+    for k in stats['kennels']:
+        html += f"<li>{k['code']} ({k['size']}) - ${k['daily_price']} - {'active' if k['is_active'] else 'inactive'} - {k['bookings']} bookings, {k['booked_days']} days, ${float(k['revenue']):.2f}{' - occupied today' if k['occupied_today'] else ''}</li>"
     html += "</ul>"
     html += f"<p><a href='/export_bookings?token={token}'>Download bookings CSV</a></p>"
+    html += f"<p><a href='/analytics/occupancy?token={token}'>Occupancy next 30 days (JSON)</a></p>"
+    sc = statement_cache_stats()
+    html += f"<p>Prepared statements: {sc['hits']} hits, {sc['misses']} misses over {sc['connections']} connections</p>"
     html += "</body></html>"
     return HTMLResponse(content=html)
 
 @app.get('/export_bookings')
-async def export_bookings(token: str = ''):
+async def export_bookings(token: str = '', start: date | None = None, end: date | None = None, kennel: str = '', since: int | None = None, format: str = 'csv', gzip: bool = False):
+    if not check_token(token):
+        raise HTTPException(status_code=401, detail='Unauthorized')
+    if format not in ENCODERS:
+        raise HTTPException(status_code=400, detail=f'Unknown format, use one of: {", ".join(ENCODERS)}')
+    # read before the export's own snapshot, so nothing below it can be missing from the stream
+    watermark = await fetchval(WATERMARK_QUERY)
+    query, args = build_export_query(start, end, kennel, since=since)
+    encode, media_type = ENCODERS[format]
+    body = encode(iterate(query, *args, prefetch=EXPORT_PREFETCH), EXPORT_PREFETCH)
+    filename = f'bookings_{datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")}.{format}'
+    headers = {'Content-Disposition': f'attachment; filename="{filename}"', 'X-Next-Watermark': str(watermark)}
+    if gzip:
+        body = gzip_chunks(body)
+        headers['Content-Encoding'] = 'gzip'
+    return StreamingResponse(body, media_type=media_type, headers=headers)
+
+# POST /import?token=...&format=csv|ndjson with the file as the request body;
+# the body is spooled to disk and streamed through validation into COPY
+@app.post('/import')
+async def import_pets(request: Request, token: str = '', format: str = 'csv'):
+    if not check_token(token):
+        raise HTTPException(status_code=401, detail='Unauthorized')
+    if format not in IMPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f'Unknown format, use one of: {", ".join(IMPORT_FORMATS)}')
+    with tempfile.NamedTemporaryFile(suffix=f'.{format}') as tmp:
+        async for chunk in request.stream():
+            tmp.write(chunk)
+        tmp.flush()
+        report = await import_file(tmp.name, format)
+    return report.as_dict()
+
+# GET /analytics/occupancy?token=...&start=2025-07-01&end=2025-07-31&granularity=day|week|month&group=size|kennel
+@app.get('/analytics/occupancy')
+async def analytics_occupancy(token: str = '', start: date | None = None, end: date | None = None, granularity: str = 'day', group: str = 'size'):
+    if not check_token(token):
+        raise HTTPException(status_code=401, detail='Unauthorized')
+    if granularity not in GRANULARITIES:
+        raise HTTPException(status_code=400, detail=f'Unknown granularity, use one of: {", ".join(GRANULARITIES)}')
+    start = start or date.today()
+    end = end or start + timedelta(days=30)
+    if end < start:
+        raise HTTPException(status_code=400, detail='end is before start')
+    try:
+        return await get_occupancy(start, end, granularity, group)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# POST /repack?token=... plans a re-pack of future unpaid bookings; &apply=true commits it
+@app.post('/repack')
+async def repack(token: str = '', apply: bool = False):
     if not check_token(token):
         raise HTTPException(status_code=401, detail='Unauthorized')
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        rows = await conn.fetch('''SELECT b.id, o.name as owner_name, p.name as pet_name, k.code as kennel_code, b.start_date, b.end_date, f.name as food_name, b.food_quantity, b.feeding_frequency_per_day, b.services, b.estimated_price, b.created_at FROM bookings b JOIN pets p ON p.id=b.pet_id JOIN owners o ON o.id=p.owner_id LEFT JOIN kennels k ON k.id=b.kennel_id LEFT JOIN foods f ON f.id=b.food_id ORDER BY b.created_at DESC''')
-    buf = io.StringIO()
-    writer = csv.writer(buf)
-    writer.writerow(['booking_id','owner','pet','kennel','start_date','end_date','food','food_qty','freq_per_day','services','estimated_price','created_at'])
-    for r in rows:
-        writer.writerow([r['id'], r['owner_name'], r['pet_name'], r['kennel_code'], r['start_date'], r['end_date'], r['food_name'], r['food_quantity'], r['feeding_frequency_per_day'], r['services'], float(r['estimated_price']) if r['estimated_price'] else '', r['created_at']])
-    buf.seek(0)
-    filename = f'bookings_{datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")}.csv'
-    return StreamingResponse(iter([buf.getvalue()]), media_type='text/csv', headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+    return await repack_bookings(apply)
+
+@app.get('/metrics')
+async def metrics():
+    return Response(registry.render(), media_type=CONTENT_TYPE)
 
 # Success and cancel pages for Stripe
 @app.get('/payment_success', response_class=HTMLResponse)
@@ -73,7 +176,7 @@ async def payment_success(session_id: str = None):
 async def payment_cancel():
     return HTMLResponse('<html><body><h1>Payment cancelled</h1><p>Your booking is saved but not paid.</p></body></html>')
 
-# (Optional) basic Stripe webhook handler placeholder
+# Stripe webhook: verify, store once per event id, acknowledge; payment_events.run_consumer applies them in batches
 @app.post('/stripe_webhook')
 async def stripe_webhook(request: Request):
     if not STRIPE_WEBHOOK_SECRET:
@@ -84,5 +187,24 @@ async def stripe_webhook(request: Request):
         event = stripe.Webhook.construct_event(payload, sig_header, STRIPE_WEBHOOK_SECRET)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
-    # handle event types here (checkout.session.completed, etc.)
+    await execute('INSERT INTO payment_events (id, type, payload) VALUES ($1, $2, $3::jsonb) ON CONFLICT (id) DO NOTHING', event['id'], event['type'], payload.decode())
+    payment_events.notify()
     return {'status': 'received'}
+
+# Telegram updates in webhook/sharded mode: check the secret, queue, acknowledge.
+# The handlers run after the 200 is sent, in this process or in a worker.
+@app.post('/telegram')
+async def telegram_webhook(request: Request):
+    if bot_application is None and bot_dispatcher is None:
+        raise HTTPException(status_code=404)
+    token = request.headers.get('x-telegram-bot-api-secret-token', '')
+    if not hmac.compare_digest(token, TELEGRAM_WEBHOOK_SECRET):
+        raise HTTPException(status_code=403)
+    data = await request.json()
+    if bot_dispatcher is not None:
+        # a full shard queue: Telegram retries the update later
+        if not bot_dispatcher.submit(data):
+            return Response(status_code=503)
+        return Response(status_code=200)
+    await bot_application.update_queue.put(Update.de_json(data, bot_application.bot))
+    return Response(status_code=200)
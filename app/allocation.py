@@ -0,0 +1,144 @@
+# app/allocation.py - best-fit kennel allocation and batch re-packing
+from availability import AvailabilityIndex
+
+SIZE_ORDER = ('small', 'medium', 'large')
+# heaviest pet (kg) each kennel size takes; heavier pets need the next size up
+PET_WEIGHT_LIMITS = {'small': 10, 'medium': 25}
+# a free gap shorter than this between two stays is unlikely to ever be booked
+MIN_USEFUL_GAP = 3
+
+def size_rank(size) -> int:
+    return SIZE_ORDER.index(size) if size in SIZE_ORDER else len(SIZE_ORDER)
+
+def pet_size(weight_kg) -> str:
+    """Smallest kennel size for a pet; unknown weight fits anywhere."""
+    if weight_kg is None:
+        return SIZE_ORDER[0]
+    for size in SIZE_ORDER[:-1]:
+        if float(weight_kg) <= PET_WEIGHT_LIMITS[size]:
+            return size
+    return SIZE_ORDER[-1]
+
+def _gap_cost(days) -> int:
+    if days is None:
+        return 2  # open side: prefer packing against an existing stay
+    if days == 0:
+        return 0
+    return 10 if days < MIN_USEFUL_GAP else 1
+
+def fit_cost(index: AvailabilityIndex, kennel_id, start, end):
+    prev_end, next_start = index.neighbours(kennel_id, start, end)
+    before = (start - prev_end).days - 1 if prev_end is not None else None
+    after = (next_start - end).days - 1 if next_start is not None else None
+    return _gap_cost(before) + _gap_cost(after)
+
+def best_fit(index: AvailabilityIndex, kennels, start, end, min_size=None):
+    """The free kennel that fits best, or None.
+
+    `kennels` are dicts/records with id and size. The smallest size that
+    takes the pet wins; among those, the kennel where the stay leaves the
+    fewest unusable gaps (touching a neighbour beats a short gap, which is
+    worse than a long one). Ties go to the lowest id.
+    """
+    floor = size_rank(min_size) if min_size else 0
+    best, best_key = None, None
+    for k in kennels:
+        rank = size_rank(k['size'])
+        if rank < floor or not index.is_free(k['id'], start, end):
+            continue
+        key = (rank, fit_cost(index, k['id'], start, end), k['id'])
+        if best_key is None or key < best_key:
+            best, best_key = k, key
+    return best
+
+def short_gaps(index: AvailabilityIndex, kennel_ids) -> int:
+    """Number of free gaps shorter than MIN_USEFUL_GAP between stays."""
+    n = 0
+    for k in kennel_ids:
+        intervals = index.intervals(k)
+        for (_, prev_end), (next_start, _) in zip(intervals, intervals[1:]):
+            gap = (next_start - prev_end).days - 1
+            if 0 < gap < MIN_USEFUL_GAP:
+                n += 1
+    return n
+
+def repack(kennels, fixed, movable):
+    """Plan new kennels for `movable` stays around the `fixed` ones.
+
+    fixed: (kennel_id, start, end); movable: (booking_id, kennel_id, start, end, min_size).
+    Interval partitioning: stays are placed in start order (longer first on
+    ties), each into its best-fit kennel, which for equal-sized kennels is the
+    one whose last stay ended closest before it. A stay that fits nowhere keeps
+    its kennel if still free there, else it is reported unplaced.
+    Returns {'moves': [(booking_id, old, new)], 'unplaced': [booking_id],
+             'short_gaps_before': n, 'short_gaps_after': n}.
+    """
+    kennel_ids = [k['id'] for k in kennels]
+    before = AvailabilityIndex()
+    before.load(list(fixed) + [(m[1], m[2], m[3]) for m in movable])
+    index = AvailabilityIndex()
+    index.load(fixed)
+    moves, unplaced = [], []
+    for booking_id, old, start, end, min_size in sorted(movable, key=lambda m: (m[2], -(m[3] - m[2]).days, m[0])):
+        k = best_fit(index, kennels, start, end, min_size)
+        new = k['id'] if k else (old if index.is_free(old, start, end) else None)
+        if new is None:
+            unplaced.append(booking_id)
+            continue
+        index.add(new, start, end)
+        if new != old:
+            moves.append((booking_id, old, new))
+    return {'moves': moves, 'unplaced': unplaced,
+            'short_gaps_before': short_gaps(before, kennel_ids), 'short_gaps_after': short_gaps(index, kennel_ids)}
+
+
+# bookings not yet started and not paid can move; everything else stays put
+REPACK_QUERY = '''SELECT b.id, b.kennel_id, b.start_date, b.end_date, p.weight_kg,
+  (b.start_date > current_date AND NOT b.paid) AS movable
+FROM bookings b LEFT JOIN pets p ON p.id = b.pet_id
+WHERE b.kennel_id IS NOT NULL AND b.end_date >= current_date'''
+
+# other users' live holds: their dates are as good as booked
+REPACK_HOLDS_QUERY = '''SELECT kennel_id, start_date, end_date FROM booking_holds
+WHERE expires_at > now() AND end_date >= current_date'''
+
+async def repack_bookings(apply: bool = False):
+    """Plan (and with apply=True, commit) a re-pack of future unpaid bookings."""
+    from db import with_transaction  # keeps the planner importable without a driver
+    import refdata
+    kennels = await refdata.get_kennels()
+
+    async def tx(conn):
+        if apply:
+            # no new holds until the moves commit; hold_kennel then sees the moved bookings
+            await conn.execute('LOCK TABLE booking_holds IN SHARE ROW EXCLUSIVE MODE')
+        rows = await conn.fetch(REPACK_QUERY + (' FOR UPDATE OF b' if apply else ''))
+        holds = await conn.fetch(REPACK_HOLDS_QUERY)
+        fixed = [(r['kennel_id'], r['start_date'], r['end_date']) for r in rows if not r['movable']]
+        fixed += [(h['kennel_id'], h['start_date'], h['end_date']) for h in holds]
+        movable = [(r['id'], r['kennel_id'], r['start_date'], r['end_date'], pet_size(r['weight_kg'])) for r in rows if r['movable']]
+        plan = repack(kennels, fixed, movable)
+        plan['movable'] = len(movable)
+        if apply and plan['moves'] and not plan['unplaced']:
+            # swaps pass through overlapping states; the constraint is checked at commit
+            await conn.execute('SET CONSTRAINTS bookings_no_overlap DEFERRED')
+            await conn.execute('''UPDATE bookings b SET kennel_id = m.kennel_id
+                FROM unnest($1::int[], $2::int[]) AS m(id, kennel_id) WHERE b.id = m.id''',
+                [m[0] for m in plan['moves']], [m[2] for m in plan['moves']])
+            plan['applied'] = True
+        else:
+            plan['applied'] = False
+        return plan
+
+    return await with_transaction(tx, label='repack')
+
+def format_plan(plan, codes=None) -> str:
+    codes = codes or {}
+    lines = [f"{plan['movable']} movable bookings, {len(plan['moves'])} to move, {len(plan['unplaced'])} unplaced.",
+             f"Short gaps (< {MIN_USEFUL_GAP} days): {plan['short_gaps_before']} -> {plan['short_gaps_after']}."]
+    for booking_id, old, new in plan['moves'][:30]:
+        lines.append(f'#{booking_id}: {codes.get(old, old)} -> {codes.get(new, new)}')
+    if len(plan['moves']) > 30:
+        lines.append(f"... and {len(plan['moves']) - 30} more")
+    lines.append('Applied.' if plan['applied'] else 'Dry run; use apply to commit.' if not plan['unplaced'] else 'Not applied: some bookings would not fit.')
+    return '\n'.join(lines)
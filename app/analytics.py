@@ -0,0 +1,95 @@
+# app/analytics.py - per-day occupancy and revenue over a date range
+from datetime import timedelta
+
+GRANULARITIES = ('day', 'week', 'month')
+
+def period_start(d, granularity: str):
+    if granularity == 'day':
+        return d
+    if granularity == 'week':
+        return d - timedelta(days=d.weekday())
+    if granularity == 'month':
+        return d.replace(day=1)
+    raise ValueError(f'Unknown granularity {granularity!r}, use one of: {", ".join(GRANULARITIES)}')
+
+def daily_totals(bookings, groups, start, end):
+    """One sweep over the booking intervals -> {group: (occupied[], revenue[])} per day of [start, end].
+
+    `bookings` are (kennel_id, start_date, end_date, price) with closed date
+    ranges; `groups` maps kennel_id to its group (size, or the id itself).
+    A stay's price is spread evenly over its days, so a range that clips a
+    stay gets that share of its revenue. Each stay adds two entries to
+    difference arrays and a single prefix-sum pass yields every day, so the
+    cost is O(bookings + days x groups) however long the stays are.
+    """
+    n = (end - start).days + 1
+    occ, rev = {}, {}
+    for kennel_id, s, e, price in bookings:
+        g = groups.get(kennel_id)
+        if g is None:
+            continue
+        lo, hi = max(s, start), min(e, end)
+        if lo > hi:
+            continue
+        if g not in occ:
+            occ[g], rev[g] = [0] * (n + 1), [0.0] * (n + 1)
+        i, j = (lo - start).days, (hi - start).days + 1
+        occ[g][i] += 1
+        occ[g][j] -= 1
+        rate = float(price or 0) / ((e - s).days + 1)
+        rev[g][i] += rate
+        rev[g][j] -= rate
+    out = {}
+    for g in occ:
+        o = r = 0
+        occupied, revenue = [], []
+        for k in range(n):
+            o += occ[g][k]
+            r += rev[g][k]
+            occupied.append(o)
+            revenue.append(r)
+        out[g] = (occupied, revenue)
+    return out
+
+def occupancy_series(bookings, groups, capacity, start, end, granularity: str = 'day'):
+    """Occupancy/revenue time series per group and in total.
+
+    `capacity` maps group -> number of kennels. Every group in `capacity`
+    gets a series, zero-filled where nothing is booked. Returns
+    {group: [{'period', 'days', 'occupied_days', 'capacity_days', 'occupancy', 'revenue'}]}
+    with the overall figures under the key 'total'.
+    """
+    if end < start:
+        raise ValueError('end is before start')
+    period_start(start, granularity)  # validates granularity
+    daily = daily_totals(bookings, groups, start, end)
+    n = (end - start).days + 1
+    zeros = ([0] * n, [0.0] * n)
+    days = [start + timedelta(days=k) for k in range(n)]
+    keys = [period_start(d, granularity) for d in days]
+
+    def series(occupied, revenue, cap):
+        buckets = {}
+        for k, key in enumerate(keys):
+            b = buckets.get(key)
+            if b is None:
+                b = buckets[key] = {'period': key.isoformat(), 'days': 0, 'occupied_days': 0, 'capacity_days': 0, 'revenue': 0.0}
+            b['days'] += 1
+            b['occupied_days'] += occupied[k]
+            b['capacity_days'] += cap
+            b['revenue'] += revenue[k]
+        for b in buckets.values():
+            b['occupancy'] = round(b['occupied_days'] / b['capacity_days'], 4) if b['capacity_days'] else 0.0
+            b['revenue'] = round(b['revenue'], 2)
+        return list(buckets.values())
+
+    result = {}
+    total_occ, total_rev = [0] * n, [0.0] * n
+    for g in sorted(set(capacity) | set(daily), key=str):
+        occupied, revenue = daily.get(g, zeros)
+        result[g] = series(occupied, revenue, capacity.get(g, 0))
+        for k in range(n):
+            total_occ[k] += occupied[k]
+            total_rev[k] += revenue[k]
+    result['total'] = series(total_occ, total_rev, sum(capacity.values()))
+    return result
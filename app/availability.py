@@ -0,0 +1,163 @@
+# app/availability.py - in-process kennel availability index
+from bisect import bisect_left, bisect_right
+import time
+from datetime import date, timedelta
+
+# Booked intervals are kept per kennel as a list sorted by start date, with a
+# running maximum of end dates so an overlap test is a single bisect.
+# Intervals are closed [start, end], same as the SQL overlap predicate.
+
+class AvailabilityIndex:
+    def __init__(self):
+        self._starts = {}
+        self._ends = {}
+        self._max_ends = {}
+        self.versions = {}
+
+    def load(self, rows):
+        """Replace the index content with (kennel_id, start_date, end_date) rows."""
+        self._starts.clear()
+        self._ends.clear()
+        self._max_ends.clear()
+        for r in sorted(rows, key=lambda r: (r[0], r[1])):
+            kennel_id, start, end = r[0], r[1], r[2]
+            if kennel_id is None:
+                continue
+            self._starts.setdefault(kennel_id, []).append(start)
+            self._ends.setdefault(kennel_id, []).append(end)
+        for kennel_id, ends in self._ends.items():
+            self._max_ends[kennel_id] = _running_max(ends)
+        for kennel_id in set(self.versions) | set(self._starts):
+            self.versions[kennel_id] = self.versions.get(kennel_id, 0) + 1
+
+    def add(self, kennel_id, start, end):
+        starts = self._starts.setdefault(kennel_id, [])
+        ends = self._ends.setdefault(kennel_id, [])
+        max_ends = self._max_ends.setdefault(kennel_id, [])
+        i = bisect_right(starts, start)
+        starts.insert(i, start)
+        ends.insert(i, end)
+        prev = max_ends[i - 1] if i > 0 else None
+        max_ends[i:] = _running_max(ends[i:], prev)
+        self.versions[kennel_id] = self.versions.get(kennel_id, 0) + 1
+
+    def neighbours(self, kennel_id, start, end):
+        """(end of the last stay before `start`, start of the first stay after `end`),
+        None where there is none; meant for a range that is free."""
+        starts = self._starts.get(kennel_id)
+        if not starts:
+            return None, None
+        i = bisect_left(starts, start)
+        j = bisect_right(starts, end)
+        return (self._max_ends[kennel_id][i - 1] if i else None), (starts[j] if j < len(starts) else None)
+
+    def contains(self, kennel_id, start, end) -> bool:
+        # stays of one kennel never overlap, so at most one can start on `start`
+        starts = self._starts.get(kennel_id, [])
+        i = bisect_right(starts, start) - 1
+        return i >= 0 and starts[i] == start and self._ends[kennel_id][i] == end
+
+    def version(self, kennel_id) -> int:
+        return self.versions.get(kennel_id, 0)
+
+    def is_free(self, kennel_id, start, end) -> bool:
+        starts = self._starts.get(kennel_id)
+        if not starts:
+            return True
+        # every interval starting on or before `end` is a candidate; the
+        # latest end among them decides whether any reaches `start`
+        i = bisect_right(starts, end)
+        if i == 0:
+            return True
+        return self._max_ends[kennel_id][i - 1] < start
+
+    def free_kennels(self, kennel_ids, start, end):
+        return [k for k in kennel_ids if self.is_free(k, start, end)]
+
+    def next_free_day(self, kennel_id, day, horizon: int = 365):
+        """First day >= `day` on which the kennel is free, or None within `horizon` days."""
+        starts = self._starts.get(kennel_id, [])
+        max_ends = self._max_ends.get(kennel_id, [])
+        limit = day + timedelta(days=horizon)
+        while day < limit:
+            i = bisect_right(starts, day)
+            if i == 0 or max_ends[i - 1] < day:
+                return day
+            # jump past the block of stays covering `day`
+            day = max_ends[i - 1] + timedelta(days=1)
+        return None
+
+    def month_bitmap(self, kennel_id, year: int, month: int) -> int:
+        """Bit (day - 1) is set for every booked day of the month."""
+        first = date(year, month, 1)
+        # not calendar.monthrange: app/calendar.py shadows the stdlib module
+        last = (first + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+        starts = self._starts.get(kennel_id, [])
+        ends = self._ends.get(kennel_id, [])
+        max_ends = self._max_ends.get(kennel_id, [])
+        bits = 0
+        j = bisect_right(starts, last) - 1
+        while j >= 0 and max_ends[j] >= first:
+            if ends[j] >= first:
+                lo = max(starts[j], first).day
+                hi = min(ends[j], last).day
+                bits |= ((1 << (hi - lo + 1)) - 1) << (lo - 1)
+            j -= 1
+        return bits
+
+    def intervals(self, kennel_id):
+        return list(zip(self._starts.get(kennel_id, []), self._ends.get(kennel_id, [])))
+
+
+class HoldIndex:
+    """Short-lived kennel holds (see holds.py); they block everyone but their owner
+    until they expire. Holds are few at any time, so a scan per kennel is enough."""
+
+    def __init__(self):
+        self._holds = {}  # kennel_id -> {hold_id: (start, end, expires_at, owner)}
+        self._kennel_of = {}
+
+    def load(self, rows):
+        """Replace the content with (hold_id, kennel_id, start, end, expires_at, owner) rows."""
+        self._holds.clear()
+        self._kennel_of.clear()
+        for r in rows:
+            self.add(*r)
+
+    def add(self, hold_id, kennel_id, start, end, expires_at: float, owner):
+        self.remove(hold_id)
+        self._holds.setdefault(kennel_id, {})[hold_id] = (start, end, expires_at, owner)
+        self._kennel_of[hold_id] = kennel_id
+
+    def remove(self, hold_id):
+        kennel_id = self._kennel_of.pop(hold_id, None)
+        if kennel_id is not None:
+            self._holds[kennel_id].pop(hold_id, None)
+
+    def is_free(self, kennel_id, start, end, owner=None, now: float = None) -> bool:
+        now = time.time() if now is None else now
+        for s, e, expires_at, held_by in self._holds.get(kennel_id, {}).values():
+            if expires_at > now and held_by != owner and s <= end and e >= start:
+                return False
+        return True
+
+    def purge(self, now: float = None):
+        now = time.time() if now is None else now
+        for holds in self._holds.values():
+            for hold_id in [h for h, v in holds.items() if v[2] <= now]:
+                holds.pop(hold_id)
+                self._kennel_of.pop(hold_id, None)
+
+
+def _running_max(values, prev=None):
+    out = []
+    for v in values:
+        prev = v if prev is None or v > prev else prev
+        out.append(prev)
+    return out
+
+
+# process-wide index, loaded at bot startup and kept current after each insert
+# and by the bookings_changed notifications of other processes
+kennel_index = AvailabilityIndex()
+hold_index = HoldIndex()
@@ -1,129 +1,236 @@
-# app/booking_steps.py - handlers for booking steps that use text input (quantity, freq, services)
-from telegram import Update
+# app/booking_steps.py - booking state machine and handlers for the steps that use text input
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
-from db import fetchrow, execute, with_transaction, fetch
-from datetime import datetime
-from utils import days_between
+import asyncpg
+from db import fetchval_named
+import os
+import time
+from utils import parse_yyyy_mm_dd
+from availability import kennel_index, hold_index
+from holds import sweep_expired_holds, place_hold
+import refdata
+from pricing import pricing_rules, quote, quote_many
+from allocation import best_fit, size_rank
+from payments import get_provider
 import logging
 logger = logging.getLogger(__name__)
 
+async def food_keyboard():
+    foods = await refdata.get_foods()
+    kb = [[InlineKeyboardButton(f"{f['name']} - ${f['unit_price']}", callback_data=f"selectfood:{f['id']}")] for f in foods]
+    return InlineKeyboardMarkup(kb)
+
+# The booking flow is a state machine: user_data['booking']['step'] names the
+# input expected next. Callback handlers in bot.py advance it for button steps;
+# typed input is routed by booking_text_dispatcher with one lookup in TEXT_STEPS.
+# Every step has its own timeout, after which the booking is dropped.
+BOOKING_STEP_TIMEOUTS = {
+    'kennel': 600,
+    'start_date': 900,
+    'end_date': 900,
+    'food': 600,
+    'food_quantity': 600,
+    'feeding_frequency': 600,
+    'services': 600,
+}
+BOOKING_SWEEP_INTERVAL = int(os.getenv('BOOKING_SWEEP_INTERVAL', 60))
+
+def set_step(booking, step: str):
+    booking['step'] = step
+    booking['expires_at'] = time.time() + BOOKING_STEP_TIMEOUTS[step]
+
+def booking_expired(booking, now: float = None) -> bool:
+    return booking.get('expires_at', 0) < (now or time.time())
+
+def current_booking(context):
+    """The user's in-progress booking, or None if there is none or it expired."""
+    booking = context.user_data.get('booking')
+    if booking is None or booking_expired(booking):
+        context.user_data.pop('booking', None)
+        return None
+    return booking
+
 async def book_start_date_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    # this handler is invoked for general text messages; ignore if not in booking flow
-    if 'booking' not in context.user_data or 'kennel_id' not in context.user_data['booking']:
-        return
-    # try to parse as date (legacy path) - but calendar should handle dates
-    d = None
-    try:
-        d = datetime.strptime(update.message.text.strip(), '%Y-%m-%d').date()
-    except:
+    # typed alternative to the calendar
+    d = parse_yyyy_mm_dd(update.message.text)
+    if d is None:
+        await update.message.reply_text('Pick a start date in the calendar or type it as YYYY-MM-DD.')
         return
-    context.user_data['booking']['start_date'] = d
+    booking = context.user_data['booking']
+    booking['start_date'] = d
+    set_step(booking, 'end_date')
     await update.message.reply_text('Enter end date (YYYY-MM-DD)')
 
 async def book_end_date_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if 'booking' not in context.user_data or 'start_date' not in context.user_data['booking']:
-        return
-    try:
-        d = datetime.strptime(update.message.text.strip(), '%Y-%m-%d').date()
-    except:
+    d = parse_yyyy_mm_dd(update.message.text)
+    if d is None:
+        await update.message.reply_text('Pick an end date in the calendar or type it as YYYY-MM-DD.')
         return
     booking = context.user_data['booking']
     booking['end_date'] = d
+    text, markup = await confirm_end_date(context, booking, update.effective_user.id)
+    await update.message.reply_text(text, reply_markup=markup)
+
+def suitable_kennels(kennels, booking):
+    floor = size_rank(booking.get('min_size'))
+    return [k for k in kennels if size_rank(k['size']) >= floor]
+
+def is_kennel_available(kennel_id: int, start_date, end_date, telegram_id: int = None) -> bool:
+    # other users' live holds count as taken; the user's own hold does not
+    return kennel_index.is_free(kennel_id, start_date, end_date) and hold_index.is_free(kennel_id, start_date, end_date, owner=telegram_id)
+
+async def stay_price_text(booking) -> str:
+    k = await refdata.get_kennel(booking['kennel_id'])
+    price = quote(pricing_rules, k['daily_price'], 0, booking['start_date'], booking['end_date'])
+    return f'Kennel {k["code"]}: ${price:.2f} for the stay (food and services extra).\n'
+
+async def confirm_end_date(context, booking, telegram_id: int):
+    """Finish the date steps, picked in the calendar or typed: allocate a kennel
+    for auto bookings, check it and hold it. Returns the (text, reply_markup) to show."""
     if booking['end_date'] < booking['start_date']:
-        await update.message.reply_text('End date must be after start date. Start again with /book.')
         context.user_data.pop('booking', None)
-        return
-    foods = await fetch('SELECT id, name, unit_price FROM foods')
-    kb = [[InlineKeyboardButton(f"{f['name']} - ${f['unit_price']}", callback_data=f"selectfood:{f['id']}")] for f in foods]
-    await update.message.reply_text('Choose food option:', reply_markup=InlineKeyboardMarkup(kb))
+        return 'End date must be after start date. Please start again with /book.', None
+    if booking.get('auto'):
+        candidates = [k for k in suitable_kennels(await refdata.get_kennels(), booking)
+                      if hold_index.is_free(k['id'], booking['start_date'], booking['end_date'], owner=telegram_id)]
+        k = best_fit(kennel_index, candidates, booking['start_date'], booking['end_date'], booking.get('min_size'))
+        if k is None:
+            context.user_data.pop('booking', None)
+            return 'No suitable kennel is free for these dates. Start /book again and choose other dates.', None
+        booking['kennel_id'] = k['id']
+    # check availability, then hold the kennel while the user finishes the booking
+    available = is_kennel_available(booking['kennel_id'], booking['start_date'], booking['end_date'], telegram_id)
+    if available:
+        booking['hold_id'] = await place_hold(booking['kennel_id'], booking['start_date'], booking['end_date'], telegram_id)
+        available = booking['hold_id'] is not None
+    if not available:
+        kennels = suitable_kennels(await refdata.get_kennels(), booking)
+        free_kennels = [k for k in kennels if is_kennel_available(k['id'], booking['start_date'], booking['end_date'], telegram_id)]
+        prices = quote_many(pricing_rules, [(k['id'], booking['start_date'], booking['end_date'], None, 0, None) for k in free_kennels], {k['id']: k['daily_price'] for k in free_kennels}, {})
+        kb = [[InlineKeyboardButton(f"{k['code']} ({k['size']}) - ${p:.2f} for the stay", callback_data=f"altkennel:{k['id']}")] for k, p in zip(free_kennels, prices)]
+        if not kb:
+            context.user_data.pop('booking', None)
+            return 'No kennel is available for these dates. Start /book again and choose other dates.', None
+        set_step(booking, 'kennel')
+        return 'Selected kennel is taken for these dates. These kennels are free:', InlineKeyboardMarkup(kb)
+    set_step(booking, 'food')
+    return await stay_price_text(booking) + 'Choose food option:', await food_keyboard()
 
 async def food_quantity_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if 'booking' not in context.user_data or 'food_id' not in context.user_data['booking']:
-        return
     try:
         q = int(update.message.text.strip())
     except:
         await update.message.reply_text('Please enter a valid integer for food quantity.')
         return
-    context.user_data['booking']['food_quantity'] = q
+    booking = context.user_data['booking']
+    booking['food_quantity'] = q
+    set_step(booking, 'feeding_frequency')
     await update.message.reply_text('Feeding frequency per day (e.g. 2):')
 
 async def feeding_freq_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if 'booking' not in context.user_data or 'food_quantity' not in context.user_data['booking']:
-        return
     try:
         f = int(update.message.text.strip())
     except:
         await update.message.reply_text('Please enter a valid integer for feeding frequency.')
         return
-    context.user_data['booking']['feeding_frequency_per_day'] = f
+    booking = context.user_data['booking']
+    booking['feeding_frequency_per_day'] = f
+    set_step(booking, 'services')
     await update.message.reply_text('Additional services? (comma separated: grooming, walking) or type none:')
 
 async def services_done_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if 'booking' not in context.user_data or 'feeding_frequency_per_day' not in context.user_data['booking']:
-        return
     services = update.message.text.strip()
     booking = context.user_data['booking']
     booking['services'] = services
 
-    # Save booking in transaction and compute price
-    async def tx(conn):
-        res = await conn.fetchrow('''SELECT COUNT(*) FROM bookings WHERE kennel_id=$1 AND ($2 <= end_date) AND ($3 >= start_date)''', booking['kennel_id'], booking['start_date'], booking['end_date'])
-        if res['count'] != 0:
-            raise RuntimeError('Selected kennel is no longer available')
-        k = await conn.fetchrow('SELECT daily_price FROM kennels WHERE id=$1', booking['kennel_id'])
-        f = await conn.fetchrow('SELECT unit_price FROM foods WHERE id=$1', booking['food_id'])
-        days = (booking['end_date'] - booking['start_date']).days + 1
-        kennel_total = float(k['daily_price']) * days
-        food_total = float(f['unit_price']) * booking['food_quantity']
-        svc_total = 0
-        if 'groom' in services.lower():
-            svc_total += 5
-        if 'walk' in services.lower():
-            svc_total += 2
-        est = kennel_total + food_total + svc_total
-        booking['estimated_price'] = est
-        rec = await conn.execute('''INSERT INTO bookings (pet_id, kennel_id, start_date, end_date, food_id, food_quantity, feeding_frequency_per_day, services, estimated_price) VALUES ($1,$2,$3,$4,$5,$6,$7,$8,$9)
-        ''', booking['pet_id'], booking['kennel_id'], booking['start_date'], booking['end_date'], booking['food_id'], booking['food_quantity'], booking['feeding_frequency_per_day'], booking['services'], booking['estimated_price'])
-        return est
-
+    # prices come from the reference cache; overlap is enforced by the
+    # bookings_no_overlap exclusion constraint, so the commit is one statement
     try:
-        est = await with_transaction(tx)
-    except Exception as e:
+        if booking.get('auto') and not kennel_index.is_free(booking['kennel_id'], booking['start_date'], booking['end_date']):
+            # the allocated kennel went meanwhile; take the next best one
+            uid = update.effective_user.id
+            kennels = [k for k in await refdata.get_kennels() if size_rank(k['size']) >= size_rank(booking.get('min_size'))
+                       and hold_index.is_free(k['id'], booking['start_date'], booking['end_date'], owner=uid)]
+            k = best_fit(kennel_index, kennels, booking['start_date'], booking['end_date'], booking.get('min_size'))
+            if k is not None:
+                booking['kennel_id'] = k['id']
+        k = await refdata.get_kennel(booking['kennel_id'])
+        f = await refdata.get_food(booking['food_id'])
+        est = quote(pricing_rules, k['daily_price'], f['unit_price'], booking['start_date'], booking['end_date'], booking['food_quantity'], services)
+        booking['estimated_price'] = est
+        booking['id'] = await fetchval_named('insert_booking', booking['pet_id'], booking['kennel_id'], booking['start_date'], booking['end_date'], booking['food_id'], booking['food_quantity'], booking['feeding_frequency_per_day'], booking['services'], booking['estimated_price'], booking.get('hold_id'))
+        # no id: our hold lapsed and another user holds the dates now
+        if booking['id'] is not None:
+            kennel_index.add(booking['kennel_id'], booking['start_date'], booking['end_date'])
+    except asyncpg.exceptions.ExclusionViolationError:
+        booking['id'] = None
+    except Exception:
+        logger.exception('services_done_handler')
+        await update.message.reply_text('Sorry, the booking could not be saved. Please try again with /book.')
+        context.user_data.pop('booking', None)
+        return
+    if booking['id'] is None:
         await update.message.reply_text('Sorry, booking failed because the kennel was taken. Please try different dates or kennel.')
         context.user_data.pop('booking', None)
         return
 
-    # If Stripe configured, create a checkout session
-    import stripe, os
-    STRIPE_API_KEY = os.getenv('STRIPE_API_KEY')
-    if STRIPE_API_KEY:
-        stripe.api_key = STRIPE_API_KEY
-        try:
-            session = stripe.checkout.Session.create(
-                payment_method_types=['card'],
-                line_items=[{
-                    'price_data':{
-                        'currency':'usd',
-                        'product_data':{'name':'Pet Hotel Booking'},
-                        'unit_amount': int(est*100)
-                    },
-                    'quantity':1
-                }],
-                mode='payment',
-                success_url=f"{os.getenv('APP_HOST','http://localhost')}:{os.getenv('APP_PORT','8080')}/payment_success?session_id={{CHECKOUT_SESSION_ID}}",
-                cancel_url=f"{os.getenv('APP_HOST','http://localhost')}:{os.getenv('APP_PORT','8080')}/payment_cancel",
-            )
-            await update.message.reply_text(f'Booking confirmed with estimated price ${est:.2f}. Pay here: {session.url}')
-            context.user_data.pop('booking', None)
-            return
-        except Exception:
-            logger.exception('Stripe session creation failed')
-            await update.message.reply_text(f'Booking confirmed (${est:.2f}) but payment link could not be created. Admin will contact you.')
-            context.user_data.pop('booking', None)
-            return
-    else:
+    # the payment link is created in the background and pushed when ready
+    provider = get_provider()
+    context.user_data.pop('booking', None)
+    if provider is None:
         await update.message.reply_text(f'Booking confirmed! Estimated price: ${est:.2f}. Payment not configured. Admin will contact you.')
-        context.user_data.pop('booking', None)
         return
+    await update.message.reply_text(f'Booking #{booking["id"]} saved with estimated price ${est:.2f}. Your payment link is on its way.')
+    context.application.create_task(send_payment_link(context.bot, update.effective_chat.id, booking['id'], est, provider))
+
+async def send_payment_link(bot, chat_id: int, booking_id: int, amount: float, provider):
+    try:
+        session = await provider.create_checkout(booking_id, amount)
+    except Exception:
+        logger.exception('Payment link creation failed for booking %s', booking_id)
+        await bot.send_message(chat_id, f'Booking #{booking_id} is confirmed (${amount:.2f}) but the payment link could not be created. Admin will contact you.')
+        return
+    await bot.send_message(chat_id, f'Pay for booking #{booking_id} here: {session["url"]}')
+    # the webhook consumer matches on the booking id, falling back to this reference
+    try:
+        await fetchval_named('set_payment_reference', booking_id, provider.name, session['id'])
+    except Exception:
+        logger.exception('Could not store payment reference for booking %s', booking_id)
+
+TEXT_STEPS = {
+    'start_date': book_start_date_handler,
+    'end_date': book_end_date_handler,
+    'food_quantity': food_quantity_handler,
+    'feeding_frequency': feeding_freq_handler,
+    'services': services_done_handler,
+}
 
+async def booking_text_dispatcher(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if 'booking' not in context.user_data:
+        return
+    booking = current_booking(context)
+    if booking is None:
+        await update.message.reply_text('Your booking session expired. Start again with /book.')
+        return
+    handler = TEXT_STEPS.get(booking.get('step'))
+    if handler is None:
+        await update.message.reply_text('Please use the buttons above to continue your booking, or /book to start over.')
+        return
+    await handler(update, context)
+
+async def sweep_expired_bookings(context: ContextTypes.DEFAULT_TYPE):
+    # frees abandoned bookings of users who never come back; their holds lapse
+    # on their own and are deleted here too
+    now = time.time()
+    expired = []
+    for user_id, user_data in context.application.user_data.items():
+        booking = user_data.get('booking')
+        if booking is not None and booking_expired(booking, now):
+            user_data.pop('booking', None)
+            expired.append(user_id)
+    # changed outside a handler for these users, so persistence would not see it
+    context.application.mark_data_for_update_persistence(user_ids=expired)
+    try:
+        await sweep_expired_holds()
+    except Exception:
+        logger.exception('sweep_expired_holds')
@@ -2,22 +2,34 @@
 import os
 import logging
 import asyncio
+import signal
 from dotenv import load_dotenv
 from datetime import date, datetime
 import tempfile
 import csv
+from functools import lru_cache
 
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, InputFile
 from telegram.ext import (
     ApplicationBuilder, CommandHandler, ContextTypes, ConversationHandler,
-    MessageHandler, filters, CallbackQueryHandler
+    MessageHandler, filters, CallbackQueryHandler, TypeHandler
 )
 
 import stripe
 
-from db import fetch, fetchrow, execute, get_pool, with_transaction
+from db import fetch, fetchval, execute, get_pool, with_transaction, fetchrow_named, fetch_named, fetchval_named, listen
 from utils import parse_yyyy_mm_dd, days_between, ranges_overlap
 from calendar import build_month_keyboard
+from availability import kennel_index
+import holds
+import broadcast
+from holds import place_hold
+import refdata
+from allocation import pet_size
+from bot_metrics import instrument_application
+import flood
+from metrics import start_metrics_server
+from persistence import PostgresPersistence
 
 load_dotenv()
 
@@ -26,6 +38,15 @@ MASTER_PASSWORD = os.getenv('MASTER_PASSWORD', 'supersecretmasterpass')
 STRIPE_API_KEY = os.getenv('STRIPE_API_KEY')
 APP_HOST = os.getenv('APP_HOST', 'http://localhost')
 APP_PORT = os.getenv('APP_PORT', '8080')
+# the bot serves its own /metrics when set; the admin app serves the web process's
+BOT_METRICS_PORT = os.getenv('BOT_METRICS_PORT')
+# polling: bot.py fetches updates; webhook: Telegram posts them to admin_web's /telegram;
+# sharded: admin_web (or dispatcher.py when polling) spreads them over worker processes
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+# updates handled at once; 1 keeps each user's updates strictly in order
+BOT_CONCURRENT_UPDATES = int(os.getenv('BOT_CONCURRENT_UPDATES', 1))
+# keep user/chat/conversation data in Postgres across restarts
+from bot_constants import BOT_PERSISTENCE
 
 if STRIPE_API_KEY:
     stripe.api_key = STRIPE_API_KEY
@@ -38,15 +59,17 @@ logger = logging.getLogger(__name__)
 
 # Booking calendar states stored in user_data['cal']
 
-admin_sessions = {}
+# kennels without a free day within this many days are hidden from the picker
+KENNEL_LOOKAHEAD_DAYS = int(os.getenv('KENNEL_LOOKAHEAD_DAYS', 60))
+CALENDAR_CACHE_SIZE = int(os.getenv('CALENDAR_CACHE_SIZE', 512))
+BOOKINGS_CHANNEL = 'bookings_changed'
 
 async def ensure_owner(telegram_id: int, name: str = None, phone: str = None, email: str = None):
     try:
-        row = await fetchrow('SELECT id FROM owners WHERE telegram_id=$1', telegram_id)
+        row = await fetchrow_named('owner_by_telegram_id', telegram_id)
         if row:
             return row['id']
-        res = await fetchrow('INSERT INTO owners (telegram_id, name, phone, email) VALUES ($1,$2,$3,$4) RETURNING id', telegram_id, name or 'Unknown', phone, email)
-        return res['id']
+        return await fetchval_named('insert_owner', telegram_id, name or 'Unknown', phone, email)
     except Exception as e:
         logger.exception('DB error in ensure_owner')
         raise
@@ -62,16 +85,28 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 # We'll re-import them dynamically to keep the example concise in the zip.
 from registration import *
 
+async def my_pets(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    try:
+        row = await fetchrow_named('owner_by_telegram_id', update.message.from_user.id)
+        pets = await fetch_named('pets_by_owner', row['id']) if row else []
+        if not pets:
+            await update.message.reply_text('No pets found. Use /register_pet.')
+            return
+        await update.message.reply_text('Your pets:\n' + '\n'.join(f"{p['name']} (ID:{p['id']})" for p in pets))
+    except Exception:
+        logger.exception('Error in my_pets')
+        await update.message.reply_text('Sorry, could not load your pets. Please try again later.')
+
 # Booking handlers (use inline calendar)
 async def book_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         user = update.message.from_user
-        row = await fetchrow('SELECT id FROM owners WHERE telegram_id=$1', user.id)
+        row = await fetchrow_named('owner_by_telegram_id', user.id)
         if not row:
             await update.message.reply_text('You need to register a pet first with /register_pet')
             return
         owner_id = row['id']
-        pets = await fetch('SELECT id, name FROM pets WHERE owner_id=$1', owner_id)
+        pets = await fetch_named('pets_by_owner', owner_id)
         if not pets:
             await update.message.reply_text('No pets found. Use /register_pet.')
             return
@@ -86,26 +121,95 @@ async def callback_select_pet(update: Update, context: ContextTypes.DEFAULT_TYPE
         query = update.callback_query
         await query.answer()
         _, pet_id = query.data.split(':')
-        context.user_data['booking'] = {'pet_id': int(pet_id)}
-        kennels = await fetch('SELECT id, code, size, daily_price FROM kennels WHERE is_active=true')
-        kb = [[InlineKeyboardButton(f"{k['code']} ({k['size']}) - ${k['daily_price']}/day", callback_data=f"selectkennel:{k['id']}")] for k in kennels]
-        await query.edit_message_text('Choose kennel (availability checked after you enter dates):', reply_markup=InlineKeyboardMarkup(kb))
+        booking = context.user_data['booking'] = {'pet_id': int(pet_id)}
+        booking['min_size'] = pet_size(await fetchval('SELECT weight_kg FROM pets WHERE id=$1', int(pet_id)))
+        set_step(booking, 'kennel')
+        kennels = suitable_kennels(await refdata.get_kennels(), booking)
+        today = datetime.utcnow().date()
+        kb = []
+        for k in kennels:
+            free_from = kennel_index.next_free_day(k['id'], today, KENNEL_LOOKAHEAD_DAYS)
+            if free_from is None:
+                continue
+            label = f"{k['code']} ({k['size']}) - ${k['daily_price']}/day"
+            if free_from != today:
+                label += f" - free from {free_from}"
+            kb.append([InlineKeyboardButton(label, callback_data=f"selectkennel:{k['id']}")])
+        if not kb:
+            await query.edit_message_text(f'All kennels are booked for the next {KENNEL_LOOKAHEAD_DAYS} days. Please try again later.')
+            context.user_data.pop('booking', None)
+            return
+        # dates first, then the best-fitting free kennel of the pet's size
+        kb.insert(0, [InlineKeyboardButton('Any suitable kennel (pick dates first)', callback_data='selectkennel:auto')])
+        await query.edit_message_text('Choose kennel:', reply_markup=InlineKeyboardMarkup(kb))
     except Exception:
         logger.exception('callback_select_pet')
         await query.edit_message_text('Error selecting pet. Try again.')
 
+async def calendar_kennels(booking):
+    """The kennel the calendar shows, or for an auto booking all suitable ones."""
+    if not booking.get('auto'):
+        return booking['kennel_id']
+    return tuple(k['id'] for k in suitable_kennels(await refdata.get_kennels(), booking))
+
+# rendered calendars are shared between users; the kennel's index version is
+# part of the key so a new booking invalidates that kennel's months
+@lru_cache(maxsize=CALENDAR_CACHE_SIZE)
+def _month_markup(kennel_id, year: int, month: int, prefix: str, version: int):
+    if isinstance(kennel_id, tuple):
+        # several kennels: a day is taken only when all of them are
+        taken = -1 if kennel_id else 0
+        for k in kennel_id:
+            taken &= kennel_index.month_bitmap(k, year, month)
+    else:
+        taken = kennel_index.month_bitmap(kennel_id, year, month) if kennel_id else 0
+    kb_struct = build_month_keyboard(year, month, prefix, taken)
+    return InlineKeyboardMarkup([[InlineKeyboardButton(cell['text'], callback_data=cell['callback_data']) for cell in row] for row in kb_struct])
+
+def month_markup(kennel_id, year: int, month: int, prefix: str):
+    # versions only grow, so their sum changes whenever any of the kennels does
+    version = sum(kennel_index.version(k) for k in kennel_id) if isinstance(kennel_id, tuple) else kennel_index.version(kennel_id)
+    return _month_markup(kennel_id, year, month, prefix, version)
+
 async def callback_select_kennel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     _, kennel_id = query.data.split(':')
-    context.user_data['booking']['kennel_id'] = int(kennel_id)
+    booking = current_booking(context)
+    if booking is None:
+        await query.edit_message_text('Booking expired. Start again with /book.')
+        return
+    if kennel_id == 'auto':
+        booking['auto'] = True
+        booking['kennel_id'] = None
+    else:
+        booking['kennel_id'] = int(kennel_id)
+    set_step(booking, 'start_date')
     # Launch calendar for start date
     today = datetime.utcnow().date()
-    kb_struct = build_month_keyboard(today.year, today.month, 'startcal')
-    keyboard = [[InlineKeyboardButton(cell['text'], callback_data=cell['callback_data']) for cell in row] for row in kb_struct]
-    await query.edit_message_text('Select START date:', reply_markup=InlineKeyboardMarkup(keyboard))
+    await query.edit_message_text('Select START date:', reply_markup=month_markup(await calendar_kennels(booking), today.year, today.month, 'startcal'))
+
+async def callback_noop(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.callback_query.answer()
 
 # Calendar callbacks
+async def calendar_month_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # registered with block=False: a burst of < / > taps on one calendar
+    # renders only the month of the last tap
+    query = update.callback_query
+    if not await flood.latest_navigation(query):
+        return
+    try:
+        prefix, _, month = query.data.split(':')
+        booking = current_booking(context)
+        if booking is None:
+            await query.edit_message_text('Booking expired. Start again with /book.')
+            return
+        y, m = map(int, month.split('-'))
+        await query.edit_message_text('Pick a date:', reply_markup=month_markup(await calendar_kennels(booking), y, m, prefix))
+    except Exception:
+        logger.exception('calendar_month_callback')
+
 async def calendar_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
@@ -114,56 +218,84 @@ async def calendar_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         parts = data.split(':')
         prefix = parts[0]
         action = parts[1]
-        if action == 'month':
-            y,m = map(int, parts[2].split('-'))
-            kb_struct = build_month_keyboard(y, m, prefix)
-            keyboard = [[InlineKeyboardButton(cell['text'], callback_data=cell['callback_data']) for cell in row] for row in kb_struct]
-            await query.edit_message_text('Pick a date:', reply_markup=InlineKeyboardMarkup(keyboard))
+        booking = current_booking(context)
+        if booking is None:
+            await query.edit_message_text('Booking expired. Start again with /book.')
             return
+        kennel_id = await calendar_kennels(booking)
         if action == 'day':
             sel_date = datetime.strptime(parts[2], '%Y-%m-%d').date()
             if prefix == 'startcal':
-                context.user_data['booking']['start_date'] = sel_date
+                booking['start_date'] = sel_date
+                set_step(booking, 'end_date')
                 # ask for end date with calendar starting at same month
-                kb_struct = build_month_keyboard(sel_date.year, sel_date.month, 'endcal')
-                keyboard = [[InlineKeyboardButton(cell['text'], callback_data=cell['callback_data']) for cell in row] for row in kb_struct]
-                await query.edit_message_text(f'Start date set to {sel_date}. Now select END date:', reply_markup=InlineKeyboardMarkup(keyboard))
+                await query.edit_message_text(f'Start date set to {sel_date}. Now select END date:', reply_markup=month_markup(kennel_id, sel_date.year, sel_date.month, 'endcal'))
                 return
             if prefix == 'endcal':
-                context.user_data['booking']['end_date'] = sel_date
-                booking = context.user_data['booking']
-                if booking['end_date'] < booking['start_date']:
-                    await query.edit_message_text('End date must be after start date. Please start again with /book.')
-                    context.user_data.pop('booking', None)
-                    return
-                # Check availability
-                available = await is_kennel_available(booking['kennel_id'], booking['start_date'], booking['end_date'])
-                if not available:
-                    await query.edit_message_text('Selected kennel is not available for these dates. Start /book again and choose other dates or kennel.')
-                    context.user_data.pop('booking', None)
-                    return
-                # Ask for food
-                foods = await fetch('SELECT id, name, unit_price FROM foods')
-                kb = [[InlineKeyboardButton(f"{f['name']} - ${f['unit_price']}", callback_data=f"selectfood:{f['id']}")] for f in foods]
-                await query.edit_message_text('Choose food option:', reply_markup=InlineKeyboardMarkup(kb))
+                booking['end_date'] = sel_date
+                text, markup = await confirm_end_date(context, booking, query.from_user.id)
+                await query.edit_message_text(text, reply_markup=markup)
                 return
     except Exception:
         logger.exception('calendar_callback')
         await query.edit_message_text('Calendar error. Try /book again.')
 
-async def is_kennel_available(kennel_id: int, start_date, end_date) -> bool:
+async def callback_alt_kennel(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    _, kennel_id = query.data.split(':')
+    booking = current_booking(context)
+    if booking is None or 'end_date' not in booking:
+        await query.edit_message_text('Booking expired. Start again with /book.')
+        return
+    hold_id = None
+    if is_kennel_available(int(kennel_id), booking['start_date'], booking['end_date'], query.from_user.id):
+        hold_id = await place_hold(int(kennel_id), booking['start_date'], booking['end_date'], query.from_user.id)
+    if hold_id is None:
+        await query.edit_message_text('This kennel was just taken. Start /book again.')
+        context.user_data.pop('booking', None)
+        return
+    booking['kennel_id'] = int(kennel_id)
+    booking['hold_id'] = hold_id
+    set_step(booking, 'food')
+    await query.edit_message_text(await stay_price_text(booking) + 'Choose food option:', reply_markup=await food_keyboard())
+
+async def load_availability_index():
+    rows = await fetch('SELECT kennel_id, start_date, end_date FROM bookings WHERE kennel_id IS NOT NULL')
+    kennel_index.load([(r['kennel_id'], r['start_date'], r['end_date']) for r in rows])
+    logger.info('Availability index loaded with %d bookings', len(rows))
+
+# bookings made by other processes (sharded workers, imports, admin edits):
+# inserts carry 'kennel_id,start,end', any other change an empty payload
+_index_reload = None
+
+def _on_bookings_changed(conn, pid, channel, payload):
+    global _index_reload
+    if payload:
+        kennel_id, start, end = payload.split(',')
+        kennel_id, start, end = int(kennel_id), date.fromisoformat(start), date.fromisoformat(end)
+        # our own inserts are already in the index
+        if not kennel_index.contains(kennel_id, start, end):
+            kennel_index.add(kennel_id, start, end)
+    elif _index_reload is None or _index_reload.done():
+        _index_reload = asyncio.create_task(load_availability_index())
+
+async def start_bookings_listener():
     try:
-        row = await fetchrow('''SELECT COUNT(*) FROM bookings WHERE kennel_id=$1 AND ($2 <= end_date) AND ($3 >= start_date)''', kennel_id, start_date, end_date)
-        return row['count'] == 0
+        await listen(BOOKINGS_CHANNEL, _on_bookings_changed)
     except Exception:
-        logger.exception('is_kennel_available')
-        return False
+        logger.exception('Could not LISTEN on %s; availability only reflects this process', BOOKINGS_CHANNEL)
 
 async def callback_select_food(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     _, food_id = query.data.split(':')
-    context.user_data['booking']['food_id'] = int(food_id)
+    booking = current_booking(context)
+    if booking is None:
+        await query.edit_message_text('Booking expired. Start again with /book.')
+        return
+    booking['food_id'] = int(food_id)
+    set_step(booking, 'food_quantity')
     await query.edit_message_text('Enter food quantity (number of units for stay):')
 
 # Other booking steps same as before; reuse handlers from registration module and previous implementation for quantity, feeding, services
@@ -172,9 +304,14 @@ from booking_steps import *
 # Admin/export/payment handlers reused
 from admin_handlers import *
 
-async def main():
-    await get_pool()
-    application = ApplicationBuilder().token(BOT_TOKEN).build()
+def build_application(polling: bool = True):
+    builder = ApplicationBuilder().token(BOT_TOKEN).concurrent_updates(BOT_CONCURRENT_UPDATES)
+    if BOT_PERSISTENCE:
+        builder = builder.persistence(PostgresPersistence())
+    if not polling:
+        # updates are pushed into application.update_queue by admin_web
+        builder = builder.updater(None)
+    application = builder.build()
 
     # registration conversation from registration.py
     from registration import conv as reg_conv
@@ -185,29 +322,73 @@ async def main():
     application.add_handler(CommandHandler('book', book_start))
     application.add_handler(CallbackQueryHandler(callback_select_pet, pattern='^selectpet:' ))
     application.add_handler(CallbackQueryHandler(callback_select_kennel, pattern='^selectkennel:' ))
-    application.add_handler(CallbackQueryHandler(calendar_callback, pattern='^(startcal|endcal):'))
+    application.add_handler(CallbackQueryHandler(calendar_month_callback, pattern='^(startcal|endcal):month:', block=False))
+    application.add_handler(CallbackQueryHandler(calendar_callback, pattern='^(startcal|endcal):day:'))
+    application.add_handler(CallbackQueryHandler(callback_alt_kennel, pattern='^altkennel:' ))
+    application.add_handler(CallbackQueryHandler(callback_noop, pattern='^noop$' ))
     application.add_handler(CallbackQueryHandler(callback_select_food, pattern='^selectfood:' ))
 
-    # text handlers reused
-    from booking_steps import book_start_date_handler, book_end_date_handler, food_quantity_handler, feeding_freq_handler, services_done_handler
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, book_start_date_handler), block=False)
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, book_end_date_handler), block=False)
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, food_quantity_handler), block=False)
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, feeding_freq_handler), block=False)
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, services_done_handler), block=False)
+    # typed booking input, routed on the user's current booking step
+    from booking_steps import booking_text_dispatcher, sweep_expired_bookings, BOOKING_SWEEP_INTERVAL
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, booking_text_dispatcher))
+    application.job_queue.run_repeating(sweep_expired_bookings, interval=BOOKING_SWEEP_INTERVAL, first=BOOKING_SWEEP_INTERVAL)
+
+    # daily reminders through the paced broadcaster; only one process sends each day's run
+    application.job_queue.run_daily(broadcast.send_checkin_reminders, time=broadcast.REMINDER_TIME, name='checkin_reminders')
+    application.job_queue.run_daily(broadcast.send_payment_nudges, time=broadcast.REMINDER_TIME, name='payment_nudges')
 
     # admin handlers
-    from admin_handlers import admin_cmd_handler, admin_stats_handler, list_clients_handler, export_bookings_handler
+    from admin_handlers import admin_cmd_handler, admin_stats_handler, list_clients_handler, list_clients_callback, export_bookings_handler, import_document_handler, repack_handler, broadcast_handler
     application.add_handler(CommandHandler('admin', admin_cmd_handler))
     application.add_handler(CommandHandler('admin_stats', admin_stats_handler))
     application.add_handler(CommandHandler('list_clients', list_clients_handler))
+    application.add_handler(CallbackQueryHandler(list_clients_callback, pattern='^clients:'))
     application.add_handler(CommandHandler('export_bookings', export_bookings_handler))
+    application.add_handler(CommandHandler('repack', repack_handler))
+    application.add_handler(CommandHandler('broadcast', broadcast_handler))
+    application.add_handler(MessageHandler(filters.Document.ALL & filters.CaptionRegex(r'^/import\b'), import_document_handler))
+
+    # per-user throttling and double-tap filtering ahead of every other group
+    application.add_handler(TypeHandler(Update, flood.flood_control), group=-2)
+
+    instrument_application(application)
+    return application
 
-    logger.info('Starting bot...')
+async def start_application(polling: bool = True):
+    """Warm the pool and caches, then build, initialize and start the bot."""
+    await get_pool()
+    await load_availability_index()
+    await start_bookings_listener()
+    await holds.start_listener()
+    await refdata.start_listener()
+    application = build_application(polling)
     await application.initialize()
     await application.start()
+    broadcast.start(application.bot)
+    return application
+
+async def stop_application(application):
+    await broadcast.stop()
+    if application.updater and application.updater.running:
+        await application.updater.stop()
+    await application.stop()
+    await application.shutdown()
+
+async def main():
+    # long polling; with BOT_MODE=webhook the bot runs inside admin_web instead
+    if BOT_METRICS_PORT:
+        await start_metrics_server('0.0.0.0', int(BOT_METRICS_PORT))
+    application = await start_application()
+    logger.info('Starting bot (polling)...')
     await application.updater.start_polling()
-    await application.idle()
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+    await stop_application(application)
 
 if __name__ == '__main__':
+    if BOT_MODE != 'polling':
+        raise SystemExit(f'BOT_MODE={BOT_MODE}: start admin_web or dispatcher.py instead of bot.py')
     asyncio.run(main())
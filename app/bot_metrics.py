@@ -0,0 +1,69 @@
+# app/bot_metrics.py - per-handler latency, throughput and error metrics for the bot
+import time
+import logging
+import functools
+from telegram import Update
+from telegram.ext import TypeHandler, ConversationHandler, ApplicationHandlerStop
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+UPDATES = registry.counter('bot_updates_total', 'Updates received by type', ('type',))
+HANDLER_SECONDS = registry.histogram('bot_handler_seconds', 'Handler callback latency', ('handler',))
+HANDLER_ERRORS = registry.counter('bot_handler_errors_total', 'Exceptions raised out of handler callbacks', ('handler',))
+IN_FLIGHT = registry.gauge('bot_handlers_in_flight', 'Handler callbacks currently running', ('handler',))
+
+def update_type(update: Update) -> str:
+    for kind in ('message', 'edited_message', 'callback_query', 'inline_query', 'my_chat_member'):
+        if getattr(update, kind, None) is not None:
+            return kind
+    return 'other'
+
+async def count_update(update: Update, context):
+    UPDATES.inc(update_type(update))
+
+def instrument(callback, name: str = None):
+    name = name or getattr(callback, '__name__', 'handler')
+
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        IN_FLIGHT.inc(name)
+        start = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except ApplicationHandlerStop:
+            raise
+        except Exception:
+            HANDLER_ERRORS.inc(name)
+            raise
+        finally:
+            HANDLER_SECONDS.observe(name, value=time.perf_counter() - start)
+            IN_FLIGHT.dec(name)
+    return wrapper
+
+async def log_error(update, context):
+    # counted by the instrument() wrapper; this only replaces PTB's "no error handler" warning
+    logger.error('Unhandled error while processing update', exc_info=context.error)
+
+def _walk(handler):
+    if isinstance(handler, ConversationHandler):
+        for h in handler.entry_points + handler.fallbacks:
+            yield from _walk(h)
+        for state_handlers in handler.states.values():
+            for h in state_handlers:
+                yield from _walk(h)
+    else:
+        yield handler
+
+def instrument_application(application):
+    """Wrap every registered callback (including conversation states) and count incoming updates.
+
+    Call after all handlers are added.
+    """
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            for h in _walk(handler):
+                h.callback = instrument(h.callback)
+    # ahead of flood control (group -2) so dropped updates are counted too
+    application.add_handler(TypeHandler(Update, count_update), group=-10)
+    application.add_error_handler(log_error)
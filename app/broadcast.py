@@ -0,0 +1,210 @@
+# app/broadcast.py - paced outbound messages: reminders, payment nudges, announcements
+#
+# Messages go through a bounded asyncio queue drained by a few senders. Each
+# send waits for its chat's token bucket and then the global one, so bursts
+# stay under Telegram's limits (about 30 msg/s overall, 1 msg/s per chat). A
+# 429 pauses the global bucket for retry_after and the message is retried.
+# Recipients are read in keyset pages of BROADCAST_BATCH rows, so no pool
+# connection or snapshot is held while the paced senders work through them;
+# the bounded queue keeps at most a page or two in memory.
+import os
+import time
+import asyncio
+import logging
+import random
+from datetime import date, timedelta, datetime, timezone
+from datetime import time as dtime
+from telegram.error import RetryAfter, Forbidden, BadRequest, NetworkError
+from db import fetch, fetchval
+from metrics import registry
+from ratelimit import TokenBucket, KeyedBuckets
+
+logger = logging.getLogger(__name__)
+
+BROADCAST_RATE = float(os.getenv('BROADCAST_RATE', 25))
+BROADCAST_CHAT_RATE = float(os.getenv('BROADCAST_CHAT_RATE', 1))
+BROADCAST_SENDERS = int(os.getenv('BROADCAST_SENDERS', 8))
+BROADCAST_QUEUE_SIZE = int(os.getenv('BROADCAST_QUEUE_SIZE', 1000))
+BROADCAST_MAX_ATTEMPTS = int(os.getenv('BROADCAST_MAX_ATTEMPTS', 5))
+# recipients fetched per query; the connection goes back to the pool in between
+BROADCAST_BATCH = int(os.getenv('BROADCAST_BATCH', 500))
+# UTC time of day for the daily reminder jobs
+REMINDER_TIME = dtime.fromisoformat(os.getenv('REMINDER_TIME', '09:00')).replace(tzinfo=timezone.utc)
+
+MESSAGES = registry.counter('broadcast_messages_total', 'Outbound broadcast messages by result', ('result',))
+
+class Broadcaster:
+    def __init__(self, bot, rate: float = BROADCAST_RATE, chat_rate: float = BROADCAST_CHAT_RATE,
+                 senders: int = BROADCAST_SENDERS, queue_size: int = BROADCAST_QUEUE_SIZE):
+        self.bot = bot
+        self.queue = asyncio.Queue(queue_size)
+        self.global_bucket = TokenBucket(rate)
+        self.chat_buckets = KeyedBuckets(chat_rate, capacity=max(1.0, chat_rate))
+        self._senders = senders
+        self._tasks = []
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self._sender()) for _ in range(self._senders)]
+
+    async def stop(self):
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, chat_id: int, text: str):
+        """Queue a message; waits while the queue is full."""
+        await self.queue.put((chat_id, text))
+
+    async def drain(self):
+        await self.queue.join()
+
+    async def _sender(self):
+        while True:
+            chat_id, text = await self.queue.get()
+            try:
+                MESSAGES.inc(await self._deliver(chat_id, text))
+            except Exception:
+                logger.exception('Broadcast to %s failed', chat_id)
+                MESSAGES.inc('failed')
+            finally:
+                self.queue.task_done()
+
+    async def _deliver(self, chat_id: int, text: str) -> str:
+        chat_bucket = self.chat_buckets.get(chat_id)
+        for attempt in range(BROADCAST_MAX_ATTEMPTS):
+            # a 429 on a chat we had not written to lately means the global limit was hit
+            chat_was_idle = chat_bucket.idle()
+            await chat_bucket.acquire()
+            await self.global_bucket.acquire()
+            try:
+                await self.bot.send_message(chat_id, text)
+                return 'sent'
+            except RetryAfter as e:
+                delay = e.retry_after.total_seconds() if isinstance(e.retry_after, timedelta) else float(e.retry_after)
+                MESSAGES.inc('rate_limited')
+                chat_bucket.pause(delay)
+                if chat_was_idle:
+                    logger.warning('Rate limited by Telegram, pausing broadcasts for %.1fs', delay)
+                    self.global_bucket.pause(delay)
+            except Forbidden:
+                return 'blocked'  # the user blocked the bot
+            except BadRequest as e:
+                logger.warning('Broadcast to %s rejected: %s', chat_id, e)
+                return 'rejected'
+            except NetworkError:
+                await asyncio.sleep(min(30, 2 ** attempt))
+        return 'failed'
+
+    def depth(self) -> int:
+        return self.queue.qsize()
+
+
+broadcaster = None  # started with the bot application
+
+def start(bot):
+    global broadcaster
+    broadcaster = Broadcaster(bot)
+    broadcaster.start()
+    return broadcaster
+
+async def stop():
+    if broadcaster is not None:
+        await broadcaster.stop()
+
+registry.gauge('broadcast_queue_depth', 'Messages waiting to be sent', callback=lambda: {(): broadcaster.depth() if broadcaster else 0})
+
+
+# keyset-paged: the last two parameters are the key to continue after and the page size
+CHECKIN_QUERY = '''SELECT b.id, o.telegram_id, p.name AS pet_name, k.code AS kennel_code, b.start_date
+FROM bookings b JOIN pets p ON p.id = b.pet_id JOIN owners o ON o.id = p.owner_id LEFT JOIN kennels k ON k.id = b.kennel_id
+WHERE b.start_date = $1 AND o.telegram_id IS NOT NULL AND b.id > $2 ORDER BY b.id LIMIT $3'''
+
+UNPAID_QUERY = '''SELECT o.telegram_id, b.id, b.start_date, b.estimated_price
+FROM bookings b JOIN pets p ON p.id = b.pet_id JOIN owners o ON o.id = p.owner_id
+WHERE NOT b.paid AND b.start_date > current_date AND o.telegram_id IS NOT NULL AND b.id > $1 ORDER BY b.id LIMIT $2'''
+
+OWNERS_QUERY = 'SELECT telegram_id FROM owners WHERE telegram_id > $1 ORDER BY telegram_id LIMIT $2'
+
+async def recipients(query: str, key: str, *args, batch: int = None):
+    """Rows of a keyset-paged query, one short fetch per page. Keys (booking
+    ids, Telegram user ids) are positive, so the first page starts after 0."""
+    batch = batch or BROADCAST_BATCH
+    after = 0
+    while True:
+        rows = await fetch(query, *args, after, batch)
+        for r in rows:
+            yield r
+        if len(rows) < batch:
+            return
+        after = rows[-1][key]
+
+async def claim_run(kind: str, run_on: date) -> bool:
+    """True for the one process that gets to send today's `kind` (sharded workers all schedule it)."""
+    return bool(await fetchval('INSERT INTO broadcast_runs (kind, run_on) VALUES ($1, $2) ON CONFLICT DO NOTHING RETURNING true', kind, run_on))
+
+async def send_checkin_reminders(context=None):
+    today = datetime.now(timezone.utc).date()
+    if broadcaster is None or not await claim_run('checkin', today):
+        return
+    n = 0
+    async for r in recipients(CHECKIN_QUERY, 'id', today + timedelta(days=1)):
+        await broadcaster.submit(r['telegram_id'], f"Reminder: {r['pet_name']} checks in tomorrow ({r['start_date']}){' in kennel ' + r['kennel_code'] if r['kennel_code'] else ''}. See you soon!")
+        n += 1
+    logger.info('Queued %d check-in reminders', n)
+
+async def send_payment_nudges(context=None):
+    today = datetime.now(timezone.utc).date()
+    if broadcaster is None or not await claim_run('unpaid', today):
+        return
+    n = 0
+    async for r in recipients(UNPAID_QUERY, 'id'):
+        await broadcaster.submit(r['telegram_id'], f"Booking #{r['id']} starting {r['start_date']} is not paid yet (${float(r['estimated_price'] or 0):.2f}).")
+        n += 1
+    logger.info('Queued %d payment nudges', n)
+
+async def announce(text: str) -> int:
+    n = 0
+    async for r in recipients(OWNERS_QUERY, 'telegram_id'):
+        await broadcaster.submit(r['telegram_id'], text)
+        n += 1
+    return n
+
+
+class FakeBot:
+    """send_message stand-in that enforces Telegram-like limits with 429s."""
+
+    def __init__(self, latency: float = 0.03, limit: float = 30, chat_limit: float = 1):
+        self.latency = latency
+        self.limit = TokenBucket(limit)
+        # Telegram tolerates short bursts per chat
+        self.chat_limits = KeyedBuckets(chat_limit, capacity=3 * chat_limit)
+        self.sent = 0
+        self.rejected = 0
+
+    async def send_message(self, chat_id, text):
+        await asyncio.sleep(self.latency * random.uniform(0.5, 1.5))
+        # a rejected send does not use up the allowance
+        if not self.chat_limits.get(chat_id).try_take() or not self.limit.try_take():
+            self.rejected += 1
+            raise RetryAfter(1)
+        self.sent += 1
+
+async def _benchmark(messages: int, chats: int, rate: float):
+    bot = FakeBot()
+    b = Broadcaster(bot, rate=rate)
+    b.start()
+    start = time.perf_counter()
+    for i in range(messages):
+        await b.submit(i % chats, 'hello')
+    await b.drain()
+    elapsed = time.perf_counter() - start
+    await b.stop()
+    print(f'{messages} messages to {chats} chats at BROADCAST_RATE={rate}: {elapsed:.1f}s, '
+          f'{bot.sent / elapsed:.1f} msg/s sustained, {bot.rejected} 429s')
+
+if __name__ == '__main__':
+    # python broadcast.py [messages] [chats] [rate]
+    import sys
+    args = sys.argv[1:]
+    asyncio.run(_benchmark(int(args[0]) if args else 600, int(args[1]) if len(args) > 1 else 500, float(args[2]) if len(args) > 2 else BROADCAST_RATE))
@@ -0,0 +1,216 @@
+# app/bulk_import.py - bulk owner/pet import (partner hotel onboarding)
+#
+# One row per pet, carrying its owner. Rows are validated in a single
+# streaming pass straight into COPY, so a file of any size is read once and
+# never held in memory; bad rows are collected as (line, message) and skipped.
+# Owners are then upserted on telegram_id and pets on microchip_id, set-wise,
+# in the same transaction.
+import csv
+import json
+from decimal import Decimal, InvalidOperation
+from utils import normalize_microchip
+
+IMPORT_COLUMNS = ['owner_telegram_id', 'owner_name', 'owner_phone', 'owner_email',
+                  'pet_name', 'species', 'breed', 'color', 'age', 'weight_kg', 'length_cm',
+                  'microchip_id', 'vaccination_notes', 'special_needs']
+REQUIRED = ('owner_telegram_id', 'owner_name', 'pet_name', 'species', 'microchip_id')
+IMPORT_FORMATS = ('csv', 'ndjson')
+# errors kept for the report; the rest are only counted
+MAX_REPORTED_ERRORS = 1000
+# column limits, checked per row so one bad value cannot fail the whole COPY
+BIGINT_MAX = 2**63 - 1
+INTEGER_MAX = 2**31 - 1
+NUMERIC_MAX_DIGITS = 131072  # before the decimal point
+NUMERIC_MAX_SCALE = 16383  # after it
+
+def read_rows(text, fmt: str):
+    """Yield (line_no, dict) from a text stream of CSV (with header) or NDJSON."""
+    if fmt == 'csv':
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield reader.line_num, row
+    elif fmt == 'ndjson':
+        for line_no, line in enumerate(text, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield line_no, ValueError(f'invalid JSON: {e}')
+                continue
+            yield line_no, row if isinstance(row, dict) else ValueError('expected a JSON object')
+    else:
+        raise ValueError(f'Unknown import format {fmt!r}, use one of: {", ".join(IMPORT_FORMATS)}')
+
+def _text(v):
+    if v is None:
+        return None
+    # text columns cannot hold NUL
+    v = str(v).replace('\x00', '').strip()
+    return v or None
+
+def _number(v, kind, name, limit=None):
+    v = _text(v)
+    if v is None:
+        return None
+    try:
+        n = kind(v)
+        # NaN/sNaN/Infinity parse as Decimal; comparing sNaN raises InvalidOperation
+        if isinstance(n, Decimal) and not n.is_finite():
+            raise InvalidOperation
+        negative = n < 0
+    except (ValueError, InvalidOperation):
+        raise ValueError(f'{name} is not a number: {v!r}')
+    if negative:
+        raise ValueError(f'{name} is negative')
+    if limit is not None and n > limit:
+        raise ValueError(f'{name} is out of range: {v!r}')
+    if isinstance(n, Decimal) and (n.adjusted() >= NUMERIC_MAX_DIGITS or n.as_tuple().exponent < -NUMERIC_MAX_SCALE):
+        raise ValueError(f'{name} is out of range: {v!r}')
+    return n
+
+def validate_row(row: dict) -> tuple:
+    """Normalise one input row into a tuple in IMPORT_COLUMNS order, or raise ValueError."""
+    values = {c: _text(row.get(c)) for c in IMPORT_COLUMNS}
+    missing = [c for c in REQUIRED if values[c] is None]
+    if missing:
+        raise ValueError('missing ' + ', '.join(missing))
+    try:
+        values['owner_telegram_id'] = int(values['owner_telegram_id'])
+    except ValueError:
+        raise ValueError(f'owner_telegram_id is not an integer: {values["owner_telegram_id"]!r}')
+    if not -BIGINT_MAX - 1 <= values['owner_telegram_id'] <= BIGINT_MAX:
+        raise ValueError(f'owner_telegram_id is out of range: {row.get("owner_telegram_id")!r}')
+    chip = normalize_microchip(values['microchip_id'])
+    if chip is None:
+        raise ValueError(f'microchip_id is a placeholder: {values["microchip_id"]!r}')
+    values['microchip_id'] = chip
+    values['age'] = _number(values['age'], int, 'age', limit=INTEGER_MAX)
+    values['weight_kg'] = _number(values['weight_kg'], Decimal, 'weight_kg')
+    values['length_cm'] = _number(values['length_cm'], Decimal, 'length_cm')
+    return tuple(values[c] for c in IMPORT_COLUMNS)
+
+class ImportReport:
+    def __init__(self):
+        self.rows = 0
+        self.error_count = 0
+        self.errors = []  # (line, message), first MAX_REPORTED_ERRORS only
+        self.owners_inserted = self.owners_updated = 0
+        self.pets_inserted = self.pets_updated = 0
+
+    def error(self, line: int, message: str):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+    def as_dict(self):
+        return {
+            'rows': self.rows, 'staged': self.rows - self.error_count, 'error_count': self.error_count,
+            'owners_inserted': self.owners_inserted, 'owners_updated': self.owners_updated,
+            'pets_inserted': self.pets_inserted, 'pets_updated': self.pets_updated,
+            'errors': [{'line': line, 'error': msg} for line, msg in self.errors],
+        }
+
+    def summary(self, max_errors: int = 20) -> str:
+        lines = [f'Imported {self.rows - self.error_count} of {self.rows} rows.',
+                 f'Owners: {self.owners_inserted} new, {self.owners_updated} updated.',
+                 f'Pets: {self.pets_inserted} new, {self.pets_updated} updated.']
+        if self.error_count:
+            lines.append(f'{self.error_count} rows skipped:')
+            lines += [f'line {line}: {msg}' for line, msg in self.errors[:max_errors]]
+            if self.error_count > max_errors:
+                lines.append(f'... and {self.error_count - max_errors} more')
+        return '\n'.join(lines)
+
+def validated_records(rows, report: ImportReport):
+    """Valid rows as (line, *IMPORT_COLUMNS) tuples; problems go to `report`.
+
+    A microchip seen earlier in the same file is an error, so every pet row
+    in the stage matches at most one input line.
+    """
+    seen_chips = set()
+    for line, row in rows:
+        report.rows += 1
+        if isinstance(row, Exception):
+            report.error(line, str(row))
+            continue
+        try:
+            record = validate_row(row)
+        except ValueError as e:
+            report.error(line, str(e))
+            continue
+        chip = record[IMPORT_COLUMNS.index('microchip_id')]
+        if chip in seen_chips:
+            report.error(line, f'duplicate microchip_id {chip!r} in file')
+            continue
+        seen_chips.add(chip)
+        yield (line,) + record
+
+
+STAGE_DDL = '''CREATE TEMP TABLE import_stage (
+  line INTEGER, owner_telegram_id BIGINT, owner_name TEXT, owner_phone TEXT, owner_email TEXT,
+  pet_name TEXT, species TEXT, breed TEXT, color TEXT, age INTEGER, weight_kg NUMERIC, length_cm NUMERIC,
+  microchip_id TEXT, vaccination_notes TEXT, special_needs TEXT
+) ON COMMIT DROP'''
+
+# latest line wins when an owner appears on several rows; contact details
+# missing from the file keep their current values
+UPSERT_OWNERS = '''INSERT INTO owners (telegram_id, name, phone, email)
+SELECT DISTINCT ON (owner_telegram_id) owner_telegram_id, owner_name, owner_phone, owner_email
+FROM import_stage ORDER BY owner_telegram_id, line DESC
+ON CONFLICT (telegram_id) DO UPDATE SET name = EXCLUDED.name,
+  phone = COALESCE(EXCLUDED.phone, owners.phone), email = COALESCE(EXCLUDED.email, owners.email)
+RETURNING (xmax = 0) AS inserted'''
+
+# a chip shared by pets of several owners (typed twice at registration) does
+# not identify one pet, so its rows are reported instead of moving pets
+AMBIGUOUS_CHIPS = '''DELETE FROM import_stage s
+WHERE (SELECT count(DISTINCT p.owner_id) FROM pets p WHERE p.microchip_id = s.microchip_id) > 1
+RETURNING line, microchip_id'''
+
+UPDATE_PETS = '''UPDATE pets p SET owner_id = o.id, name = s.pet_name, species = s.species,
+  breed = COALESCE(s.breed, p.breed), color = COALESCE(s.color, p.color), age = COALESCE(s.age, p.age),
+  weight_kg = COALESCE(s.weight_kg, p.weight_kg), length_cm = COALESCE(s.length_cm, p.length_cm),
+  vaccination_notes = COALESCE(s.vaccination_notes, p.vaccination_notes), special_needs = COALESCE(s.special_needs, p.special_needs)
+FROM import_stage s JOIN owners o ON o.telegram_id = s.owner_telegram_id
+WHERE p.microchip_id = s.microchip_id'''
+
+INSERT_PETS = '''INSERT INTO pets (owner_id, name, species, breed, color, age, weight_kg, length_cm, microchip_id, vaccination_notes, special_needs)
+SELECT o.id, s.pet_name, s.species, s.breed, s.color, s.age, s.weight_kg, s.length_cm, s.microchip_id, s.vaccination_notes, s.special_needs
+FROM import_stage s JOIN owners o ON o.telegram_id = s.owner_telegram_id
+WHERE NOT EXISTS (SELECT 1 FROM pets p WHERE p.microchip_id = s.microchip_id)'''
+
+def _count(status: str) -> int:
+    # asyncpg status strings end in the row count: 'UPDATE 12', 'INSERT 0 7'
+    return int(status.rsplit(' ', 1)[1])
+
+async def import_file(path: str, fmt: str) -> ImportReport:
+    """Validate, stage and upsert the rows of a CSV/NDJSON file."""
+    from db import with_transaction  # keeps the parsing helpers importable without a driver
+    report = ImportReport()
+
+    async def tx(conn):
+        # one import at a time, so two files cannot race on the same keys
+        await conn.execute("SELECT pg_advisory_xact_lock(hashtext('bulk_import'))")
+        await conn.execute(STAGE_DDL)
+        with open(path, newline='', encoding='utf-8-sig') as text:
+            await conn.copy_records_to_table('import_stage', records=validated_records(read_rows(text, fmt), report),
+                                             columns=['line'] + IMPORT_COLUMNS)
+        for r in sorted(await conn.fetch(AMBIGUOUS_CHIPS), key=lambda r: r['line']):
+            report.error(r['line'], f'microchip_id {r["microchip_id"]!r} matches pets of several owners')
+        owners = await conn.fetch(UPSERT_OWNERS)
+        report.owners_inserted = sum(1 for r in owners if r['inserted'])
+        report.owners_updated = len(owners) - report.owners_inserted
+        report.pets_updated = _count(await conn.execute(UPDATE_PETS))
+        report.pets_inserted = _count(await conn.execute(INSERT_PETS))
+
+    await with_transaction(tx, label='bulk_import')
+    return report
+
+def format_from_name(filename: str):
+    name = (filename or '').lower()
+    if name.endswith('.csv'):
+        return 'csv'
+    if name.endswith(('.ndjson', '.jsonl')):
+        return 'ndjson'
+    return None
@@ -2,9 +2,12 @@
 from datetime import date, datetime, timedelta
 import calendar
 
+TAKEN_MARK = '✖'
+
 # returns keyboard as list of lists for InlineKeyboardMarkup
+# `taken` is a bitmap of booked days (bit d-1 for day d); those cells are disabled
 
-def build_month_keyboard(year: int, month: int, prefix: str):
+def build_month_keyboard(year: int, month: int, prefix: str, taken: int = 0):
     cal = calendar.Calendar()
     month_days = cal.monthdayscalendar(year, month)
     kb = []
@@ -15,6 +18,8 @@ def build_month_keyboard(year: int, month: int, prefix: str):
         for d in week:
             if d == 0:
                 row.append({'text': ' ', 'callback_data': 'noop'})
+            elif taken >> (d - 1) & 1:
+                row.append({'text': TAKEN_MARK, 'callback_data': 'noop'})
             else:
                 ds = f"{year}-{month:02d}-{d:02d}"
                 row.append({'text': str(d), 'callback_data': f"{prefix}:day:{ds}"})
@@ -1,8 +1,13 @@
 # app/db.py
 import os
+import re
+import time
 import asyncio
+import logging
+from contextlib import asynccontextmanager
 import asyncpg
 from dotenv import load_dotenv
+from metrics import registry
 
 load_dotenv()
 
@@ -14,32 +19,174 @@ DB_CONFIG = {
     'port': int(os.getenv('POSTGRES_PORT', 5432)),
 }
 
+# create_pool opens min_size connections (running _init_connection on each)
+# before returning, so calling get_pool() at startup warms the pool
+POOL_MIN_SIZE = int(os.getenv('DB_POOL_MIN_SIZE', 1))
+POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', 10))
+
+# apply pending app/migrations before the pool prepares statements against them
+DB_AUTO_MIGRATE = os.getenv('DB_AUTO_MIGRATE', '1') == '1'
+
+# hot statements, prepared once per connection and called by name
+QUERIES = {
+    'owner_by_telegram_id': 'SELECT id FROM owners WHERE telegram_id=$1',
+    'insert_owner': 'INSERT INTO owners (telegram_id, name, phone, email) VALUES ($1,$2,$3,$4) RETURNING id',
+    'pets_by_owner': 'SELECT id, name FROM pets WHERE owner_id=$1',
+    'insert_pet': '''INSERT INTO pets (owner_id, name, species, breed, color, age, weight_kg, length_cm, microchip_id, vaccination_notes, special_needs, photo_file_id)
+           VALUES ($1,$2,$3,$4,$5,$6,$7,$8,$9,$10,$11,$12) RETURNING id''',
+    # converts the user's hold ($10, may be NULL) into the booking; NULL id when
+    # someone else holds the dates
+    'insert_booking': '''WITH released AS (DELETE FROM booking_holds WHERE id = $10::int)
+           INSERT INTO bookings (pet_id, kennel_id, start_date, end_date, food_id, food_quantity, feeding_frequency_per_day, services, estimated_price)
+           SELECT $1::int, $2::int, $3::date, $4::date, $5::int, $6::int, $7::int, $8::text, $9::numeric
+           WHERE NOT EXISTS (SELECT 1 FROM booking_holds h WHERE h.kennel_id = $2 AND h.id IS DISTINCT FROM $10::int
+               AND h.expires_at > now() AND daterange(h.start_date, h.end_date, '[]') && daterange($3::date, $4::date, '[]'))
+           RETURNING id''',
+    'set_payment_reference': 'UPDATE bookings SET payment_provider=$2, payment_reference=$3 WHERE id=$1 AND payment_reference IS NULL',
+}
+
+SLOW_QUERY_MS = float(os.getenv('DB_SLOW_QUERY_MS', 200))
+
+logger = logging.getLogger(__name__)
+
+_LABEL_RE = re.compile(r'\b(?:from|into|update|join)\s+([a-z_][a-z0-9_]*)', re.IGNORECASE)
+
 _pool: asyncpg.pool.Pool | None = None
+_listener_conn: asyncpg.Connection | None = None
+# backend pid -> {query name: PreparedStatement}
+_prepared = {}
+statement_stats = {'hits': 0, 'misses': 0}
+
+async def _init_connection(conn):
+    pid = conn.get_server_pid()
+    stmts = _prepared[pid] = {name: await conn.prepare(sql) for name, sql in QUERIES.items()}
+
+    # the pool closes idle connections; forget their statements (a later
+    # backend may get the same pid, so only drop our own entry)
+    def forget(_conn):
+        if _prepared.get(pid) is stmts:
+            del _prepared[pid]
+    conn.add_termination_listener(forget)
 
 async def get_pool():
     global _pool
     if _pool is None:
-        _pool = await asyncpg.create_pool(**DB_CONFIG, min_size=1, max_size=10)
+        if DB_AUTO_MIGRATE:
+            from migrate import migrate
+            conn = await asyncpg.connect(**DB_CONFIG)
+            try:
+                await migrate(conn)
+            finally:
+                await conn.close()
+        _pool = await asyncpg.create_pool(**DB_CONFIG, min_size=POOL_MIN_SIZE, max_size=POOL_MAX_SIZE, init=_init_connection)
     return _pool
 
-async def fetch(query: str, *args):
+async def _statement(conn, name: str):
+    stmts = _prepared.setdefault(conn.get_server_pid(), {})
+    stmt = stmts.get(name)
+    if stmt is None:
+        statement_stats['misses'] += 1
+        stmt = stmts[name] = await conn.prepare(QUERIES[name])
+    else:
+        statement_stats['hits'] += 1
+    return stmt
+
+def statement_cache_stats():
+    return dict(statement_stats, connections=len(_prepared), statements=len(QUERIES))
+
+def _pool_gauges():
+    if _pool is None:
+        return {}
+    return {('size',): _pool.get_size(), ('idle',): _pool.get_idle_size(), ('max',): _pool.get_max_size()}
+
+QUERY_SECONDS = registry.histogram('db_query_seconds', 'Database call latency by query label', ('query',))
+ACQUIRE_SECONDS = registry.histogram('db_pool_acquire_seconds', 'Time spent waiting for a pool connection')
+SLOW_QUERIES = registry.counter('db_slow_queries_total', 'Queries slower than DB_SLOW_QUERY_MS', ('query',))
+registry.gauge('db_pool_connections', 'Pool connections by state', ('state',), callback=_pool_gauges)
+registry.gauge('db_prepared_statement_lookups', 'Named statement lookups by result (cumulative)', ('result',),
+               callback=lambda: {('hit',): statement_stats['hits'], ('miss',): statement_stats['misses']})
+
+@asynccontextmanager
+async def acquire():
+    """pool.acquire() that records how long the caller waited for a connection."""
     pool = await get_pool()
+    start = time.perf_counter()
     async with pool.acquire() as conn:
-        return await conn.fetch(query, *args)
+        ACQUIRE_SECONDS.observe(value=time.perf_counter() - start)
+        yield conn
+
+def query_label(query: str) -> str:
+    """Low-cardinality label for raw SQL: verb plus first table, e.g. 'select:bookings'."""
+    m = _LABEL_RE.search(query)
+    verb = query.split(None, 1)[0].lower() if query.strip() else 'empty'
+    return f'{verb}:{m.group(1).lower()}' if m else verb
+
+def _observe(label: str, elapsed: float, query: str):
+    QUERY_SECONDS.observe(label, value=elapsed)
+    if elapsed * 1000 >= SLOW_QUERY_MS:
+        SLOW_QUERIES.inc(label)
+        logger.warning('Slow query %s took %.1f ms: %s', label, elapsed * 1000, ' '.join(query.split())[:300])
+
+async def _timed(label: str, query: str, op, *args):
+    start = time.perf_counter()
+    try:
+        return await op(*args)
+    finally:
+        _observe(label, time.perf_counter() - start, query)
+
+async def fetch_named(name: str, *args):
+    async with acquire() as conn:
+        return await _timed(name, QUERIES[name], (await _statement(conn, name)).fetch, *args)
+
+async def fetchrow_named(name: str, *args):
+    async with acquire() as conn:
+        return await _timed(name, QUERIES[name], (await _statement(conn, name)).fetchrow, *args)
+
+async def fetchval_named(name: str, *args):
+    async with acquire() as conn:
+        return await _timed(name, QUERIES[name], (await _statement(conn, name)).fetchval, *args)
+
+async def fetch(query: str, *args):
+    async with acquire() as conn:
+        return await _timed(query_label(query), query, conn.fetch, query, *args)
 
 async def fetchrow(query: str, *args):
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        return await conn.fetchrow(query, *args)
+    async with acquire() as conn:
+        return await _timed(query_label(query), query, conn.fetchrow, query, *args)
+
+async def fetchval(query: str, *args):
+    async with acquire() as conn:
+        return await _timed(query_label(query), query, conn.fetchval, query, *args)
 
 async def execute(query: str, *args):
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        return await conn.execute(query, *args)
+    async with acquire() as conn:
+        return await _timed(query_label(query), query, conn.execute, query, *args)
+
+# stream rows through a server-side cursor (needs its own transaction);
+# timed as a whole, including the time the consumer spends between rows
+async def iterate(query: str, *args, prefetch: int = 500):
+    async with acquire() as conn:
+        start = time.perf_counter()
+        try:
+            async with conn.transaction():
+                async for r in conn.cursor(query, *args, prefetch=prefetch):
+                    yield r
+        finally:
+            _observe('cursor:' + query_label(query), time.perf_counter() - start, query)
 
 # helper to run a transaction function
-async def with_transaction(func):
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        async with conn.transaction():
-            return await func(conn)
+async def with_transaction(func, label: str = 'transaction'):
+    async with acquire() as conn:
+        start = time.perf_counter()
+        try:
+            async with conn.transaction():
+                return await func(conn)
+        finally:
+            _observe(label, time.perf_counter() - start, label)
+
+# LISTEN needs a connection that stays out of the pool
+async def listen(channel: str, callback):
+    global _listener_conn
+    if _listener_conn is None or _listener_conn.is_closed():
+        _listener_conn = await asyncpg.connect(**DB_CONFIG)
+    await _listener_conn.add_listener(channel, callback)
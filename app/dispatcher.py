@@ -0,0 +1,138 @@
+# app/dispatcher.py - shard Telegram updates by user across bot worker processes
+#
+# One intake (admin_web's /telegram route with BOT_MODE=sharded, or
+# `python dispatcher.py` long-polling) hashes each update's user id onto one of
+# BOT_WORKERS processes. Every worker runs its own Application and DB pool and
+# handles its queue in order, so a user's updates are never processed
+# concurrently or out of order while different users scale across cores.
+import os
+import queue
+import signal
+import asyncio
+import logging
+import multiprocessing as mp
+from dotenv import load_dotenv
+from metrics import registry
+from sharding import HashRing, update_shard_key
+
+load_dotenv()
+
+BOT_TOKEN = os.getenv('BOT_TOKEN')
+BOT_WORKERS = int(os.getenv('BOT_WORKERS', os.cpu_count() or 1))
+# per-shard backlog; a full shard makes the intake push back (webhook 503, polling waits)
+SHARD_QUEUE_SIZE = int(os.getenv('SHARD_QUEUE_SIZE', 10000))
+# worker i serves its own metrics on BOT_METRICS_PORT + 1 + i
+BOT_METRICS_PORT = os.getenv('BOT_METRICS_PORT')
+
+logger = logging.getLogger(__name__)
+
+def worker_main(index: int, updates):
+    # the intake owns shutdown and stops workers with a sentinel
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_worker(index, updates))
+
+async def _worker(index: int, updates):
+    # imported here: the intake process never needs the handlers or a pool for them
+    import bot
+    from telegram import Update
+    from metrics import start_metrics_server
+    if BOT_METRICS_PORT:
+        await start_metrics_server('0.0.0.0', int(BOT_METRICS_PORT) + 1 + index)
+    application = await bot.start_application(polling=False)
+    logger.info('Bot worker %d started', index)
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            data = await loop.run_in_executor(None, updates.get)
+            if data is None:
+                break
+            await application.update_queue.put(Update.de_json(data, application.bot))
+    finally:
+        await bot.stop_application(application)
+
+
+class ShardedDispatcher:
+    def __init__(self, workers: int = BOT_WORKERS, queue_size: int = SHARD_QUEUE_SIZE):
+        self._ctx = mp.get_context('spawn')
+        self.ring = HashRing(range(workers))
+        self.queues = [self._ctx.Queue(queue_size) for _ in range(workers)]
+        self.processes = [None] * workers
+        self._rejected = registry.counter('bot_shard_rejected_total', 'Updates refused because the shard queue was full', ('shard',))
+        self._routed = registry.counter('bot_shard_updates_total', 'Updates routed to each shard', ('shard',))
+        registry.gauge('bot_shard_queue_depth', 'Updates waiting in each shard queue', ('shard',), callback=self.depths)
+
+    def _spawn(self, index: int):
+        p = self._ctx.Process(target=worker_main, args=(index, self.queues[index]), name=f'bot-worker-{index}', daemon=True)
+        p.start()
+        self.processes[index] = p
+
+    def start(self):
+        for i in range(len(self.queues)):
+            self._spawn(i)
+        logger.info('Started %d bot workers', len(self.queues))
+
+    def submit(self, data: dict) -> bool:
+        """Queue a raw update on its user's shard; False if that shard is full."""
+        shard = self.ring.shard_for(update_shard_key(data))
+        if not self.processes[shard].is_alive():
+            logger.error('Bot worker %d died (exit code %s), restarting', shard, self.processes[shard].exitcode)
+            self._spawn(shard)
+        try:
+            self.queues[shard].put_nowait(data)
+        except queue.Full:
+            self._rejected.inc(str(shard))
+            return False
+        self._routed.inc(str(shard))
+        return True
+
+    def depths(self):
+        return {(str(i),): q.qsize() for i, q in enumerate(self.queues)}
+
+    def stop(self, timeout: float = 30):
+        for q in self.queues:
+            q.put(None)
+        for p in self.processes:
+            if p is not None:
+                p.join(timeout)
+                if p.is_alive():
+                    p.terminate()
+
+
+async def poll(dispatcher: ShardedDispatcher, stop: asyncio.Event):
+    """Long-poll Telegram and feed the shards; an update is confirmed only once queued."""
+    from telegram import Bot, Update
+    async with Bot(BOT_TOKEN) as tg:
+        await tg.delete_webhook()
+        offset = None
+        while not stop.is_set():
+            try:
+                updates = await tg.get_updates(offset=offset, timeout=30, read_timeout=40, allowed_updates=Update.ALL_TYPES)
+            except Exception:
+                logger.exception('get_updates failed')
+                await asyncio.sleep(1)
+                continue
+            for u in updates:
+                data = u.to_dict()
+                while not dispatcher.submit(data):
+                    await asyncio.sleep(0.1)
+                offset = u.update_id + 1
+
+async def main():
+    from metrics import start_metrics_server
+    dispatcher = ShardedDispatcher()
+    dispatcher.start()
+    if BOT_METRICS_PORT:
+        await start_metrics_server('0.0.0.0', int(BOT_METRICS_PORT))
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    poller = asyncio.create_task(poll(dispatcher, stop))
+    await stop.wait()
+    poller.cancel()
+    await loop.run_in_executor(None, dispatcher.stop)
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
@@ -0,0 +1,66 @@
+# app/flood.py - per-user flood control and coalescing of repeated callback taps
+import os
+import asyncio
+from telegram import Update
+from telegram.ext import ApplicationHandlerStop
+from ratelimit import KeyedBuckets, DuplicateFilter, LatestOnly
+from metrics import registry
+
+# each user may send FLOOD_RATE callbacks/commands per second, bursting to FLOOD_BURST
+FLOOD_RATE = float(os.getenv('FLOOD_RATE', 2))
+FLOOD_BURST = float(os.getenv('FLOOD_BURST', 6))
+# a second tap with the same callback data on the same message within this window is dropped
+FLOOD_DUPLICATE_WINDOW = float(os.getenv('FLOOD_DUPLICATE_WINDOW', 1.5))
+# calendar < / > taps on one message are rendered only once they stop for this long
+CALENDAR_NAV_DEBOUNCE = float(os.getenv('CALENDAR_NAV_DEBOUNCE', 0.4))
+
+_buckets = KeyedBuckets(FLOOD_RATE, FLOOD_BURST)
+_duplicates = DuplicateFilter(FLOOD_DUPLICATE_WINDOW)
+_navigation = LatestOnly()
+
+THROTTLED = registry.counter('bot_throttled_updates_total', 'Updates dropped by flood control', ('reason', 'type'))
+COALESCED = registry.counter('bot_callbacks_coalesced_total', 'Calendar navigation taps superseded by a newer one')
+registry.gauge('bot_flood_tracked_users', 'Users with a flood control bucket', callback=lambda: {(): len(_buckets)})
+
+def _is_command(update: Update) -> bool:
+    msg = update.message
+    return msg is not None and bool(msg.text) and msg.text.startswith('/')
+
+async def flood_control(update: Update, context):
+    """Runs before every handler group; drops duplicate taps and over-limit users.
+
+    Only callbacks and commands are throttled: typed answers in the
+    registration and booking flows always go through.
+    """
+    query = update.callback_query
+    user = update.effective_user
+    if user is None or (query is None and not _is_command(update)):
+        return
+    kind = 'callback_query' if query is not None else 'command'
+    if query is not None and query.message is not None:
+        if _duplicates.seen((query.message.chat.id, query.message.message_id), query.data):
+            THROTTLED.inc('duplicate', kind)
+            await query.answer()
+            raise ApplicationHandlerStop
+    if not _buckets.get(user.id).try_take():
+        THROTTLED.inc('rate', kind)
+        if query is not None:
+            await query.answer('Too many taps, please slow down.')
+        raise ApplicationHandlerStop
+
+async def latest_navigation(query) -> bool:
+    """Answer a calendar navigation tap and wait CALENDAR_NAV_DEBOUNCE.
+
+    True when no newer tap arrived for the same message meanwhile, i.e. this
+    one should be rendered. The handler must run with block=False so the
+    newer taps are processed while this one waits.
+    """
+    key = (query.message.chat.id, query.message.message_id)
+    token = _navigation.mark(key)
+    await query.answer()
+    await asyncio.sleep(CALENDAR_NAV_DEBOUNCE)
+    if not _navigation.is_latest(key, token):
+        COALESCED.inc()
+        return False
+    _navigation.done(key, token)
+    return True
@@ -0,0 +1,61 @@
+# app/holds.py - kennel holds placed when a user picks their dates
+#
+# A hold keeps a kennel for one user for HOLD_TTL seconds while they answer the
+# food and services questions, so the final INSERT rarely fails on a kennel
+# someone else took meanwhile. Holds are advisory: the bookings exclusion
+# constraint still decides, and an expired hold simply stops blocking.
+import os
+import logging
+from datetime import date
+import asyncpg
+from db import fetch, execute, listen, with_transaction
+from availability import hold_index
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+HOLD_TTL = int(os.getenv('BOOKING_HOLD_TTL', 600))
+HOLDS_CHANNEL = 'holds_changed'
+
+HOLDS = registry.counter('booking_holds_total', 'Hold attempts by result', ('result',))
+
+async def hold_kennel(conn, kennel_id: int, start, end, telegram_id: int, ttl: float = None):
+    """The hold statements, run in the caller's transaction. None when booked;
+    raises ExclusionViolationError when another user's live hold overlaps."""
+    await conn.execute('DELETE FROM booking_holds WHERE telegram_id=$1 OR (kennel_id=$2 AND expires_at <= now())', telegram_id, kennel_id)
+    return await conn.fetchval('''INSERT INTO booking_holds (kennel_id, start_date, end_date, telegram_id, expires_at)
+        SELECT $1::int, $2::date, $3::date, $4::bigint, now() + make_interval(secs => $5::float8)
+        WHERE NOT EXISTS (SELECT 1 FROM bookings b WHERE b.kennel_id = $1
+            AND daterange(b.start_date, b.end_date, '[]') && daterange($2, $3, '[]'))
+        RETURNING id''', kennel_id, start, end, telegram_id, HOLD_TTL if ttl is None else ttl)
+
+async def place_hold(kennel_id: int, start, end, telegram_id: int):
+    """Hold the kennel for this user (dropping their previous hold); the hold id, or None if taken."""
+    try:
+        hold_id = await with_transaction(lambda conn: hold_kennel(conn, kennel_id, start, end, telegram_id), label='place_hold')
+    except asyncpg.exceptions.ExclusionViolationError:
+        hold_id = None
+    HOLDS.inc('placed' if hold_id else 'taken')
+    return hold_id
+
+async def sweep_expired_holds():
+    await execute('DELETE FROM booking_holds WHERE expires_at <= now()')
+    hold_index.purge()
+
+async def load_holds():
+    rows = await fetch('SELECT id, kennel_id, start_date, end_date, extract(epoch FROM expires_at)::float8 AS expires_at, telegram_id FROM booking_holds WHERE expires_at > now()')
+    hold_index.load([(r['id'], r['kennel_id'], r['start_date'], r['end_date'], r['expires_at'], r['telegram_id']) for r in rows])
+
+def _on_holds_changed(conn, pid, channel, payload):
+    if payload.startswith('-'):
+        hold_index.remove(int(payload[1:]))
+        return
+    hold_id, kennel_id, start, end, expires_at, telegram_id = payload[1:].split(',')
+    hold_index.add(int(hold_id), int(kennel_id), date.fromisoformat(start), date.fromisoformat(end), float(expires_at), int(telegram_id))
+
+async def start_listener():
+    await load_holds()
+    try:
+        await listen(HOLDS_CHANNEL, _on_holds_changed)
+    except Exception:
+        logger.exception('Could not LISTEN on %s; only the database enforces holds', HOLDS_CHANNEL)
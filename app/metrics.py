@@ -0,0 +1,135 @@
+# app/metrics.py - minimal in-process metrics with Prometheus text exposition
+import asyncio
+from bisect import bisect_left
+
+# seconds; covers sub-millisecond statements up to slow exports
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _fmt_labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + (extra or [])
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{n}="{_escape(v)}"' for n, v in pairs) + '}'
+
+def _escape(v):
+    return str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, doc, labels=()):
+        self.name, self.doc, self.labels = name, doc, tuple(labels)
+        self._values = {}
+
+    def inc(self, *label_values, amount=1):
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values):
+        return self._values.get(label_values, 0)
+
+    def samples(self):
+        for lv, v in sorted(self._values.items()):
+            yield self.name + _fmt_labels(self.labels, lv), v
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def __init__(self, name, doc, labels=(), callback=None):
+        super().__init__(name, doc, labels)
+        # callback() -> {label_values: value}, read at scrape time
+        self.callback = callback
+
+    def set(self, *label_values, value):
+        self._values[label_values] = value
+
+    def dec(self, *label_values, amount=1):
+        self.inc(*label_values, amount=-amount)
+
+    def samples(self):
+        if self.callback:
+            self._values = dict(self.callback())
+        return super().samples()
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, doc, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name, self.doc, self.labels = name, doc, tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label_values -> [bucket counts..., sum, count]
+
+    def observe(self, *label_values, value):
+        s = self._series.get(label_values)
+        if s is None:
+            s = self._series[label_values] = [0] * (len(self.buckets) + 2)
+        i = bisect_left(self.buckets, value)
+        if i < len(self.buckets):
+            s[i] += 1
+        s[-2] += value
+        s[-1] += 1
+
+    def count(self, *label_values):
+        s = self._series.get(label_values)
+        return s[-1] if s else 0
+
+    def samples(self):
+        for lv, s in sorted(self._series.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets, s):
+                cumulative += n
+                yield self.name + '_bucket' + _fmt_labels(self.labels, lv, [('le', bound)]), cumulative
+            yield self.name + '_bucket' + _fmt_labels(self.labels, lv, [('le', '+Inf')]), s[-1]
+            yield self.name + '_sum' + _fmt_labels(self.labels, lv), s[-2]
+            yield self.name + '_count' + _fmt_labels(self.labels, lv), s[-1]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def _register(self, metric):
+        # registering a name twice hands back the existing metric
+        return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, doc, labels=()):
+        return self._register(Counter(name, doc, labels))
+
+    def gauge(self, name, doc, labels=(), callback=None):
+        return self._register(Gauge(name, doc, labels, callback))
+
+    def histogram(self, name, doc, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, doc, labels, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for m in self._metrics.values():
+            lines.append(f'# HELP {m.name} {m.doc}')
+            lines.append(f'# TYPE {m.name} {m.kind}')
+            for sample, value in m.samples():
+                lines.append(f'{sample} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+registry = Registry()
+
+
+
+async def start_metrics_server(host: str, port: int, reg: Registry = registry):
+    """Serve `reg` as text on any GET, for processes without a web app (the bot)."""
+    async def handle(reader, writer):
+        try:
+            await reader.readuntil(b'\r\n\r\n')
+            body = reg.render().encode()
+            writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: ' + CONTENT_TYPE.encode() +
+                         b'\r\nContent-Length: ' + str(len(body)).encode() + b'\r\nConnection: close\r\n\r\n' + body)
+            await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+    return await asyncio.start_server(handle, host, port)
@@ -0,0 +1,77 @@
+# app/migrate.py - numbered SQL migrations from app/migrations
+#
+# Files are named NNN_description.sql and applied in order, each in its own
+# transaction, and recorded in schema_migrations. A session advisory lock lets
+# every process call migrate() at startup without racing the others.
+#
+#   python migrate.py          apply pending migrations
+#   python migrate.py --list   show applied/pending
+import os
+import re
+import sys
+import asyncio
+import logging
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+# arbitrary key shared by every process of this app
+MIGRATION_LOCK_ID = 7_310_020
+_NAME_RE = re.compile(r'^(\d+)_([\w-]+)\.sql$')
+
+logger = logging.getLogger(__name__)
+
+def discover(path: str = MIGRATIONS_DIR):
+    """[(version, name, file path)] sorted by version."""
+    found = {}
+    for filename in os.listdir(path):
+        m = _NAME_RE.match(filename)
+        if not m:
+            continue
+        version = int(m.group(1))
+        if version in found:
+            raise ValueError(f'Duplicate migration version {version}: {found[version][1]} and {filename}')
+        found[version] = (version, m.group(2), os.path.join(path, filename))
+    return [found[v] for v in sorted(found)]
+
+def pending(migrations, applied):
+    return [m for m in migrations if m[0] not in applied]
+
+async def _applied(conn):
+    await conn.execute('''CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INTEGER PRIMARY KEY, name TEXT NOT NULL, applied_at TIMESTAMP DEFAULT now())''')
+    return {r['version'] for r in await conn.fetch('SELECT version FROM schema_migrations')}
+
+async def migrate(conn, path: str = MIGRATIONS_DIR):
+    """Apply pending migrations on `conn`; returns the versions applied."""
+    done = []
+    await conn.execute('SELECT pg_advisory_lock($1)', MIGRATION_LOCK_ID)
+    try:
+        for version, name, file in pending(discover(path), await _applied(conn)):
+            with open(file, encoding='utf-8') as f:
+                sql = f.read()
+            async with conn.transaction():
+                await conn.execute(sql)
+                await conn.execute('INSERT INTO schema_migrations (version, name) VALUES ($1, $2)', version, name)
+            logger.info('Applied migration %03d_%s', version, name)
+            done.append(version)
+    finally:
+        await conn.execute('SELECT pg_advisory_unlock($1)', MIGRATION_LOCK_ID)
+    return done
+
+async def main(argv):
+    import asyncpg
+    from db import DB_CONFIG
+    conn = await asyncpg.connect(**DB_CONFIG)
+    try:
+        if '--list' in argv:
+            applied = await _applied(conn)
+            for version, name, _ in discover():
+                print(f'{version:03d}_{name}: {"applied" if version in applied else "pending"}')
+            return
+        done = await migrate(conn)
+        print(f'Applied {len(done)} migration(s)' + (f': {done}' if done else ''))
+    finally:
+        await conn.close()
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main(sys.argv[1:]))
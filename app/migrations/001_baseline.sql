@@ -0,0 +1,212 @@
+-- 001_baseline.sql - schema as of the first versioned migration (formerly init_db.sql)
+-- btree_gist lets the bookings exclusion constraint compare kennel_id with =
+CREATE EXTENSION IF NOT EXISTS btree_gist;
+
+CREATE TABLE IF NOT EXISTS owners (
+  id SERIAL PRIMARY KEY,
+  telegram_id BIGINT UNIQUE,
+  name TEXT NOT NULL,
+  phone TEXT,
+  email TEXT,
+  created_at TIMESTAMP DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS pets (
+  id SERIAL PRIMARY KEY,
+  owner_id INTEGER REFERENCES owners(id) ON DELETE CASCADE,
+  name TEXT NOT NULL,
+  species TEXT NOT NULL,
+  breed TEXT,
+  color TEXT,
+  age INTEGER,
+  weight_kg NUMERIC,
+  length_cm NUMERIC,
+  microchip_id TEXT,
+  vaccination_notes TEXT,
+  special_needs TEXT,
+  photo_file_id TEXT,
+  created_at TIMESTAMP DEFAULT now()
+);
+
+-- bulk imports (app/bulk_import.py) match pets on their microchip
+CREATE INDEX IF NOT EXISTS pets_microchip_id_idx ON pets (microchip_id);
+
+CREATE TABLE IF NOT EXISTS kennels (
+  id SERIAL PRIMARY KEY,
+  code TEXT UNIQUE NOT NULL,
+  size TEXT NOT NULL,
+  daily_price NUMERIC NOT NULL,
+  is_active BOOLEAN DEFAULT true
+);
+
+CREATE TABLE IF NOT EXISTS foods (
+  id SERIAL PRIMARY KEY,
+  name TEXT NOT NULL,
+  unit_price NUMERIC NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS bookings (
+  id SERIAL PRIMARY KEY,
+  pet_id INTEGER REFERENCES pets(id) ON DELETE CASCADE,
+  kennel_id INTEGER REFERENCES kennels(id),
+  start_date DATE NOT NULL,
+  end_date DATE NOT NULL,
+  food_id INTEGER REFERENCES foods(id),
+  food_quantity INTEGER DEFAULT 1,
+  feeding_frequency_per_day INTEGER DEFAULT 2,
+  services TEXT,
+  estimated_price NUMERIC,
+  paid BOOLEAN DEFAULT false,
+  payment_provider TEXT,
+  payment_reference TEXT,
+  created_at TIMESTAMP DEFAULT now(),
+  -- a kennel can hold one stay per day; closed ranges, like the app's overlap checks
+  CONSTRAINT bookings_no_overlap EXCLUDE USING gist (kennel_id WITH =, daterange(start_date, end_date, '[]') WITH &&)
+);
+
+-- python-telegram-bot persistence (app/persistence.py); data is pickled
+CREATE TABLE IF NOT EXISTS bot_persistence (
+  kind TEXT NOT NULL,
+  key TEXT NOT NULL,
+  data BYTEA NOT NULL,
+  updated_at TIMESTAMP DEFAULT now(),
+  PRIMARY KEY (kind, key)
+);
+
+-- keeps the availability index of every bot process current (app/bot.py)
+CREATE OR REPLACE FUNCTION notify_bookings_changed() RETURNS trigger AS $$
+BEGIN
+  IF TG_OP = 'INSERT' AND NEW.kennel_id IS NOT NULL THEN
+    PERFORM pg_notify('bookings_changed', NEW.kennel_id || ',' || NEW.start_date || ',' || NEW.end_date);
+  ELSIF TG_OP <> 'INSERT' THEN
+    PERFORM pg_notify('bookings_changed', '');
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS bookings_changed ON bookings;
+CREATE TRIGGER bookings_changed AFTER INSERT OR DELETE OR UPDATE OF kennel_id, start_date, end_date ON bookings
+  FOR EACH ROW EXECUTE FUNCTION notify_bookings_changed();
+
+-- raw Stripe webhook events, one row per event id (idempotent ingestion)
+CREATE TABLE IF NOT EXISTS payment_events (
+  id TEXT PRIMARY KEY,
+  type TEXT NOT NULL,
+  payload JSONB NOT NULL,
+  received_at TIMESTAMP DEFAULT now(),
+  processed_at TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS payment_events_pending_idx ON payment_events (received_at) WHERE processed_at IS NULL;
+
+-- reference data caches (app/refdata.py) are invalidated through NOTIFY
+CREATE OR REPLACE FUNCTION notify_refdata_changed() RETURNS trigger AS $$
+BEGIN
+  PERFORM pg_notify('refdata_changed', TG_TABLE_NAME);
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS kennels_refdata_changed ON kennels;
+CREATE TRIGGER kennels_refdata_changed AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON kennels
+  FOR EACH STATEMENT EXECUTE FUNCTION notify_refdata_changed();
+
+DROP TRIGGER IF EXISTS foods_refdata_changed ON foods;
+CREATE TRIGGER foods_refdata_changed AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON foods
+  FOR EACH STATEMENT EXECUTE FUNCTION notify_refdata_changed();
+
+-- admin stats summary rows, maintained by triggers (read by app/stats.py)
+CREATE TABLE IF NOT EXISTS stats_totals (
+  id BOOLEAN PRIMARY KEY DEFAULT true CHECK (id),
+  pets BIGINT NOT NULL DEFAULT 0,
+  bookings BIGINT NOT NULL DEFAULT 0,
+  revenue NUMERIC NOT NULL DEFAULT 0,
+  paid_bookings BIGINT NOT NULL DEFAULT 0,
+  paid_revenue NUMERIC NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS kennel_stats (
+  kennel_id INTEGER PRIMARY KEY REFERENCES kennels(id) ON DELETE CASCADE,
+  bookings BIGINT NOT NULL DEFAULT 0,
+  booked_days BIGINT NOT NULL DEFAULT 0,
+  revenue NUMERIC NOT NULL DEFAULT 0
+);
+
+CREATE OR REPLACE FUNCTION apply_booking_stats(delta INTEGER, b bookings) RETURNS void AS $$
+  UPDATE stats_totals SET
+    bookings = bookings + delta,
+    revenue = revenue + delta * COALESCE(b.estimated_price, 0),
+    paid_bookings = paid_bookings + CASE WHEN b.paid THEN delta ELSE 0 END,
+    paid_revenue = paid_revenue + CASE WHEN b.paid THEN delta * COALESCE(b.estimated_price, 0) ELSE 0 END;
+  INSERT INTO kennel_stats (kennel_id, bookings, booked_days, revenue)
+  SELECT b.kennel_id, delta, delta * (b.end_date - b.start_date + 1), delta * COALESCE(b.estimated_price, 0)
+  WHERE b.kennel_id IS NOT NULL
+  ON CONFLICT (kennel_id) DO UPDATE SET
+    bookings = kennel_stats.bookings + EXCLUDED.bookings,
+    booked_days = kennel_stats.booked_days + EXCLUDED.booked_days,
+    revenue = kennel_stats.revenue + EXCLUDED.revenue;
+$$ LANGUAGE sql;
+
+CREATE OR REPLACE FUNCTION bookings_stats_changed() RETURNS trigger AS $$
+BEGIN
+  IF TG_OP IN ('UPDATE', 'DELETE') THEN
+    PERFORM apply_booking_stats(-1, OLD);
+  END IF;
+  IF TG_OP IN ('INSERT', 'UPDATE') THEN
+    PERFORM apply_booking_stats(1, NEW);
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS bookings_stats ON bookings;
+CREATE TRIGGER bookings_stats AFTER INSERT OR DELETE OR UPDATE OF kennel_id, start_date, end_date, estimated_price, paid ON bookings
+  FOR EACH ROW EXECUTE FUNCTION bookings_stats_changed();
+
+-- statement level so bulk pet inserts touch the summary row once
+CREATE OR REPLACE FUNCTION pets_stats_changed() RETURNS trigger AS $$
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    UPDATE stats_totals SET pets = pets + (SELECT count(*) FROM new_rows);
+  ELSE
+    UPDATE stats_totals SET pets = pets - (SELECT count(*) FROM old_rows);
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS pets_stats_insert ON pets;
+CREATE TRIGGER pets_stats_insert AFTER INSERT ON pets REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION pets_stats_changed();
+DROP TRIGGER IF EXISTS pets_stats_delete ON pets;
+CREATE TRIGGER pets_stats_delete AFTER DELETE ON pets REFERENCING OLD TABLE AS old_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION pets_stats_changed();
+
+-- backfill the summary from existing rows
+INSERT INTO stats_totals (id, pets, bookings, revenue, paid_bookings, paid_revenue)
+SELECT true,
+  (SELECT count(*) FROM pets),
+  count(*),
+  COALESCE(sum(estimated_price), 0),
+  count(*) FILTER (WHERE paid),
+  COALESCE(sum(estimated_price) FILTER (WHERE paid), 0)
+FROM bookings
+ON CONFLICT (id) DO NOTHING;
+
+INSERT INTO kennel_stats (kennel_id, bookings, booked_days, revenue)
+SELECT kennel_id, count(*), sum(end_date - start_date + 1), COALESCE(sum(estimated_price), 0)
+FROM bookings WHERE kennel_id IS NOT NULL GROUP BY kennel_id
+ON CONFLICT (kennel_id) DO NOTHING;
+
+-- seed kennels and foods
+INSERT INTO kennels (code, size, daily_price) VALUES
+('K1-S', 'small', 3),
+('K2-M', 'medium', 5),
+('K3-L', 'large', 8)
+ON CONFLICT DO NOTHING;
+
+-- foods.name is not unique, so only seed an empty table (databases created
+-- from init_db.sql already have these rows)
+INSERT INTO foods (name, unit_price)
+SELECT * FROM (VALUES ('Basic Kibble', 1), ('Premium Kibble', 3), ('Wet Food Can', 2)) AS seed(name, unit_price)
+WHERE NOT EXISTS (SELECT 1 FROM foods);
@@ -0,0 +1,12 @@
+-- 002_hot_path_indexes.sql - indexes for the bot's and exports' access paths
+-- book_start / my_pets: pets_by_owner
+CREATE INDEX IF NOT EXISTS pets_owner_id_idx ON pets (owner_id);
+-- kennel + date range lookups (availability checks, stats, kennel-filtered exports);
+-- the exclusion constraint's GiST index only serves the daterange expression
+CREATE INDEX IF NOT EXISTS bookings_kennel_dates_idx ON bookings (kennel_id, start_date, end_date);
+-- newest-first ordering of the full exports
+CREATE INDEX IF NOT EXISTS bookings_created_at_idx ON bookings (created_at);
+-- payment webhooks matched by provider reference
+CREATE INDEX IF NOT EXISTS bookings_payment_reference_idx ON bookings (payment_reference) WHERE payment_reference IS NOT NULL;
+-- export joins and ON DELETE CASCADE from pets
+CREATE INDEX IF NOT EXISTS bookings_pet_id_idx ON bookings (pet_id);
@@ -0,0 +1,7 @@
+-- 003_deferrable_no_overlap.sql - let a batch re-pack swap kennels inside one transaction
+-- (allocation.repack_bookings defers the check to commit; everything else still
+-- gets it immediately)
+ALTER TABLE bookings DROP CONSTRAINT IF EXISTS bookings_no_overlap;
+ALTER TABLE bookings ADD CONSTRAINT bookings_no_overlap
+  EXCLUDE USING gist (kennel_id WITH =, daterange(start_date, end_date, '[]') WITH &&)
+  DEFERRABLE INITIALLY IMMEDIATE;
@@ -0,0 +1,30 @@
+-- 004_booking_holds.sql - short-lived kennel holds between picking dates and committing
+CREATE TABLE IF NOT EXISTS booking_holds (
+  id SERIAL PRIMARY KEY,
+  kennel_id INTEGER NOT NULL REFERENCES kennels(id),
+  start_date DATE NOT NULL,
+  end_date DATE NOT NULL,
+  telegram_id BIGINT NOT NULL,
+  expires_at TIMESTAMPTZ NOT NULL,
+  -- holds never overlap each other; expired ones are deleted before a new hold is placed
+  CONSTRAINT booking_holds_no_overlap EXCLUDE USING gist (kennel_id WITH =, daterange(start_date, end_date, '[]') WITH &&)
+);
+CREATE INDEX IF NOT EXISTS booking_holds_telegram_id_idx ON booking_holds (telegram_id);
+CREATE INDEX IF NOT EXISTS booking_holds_expires_at_idx ON booking_holds (expires_at);
+
+-- keeps every bot process's HoldIndex current (app/holds.py)
+CREATE OR REPLACE FUNCTION notify_holds_changed() RETURNS trigger AS $$
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    PERFORM pg_notify('holds_changed', '+' || NEW.id || ',' || NEW.kennel_id || ',' || NEW.start_date || ',' || NEW.end_date
+      || ',' || extract(epoch FROM NEW.expires_at) || ',' || NEW.telegram_id);
+  ELSE
+    PERFORM pg_notify('holds_changed', '-' || OLD.id);
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS booking_holds_changed ON booking_holds;
+CREATE TRIGGER booking_holds_changed AFTER INSERT OR DELETE ON booking_holds
+  FOR EACH ROW EXECUTE FUNCTION notify_holds_changed();
@@ -0,0 +1,7 @@
+-- 005_broadcast_runs.sql - one row per scheduled broadcast and day, so only one bot process sends it
+CREATE TABLE IF NOT EXISTS broadcast_runs (
+  kind TEXT NOT NULL,
+  run_on DATE NOT NULL,
+  started_at TIMESTAMP DEFAULT now(),
+  PRIMARY KEY (kind, run_on)
+);
@@ -0,0 +1,18 @@
+-- 006_export_watermark.sql - transaction-id watermark for incremental booking exports
+-- (app/exports.py). write_xid is the 64-bit id of the transaction that last
+-- inserted or updated the row; an export hands out the xmin of its snapshot as
+-- the next watermark, so rows committed late or changed later (paid, moved)
+-- come out again instead of being skipped.
+ALTER TABLE bookings ADD COLUMN IF NOT EXISTS write_xid BIGINT NOT NULL DEFAULT pg_current_xact_id()::text::bigint;
+CREATE INDEX IF NOT EXISTS bookings_write_xid_idx ON bookings (write_xid);
+
+CREATE OR REPLACE FUNCTION bookings_set_write_xid() RETURNS trigger AS $$
+BEGIN
+  NEW.write_xid := pg_current_xact_id()::text::bigint;
+  RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS bookings_write_xid ON bookings;
+CREATE TRIGGER bookings_write_xid BEFORE UPDATE ON bookings
+  FOR EACH ROW EXECUTE FUNCTION bookings_set_write_xid();
@@ -0,0 +1,6 @@
+-- 007_microchip_placeholders.sql - registration stored the microchip answer as
+-- typed, so many pets have 'none' or similar. Clear them (see
+-- utils.normalize_microchip) so bulk imports cannot match them.
+UPDATE pets SET microchip_id = NULL
+WHERE lower(btrim(microchip_id, ' .')) IN ('none', 'no', 'na', 'n/a', 'nil', 'null', 'unknown')
+   OR btrim(microchip_id, ' 0-') = '';
@@ -0,0 +1,61 @@
+# app/payment_events.py - batched consumer for stored Stripe webhook events
+import os
+import json
+import asyncio
+import logging
+from db import with_transaction
+
+PAYMENT_EVENT_BATCH = int(os.getenv('PAYMENT_EVENT_BATCH', 200))
+PAYMENT_EVENT_POLL = float(os.getenv('PAYMENT_EVENT_POLL', 5))
+PAID_EVENT_TYPES = ('checkout.session.completed', 'checkout.session.async_payment_succeeded')
+
+logger = logging.getLogger(__name__)
+
+_wakeup = asyncio.Event()
+
+def notify():
+    """Called by the webhook after storing an event so the consumer drains right away."""
+    _wakeup.set()
+
+def paid_sessions(events):
+    """(booking ids, session ids) for paid checkout events; booking id is None when the session has no reference."""
+    booking_ids, refs = [], []
+    for e in events:
+        if e['type'] not in PAID_EVENT_TYPES:
+            continue
+        session = json.loads(e['payload'])['data']['object']
+        if session.get('payment_status') not in ('paid', 'no_payment_required'):
+            continue
+        ref = session.get('client_reference_id') or (session.get('metadata') or {}).get('booking_id')
+        booking_ids.append(int(ref) if ref and str(ref).isdigit() else None)
+        refs.append(session['id'])
+    return booking_ids, refs
+
+async def drain_once() -> int:
+    async def tx(conn):
+        # SKIP LOCKED lets several admin_web workers drain side by side
+        rows = await conn.fetch('SELECT id, type, payload FROM payment_events WHERE processed_at IS NULL ORDER BY received_at LIMIT $1 FOR UPDATE SKIP LOCKED', PAYMENT_EVENT_BATCH)
+        if not rows:
+            return 0
+        booking_ids, refs = paid_sessions(rows)
+        if refs:
+            await conn.execute('''UPDATE bookings b SET paid = true, payment_provider = 'stripe', payment_reference = s.ref
+                FROM unnest($1::int[], $2::text[]) AS s(booking_id, ref)
+                WHERE (b.id = s.booking_id OR b.payment_reference = s.ref) AND NOT b.paid''', booking_ids, refs)
+        await conn.execute('UPDATE payment_events SET processed_at = now() WHERE id = ANY($1::text[])', [r['id'] for r in rows])
+        return len(rows)
+    return await with_transaction(tx, label='payment_events')
+
+async def run_consumer():
+    while True:
+        try:
+            n = await drain_once()
+        except Exception:
+            logger.exception('payment event batch failed')
+            n = 0
+        if n < PAYMENT_EVENT_BATCH:
+            try:
+                await asyncio.wait_for(_wakeup.wait(), PAYMENT_EVENT_POLL)
+            except asyncio.TimeoutError:
+                pass
+            _wakeup.clear()
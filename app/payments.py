@@ -0,0 +1,122 @@
+# app/payments.py - payment providers; checkout creation never blocks the event loop
+import os
+import time
+import uuid
+import random
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+import stripe
+
+load_dotenv()
+
+STRIPE_API_KEY = os.getenv('STRIPE_API_KEY')
+APP_HOST = os.getenv('APP_HOST', 'http://localhost')
+APP_PORT = os.getenv('APP_PORT', '8080')
+# stripe | fake | none
+PAYMENT_PROVIDER = os.getenv('PAYMENT_PROVIDER', 'stripe' if STRIPE_API_KEY else 'none')
+PAYMENT_WORKERS = int(os.getenv('PAYMENT_WORKERS', 4))
+PAYMENT_TIMEOUT = float(os.getenv('PAYMENT_TIMEOUT', 15))
+PAYMENT_RETRIES = int(os.getenv('PAYMENT_RETRIES', 3))
+PAYMENT_FAKE_LATENCY = float(os.getenv('PAYMENT_FAKE_LATENCY', 0.3))
+
+logger = logging.getLogger(__name__)
+
+class PaymentError(Exception):
+    pass
+
+class PaymentProvider(ABC):
+    """Creates a hosted checkout for a booking; returns {'id': session id, 'url': payment url}."""
+    name = 'none'
+
+    @abstractmethod
+    async def create_checkout(self, booking_id: int, amount: float, description: str = 'Pet Hotel Booking'):
+        ...
+
+class StripeProvider(PaymentProvider):
+    name = 'stripe'
+
+    def __init__(self, api_key: str, workers: int = PAYMENT_WORKERS, timeout: float = PAYMENT_TIMEOUT, retries: int = PAYMENT_RETRIES, http_client=None):
+        self.api_key = api_key
+        # every HTTP call is bounded by `timeout`, so a worker thread is never left
+        # behind on a hung request; the SDK retries timeouts, connection errors and
+        # 409 idempotency conflicts with backoff under the same idempotency key
+        stripe.max_network_retries = max(retries, 1) - 1
+        stripe.default_http_client = http_client or stripe.new_default_http_client(timeout=timeout)
+        # the stripe SDK is synchronous; a bounded pool keeps slow calls off the loop
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='stripe')
+
+    def _create(self, booking_id, amount, description):
+        session = stripe.checkout.Session.create(
+            api_key=self.api_key,
+            idempotency_key=f'booking-{booking_id}',
+            payment_method_types=['card'],
+            line_items=[{
+                'price_data': {
+                    'currency': 'usd',
+                    'product_data': {'name': description},
+                    'unit_amount': int(round(amount * 100)),
+                },
+                'quantity': 1,
+            }],
+            mode='payment',
+            client_reference_id=str(booking_id),
+            metadata={'booking_id': str(booking_id)},
+            success_url=f"{APP_HOST}:{APP_PORT}/payment_success?session_id={{CHECKOUT_SESSION_ID}}",
+            cancel_url=f"{APP_HOST}:{APP_PORT}/payment_cancel",
+        )
+        return {'id': session.id, 'url': session.url}
+
+    async def create_checkout(self, booking_id: int, amount: float, description: str = 'Pet Hotel Booking'):
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self._executor, self._create, booking_id, amount, description)
+        except stripe.error.StripeError as e:
+            raise PaymentError(str(e)) from e
+
+class FakeProvider(PaymentProvider):
+    """Offline stand-in with configurable latency and failure rate, for tests and load runs."""
+    name = 'fake'
+
+    def __init__(self, latency: float = PAYMENT_FAKE_LATENCY, failure_rate: float = 0.0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+
+    async def create_checkout(self, booking_id: int, amount: float, description: str = 'Pet Hotel Booking'):
+        await asyncio.sleep(self.latency)
+        if random.random() < self.failure_rate:
+            raise PaymentError('fake provider failure')
+        session_id = f'fake_{uuid.uuid4().hex}'
+        return {'id': session_id, 'url': f'{APP_HOST}:{APP_PORT}/payment_success?session_id={session_id}'}
+
+_provider = None
+
+def get_provider():
+    """Configured provider, or None when payments are disabled."""
+    global _provider
+    if _provider is None and PAYMENT_PROVIDER != 'none':
+        if PAYMENT_PROVIDER == 'fake':
+            _provider = FakeProvider()
+        elif PAYMENT_PROVIDER == 'stripe' and STRIPE_API_KEY:
+            _provider = StripeProvider(STRIPE_API_KEY)
+    return _provider
+
+async def _bench(n: int, concurrency: int):
+    provider = FakeProvider()
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with sem:
+            await provider.create_checkout(i, 10.0)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(n)))
+    elapsed = time.perf_counter() - start
+    print(f'{n} checkouts in {elapsed:.2f}s ({n / elapsed:.1f}/s, concurrency {concurrency})')
+
+if __name__ == '__main__':
+    # python payments.py [count] [concurrency] - offline throughput check of the async path
+    import sys
+    asyncio.run(_bench(int(sys.argv[1]) if len(sys.argv) > 1 else 1000, int(sys.argv[2]) if len(sys.argv) > 2 else 100))
@@ -0,0 +1,138 @@
+# app/persistence.py - python-telegram-bot persistence stored in Postgres
+import os
+import json
+import pickle
+import asyncio
+import logging
+from telegram.ext import BasePersistence, PersistenceInput
+from db import fetch, fetchrow, with_transaction
+
+logger = logging.getLogger(__name__)
+
+# PTB hands over changed entries once per interval; they are written in one batch
+PERSISTENCE_FLUSH_INTERVAL = float(os.getenv('PERSISTENCE_FLUSH_INTERVAL', 10))
+
+class PostgresPersistence(BasePersistence):
+    """user/chat/bot data and conversation states in the bot_persistence table.
+
+    Writes are coalesced per key and flushed in one statement pair shortly after
+    PTB's periodic update run. User and chat data are loaded lazily the first
+    time an update for that user/chat is processed, so startup reads nothing
+    but bot data and conversation states. Because of the lazy load, a given
+    user's updates must all be handled by the same process (see sharding).
+    """
+
+    def __init__(self, update_interval: float = PERSISTENCE_FLUSH_INTERVAL):
+        # arbitrary callback_data is not used by this bot
+        super().__init__(store_data=PersistenceInput(callback_data=False), update_interval=update_interval)
+        self._pending = {}  # (kind, key) -> pickled bytes, or None to delete
+        self._loaded = set()  # (kind, key) already merged from the database
+        self._flush_task = None
+        self._bot_data = None  # last pickled bot_data, see update_bot_data
+
+    # --- loading -------------------------------------------------------
+
+    async def _load(self, kind: str, key: str):
+        row = await fetchrow('SELECT data FROM bot_persistence WHERE kind=$1 AND key=$2', kind, key)
+        return pickle.loads(row['data']) if row else None
+
+    async def get_user_data(self):
+        return {}
+
+    async def get_chat_data(self):
+        return {}
+
+    async def get_bot_data(self):
+        data = await self._load('bot', '') or {}
+        self._bot_data = pickle.dumps(data)
+        return data
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name: str):
+        rows = await fetch('SELECT key, data FROM bot_persistence WHERE kind=$1', f'conversation:{name}')
+        return {tuple(json.loads(r['key'])): pickle.loads(r['data']) for r in rows}
+
+    async def _refresh(self, kind: str, key, data: dict):
+        marker = (kind, str(key))
+        if marker in self._loaded:
+            return
+        self._loaded.add(marker)
+        stored = await self._load(kind, str(key))
+        for k, v in (stored or {}).items():
+            data.setdefault(k, v)
+
+    async def refresh_user_data(self, user_id: int, user_data):
+        await self._refresh('user', user_id, user_data)
+
+    async def refresh_chat_data(self, chat_id: int, chat_data):
+        await self._refresh('chat', chat_id, chat_data)
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    # --- write-behind --------------------------------------------------
+
+    def _mark(self, kind: str, key, value):
+        self._pending[(kind, str(key))] = None if value is None else pickle.dumps(value)
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_soon())
+
+    async def _flush_soon(self):
+        # let the rest of PTB's update run land in the same batch
+        await asyncio.sleep(0.1)
+        await self.flush()
+
+    async def update_user_data(self, user_id: int, data):
+        self._loaded.add(('user', str(user_id)))
+        self._mark('user', user_id, data)
+
+    async def update_chat_data(self, chat_id: int, data):
+        self._loaded.add(('chat', str(chat_id)))
+        self._mark('chat', chat_id, data)
+
+    async def update_bot_data(self, data):
+        # PTB hands bot_data over on every run; only write real changes so
+        # several bot processes do not keep overwriting each other's row
+        pickled = pickle.dumps(data)
+        if pickled != self._bot_data:
+            self._bot_data = pickled
+            self._mark('bot', '', data)
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def update_conversation(self, name: str, key, new_state):
+        self._mark(f'conversation:{name}', json.dumps(list(key)), new_state)
+
+    async def drop_user_data(self, user_id: int):
+        self._mark('user', user_id, None)
+
+    async def drop_chat_data(self, chat_id: int):
+        self._mark('chat', chat_id, None)
+
+    async def flush(self):
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        upserts = [(kind, key, data) for (kind, key), data in pending.items() if data is not None]
+        deletes = [(kind, key) for (kind, key), data in pending.items() if data is None]
+
+        async def tx(conn):
+            if upserts:
+                await conn.execute('''INSERT INTO bot_persistence (kind, key, data)
+                    SELECT * FROM unnest($1::text[], $2::text[], $3::bytea[])
+                    ON CONFLICT (kind, key) DO UPDATE SET data = EXCLUDED.data, updated_at = now()''',
+                    [u[0] for u in upserts], [u[1] for u in upserts], [u[2] for u in upserts])
+            if deletes:
+                await conn.execute('''DELETE FROM bot_persistence p USING unnest($1::text[], $2::text[]) AS d(kind, key)
+                    WHERE p.kind = d.kind AND p.key = d.key''', [d[0] for d in deletes], [d[1] for d in deletes])
+
+        try:
+            await with_transaction(tx, label='persistence_flush')
+        except Exception:
+            logger.exception('Persistence flush failed; %d entries will be retried', len(pending))
+            # keep newer writes that arrived meanwhile
+            for k, v in pending.items():
+                self._pending.setdefault(k, v)
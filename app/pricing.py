@@ -0,0 +1,87 @@
+# app/pricing.py - booking price rules and batch quotes
+import os
+from datetime import date, timedelta
+
+# keyword found in the free-text services answer -> flat price
+SERVICE_CATALOG = {'groom': 5.0, 'walk': 2.0}
+
+class PricingRules:
+    """Per-day kennel rate multipliers (weekday x season) plus the service catalog.
+
+    The defaults reproduce the original flat pricing: daily price x days,
+    food unit price x quantity, and the catalog services.
+    """
+
+    def __init__(self, weekday_multipliers=None, seasons=None, services=None):
+        self.weekday_multipliers = list(weekday_multipliers or [1.0] * 7)  # Monday first
+        self.seasons = list(seasons or [])  # (start, end, multiplier), closed ranges
+        self.services = dict(SERVICE_CATALOG if services is None else services)
+
+    @classmethod
+    def from_env(cls):
+        # PRICING_WEEKDAY_MULTIPLIERS=1,1,1,1,1,1.2,1.2
+        # PRICING_SEASONS=2025-12-20:2026-01-05:1.5;2026-07-01:2026-08-31:1.3
+        weekdays = os.getenv('PRICING_WEEKDAY_MULTIPLIERS')
+        seasons = []
+        for item in filter(None, os.getenv('PRICING_SEASONS', '').split(';')):
+            start, end, mult = item.split(':')
+            seasons.append((date.fromisoformat(start), date.fromisoformat(end), float(mult)))
+        return cls(
+            weekday_multipliers=[float(x) for x in weekdays.split(',')] if weekdays else None,
+            seasons=seasons,
+        )
+
+    def day_multiplier(self, d) -> float:
+        m = self.weekday_multipliers[d.weekday()]
+        for start, end, season_mult in self.seasons:
+            if start <= d <= end:
+                m *= season_mult
+        return m
+
+    def services_price(self, services) -> float:
+        if not services:
+            return 0.0
+        # a few substring checks; not memoized, the text is free user input
+        text = services.lower()
+        return sum(p for keyword, p in self.services.items() if keyword in text)
+
+
+def _multiplier_table(rules, first, last):
+    """Prefix sums of day multipliers: cum[i] = sum over days first .. first+i-1."""
+    cum = [0.0]
+    d = first
+    while d <= last:
+        cum.append(cum[-1] + rules.day_multiplier(d))
+        d += timedelta(days=1)
+    return cum
+
+
+def quote_many(rules, stays, kennel_prices, food_prices):
+    """Price many (kennel_id, start, end, food_id, food_quantity, services) stays at once.
+
+    Day multipliers are summed once for the span the batch covers, so each stay
+    costs two table lookups however long it is. `food_id` may be None to quote
+    the kennel and services alone. Returns totals in input order.
+    """
+    stays = list(stays)
+    if not stays:
+        return []
+    first = min(s[1] for s in stays)
+    cum = _multiplier_table(rules, first, max(s[2] for s in stays))
+    totals = []
+    for kennel_id, start, end, food_id, food_quantity, services in stays:
+        i, j = (start - first).days, (end - first).days + 1
+        total = float(kennel_prices[kennel_id]) * (cum[j] - cum[i])
+        if food_id is not None:
+            total += float(food_prices[food_id]) * (food_quantity or 0)
+        total += rules.services_price(services)
+        totals.append(round(total, 2))
+    return totals
+
+
+def quote(rules, daily_price, unit_price, start, end, food_quantity=0, services=None) -> float:
+    kennel_prices, food_prices = {0: daily_price}, {0: unit_price or 0}
+    return quote_many(rules, [(0, start, end, 0, food_quantity, services)], kennel_prices, food_prices)[0]
+
+
+pricing_rules = PricingRules.from_env()
@@ -0,0 +1,117 @@
+# app/ratelimit.py - token buckets for pacing outbound messages and throttling inbound updates
+import time
+import asyncio
+
+class TokenBucket:
+    """`rate` tokens per second, bursts up to `capacity`.
+
+    reserve() takes tokens immediately and returns how long the caller must
+    wait before using them, so concurrent callers queue up in call order
+    without a lock.
+    """
+
+    def __init__(self, rate: float, capacity: float = None, clock=time.monotonic):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else rate)
+        self.clock = clock
+        self.tokens = self.capacity
+        self.updated = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, n: float = 1) -> float:
+        self._refill()
+        self.tokens -= n
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def try_take(self, n: float = 1) -> bool:
+        """Take `n` tokens if they are there now; never goes into debt."""
+        self._refill()
+        if self.tokens < n:
+            return False
+        self.tokens -= n
+        return True
+
+    async def acquire(self, n: float = 1):
+        delay = self.reserve(n)
+        if delay:
+            await asyncio.sleep(delay)
+
+    def pause(self, seconds: float):
+        """Hand out nothing for `seconds` (e.g. after a 429 with retry_after)."""
+        self._refill()
+        self.tokens = min(self.tokens, 0) - seconds * self.rate
+
+    def idle(self) -> bool:
+        self._refill()
+        return self.tokens >= self.capacity
+
+
+class KeyedBuckets:
+    """One TokenBucket per key (chat or user id), dropping refilled ones once there are many."""
+
+    def __init__(self, rate: float, capacity: float = None, max_keys: int = 10000, clock=time.monotonic):
+        self.rate, self.capacity, self.max_keys, self.clock = rate, capacity, max_keys, clock
+        self._buckets = {}
+
+    def get(self, key) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self.max_keys:
+                self.prune()
+            bucket = self._buckets[key] = TokenBucket(self.rate, self.capacity, self.clock)
+        return bucket
+
+    def prune(self):
+        for key in [k for k, b in self._buckets.items() if b.idle()]:
+            del self._buckets[key]
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class DuplicateFilter:
+    """Remembers the last value seen per key; seen() is true when the same
+    value repeats within `window` seconds (a double tap on the same button)."""
+
+    def __init__(self, window: float, max_keys: int = 10000, clock=time.monotonic):
+        self.window, self.max_keys, self.clock = window, max_keys, clock
+        self._last = {}
+
+    def seen(self, key, value) -> bool:
+        now = self.clock()
+        last = self._last.get(key)
+        if last is None and len(self._last) >= self.max_keys:
+            self._last = {k: v for k, v in self._last.items() if now - v[1] < self.window}
+        self._last[key] = (value, now)
+        return last is not None and last[0] == value and now - last[1] < self.window
+
+
+class LatestOnly:
+    """Tags work per key so only the newest of a burst goes ahead.
+
+    token = mark(key) when the work arrives; after the debounce delay
+    is_latest(key, token) is false if something newer came in meanwhile.
+    """
+
+    def __init__(self):
+        self._seq = 0
+        self._latest = {}
+
+    def mark(self, key) -> int:
+        self._seq += 1
+        self._latest[key] = self._seq
+        return self._seq
+
+    def is_latest(self, key, token: int) -> bool:
+        return self._latest.get(key) == token
+
+    def done(self, key, token: int):
+        if self._latest.get(key) == token:
+            del self._latest[key]
+
+    def __len__(self):
+        return len(self._latest)
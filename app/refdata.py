@@ -0,0 +1,77 @@
+# app/refdata.py - process-wide cache of reference data (kennels, foods)
+import os
+import time
+import asyncio
+import logging
+from db import fetch, listen
+
+logger = logging.getLogger(__name__)
+
+# entries are dropped on NOTIFY from the triggers in migrations/001_baseline.sql; the TTL
+# covers a lost listener connection or a process that never subscribed
+REFDATA_TTL = float(os.getenv('REFDATA_TTL', 300))
+REFDATA_CHANNEL = 'refdata_changed'
+
+_QUERIES = {
+    'kennels': 'SELECT id, code, size, daily_price, is_active FROM kennels ORDER BY id',
+    'foods': 'SELECT id, name, unit_price FROM foods ORDER BY id',
+}
+
+_cache = {}  # table -> (loaded_at, rows, rows_by_id)
+# bumped by invalidate(); a load that started before a bump is not cached,
+# since it may have read rows from before the change
+_generations = {table: 0 for table in _QUERIES}
+_locks = {table: asyncio.Lock() for table in _QUERIES}
+
+async def _get(table):
+    entry = _cache.get(table)
+    if entry and time.monotonic() - entry[0] < REFDATA_TTL:
+        return entry
+    async with _locks[table]:
+        entry = _cache.get(table)
+        if entry and time.monotonic() - entry[0] < REFDATA_TTL:
+            return entry
+        generation = _generations[table]
+        rows = await fetch(_QUERIES[table])
+        entry = (time.monotonic(), rows, {r['id']: r for r in rows})
+        if _generations[table] == generation:
+            _cache[table] = entry
+        return entry
+
+async def get_kennels(active_only: bool = True):
+    _, rows, _ = await _get('kennels')
+    return [r for r in rows if r['is_active']] if active_only else rows
+
+async def get_kennel(kennel_id: int):
+    _, _, by_id = await _get('kennels')
+    return by_id.get(kennel_id)
+
+async def get_foods():
+    _, rows, _ = await _get('foods')
+    return rows
+
+async def get_food(food_id: int):
+    _, _, by_id = await _get('foods')
+    return by_id.get(food_id)
+
+def invalidate(table: str = None):
+    for t in [table] if table else list(_QUERIES):
+        _generations[t] += 1
+        _cache.pop(t, None)
+
+def _on_notify(conn, pid, channel, payload):
+    logger.info('Reference data changed: %s', payload)
+    invalidate(payload if payload in _QUERIES else None)
+
+_listening = False
+
+async def start_listener():
+    # safe to call from both the web app and an in-process bot
+    global _listening
+    if _listening:
+        return
+    try:
+        await listen(REFDATA_CHANNEL, _on_notify)
+        _listening = True
+    except Exception:
+        logger.exception('Could not LISTEN on %s; relying on TTL', REFDATA_CHANNEL)
@@ -1,8 +1,8 @@
 # app/registration.py - registration conversation extracted for modularity
 from telegram import Update
 from telegram.ext import MessageHandler, filters, CommandHandler, ConversationHandler, ContextTypes
-from db import fetchrow, execute
-from utils import parse_yyyy_mm_dd
+from db import fetchrow_named, fetchval_named
+from utils import parse_yyyy_mm_dd, normalize_microchip
 
 # reuse state constants
 from bot_constants import *
@@ -57,7 +57,7 @@ async def pet_length(update: Update, context: ContextTypes.DEFAULT_TYPE):
     return PET_MICROCHIP
 
 async def pet_microchip(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    context.user_data['pet']['microchip_id'] = update.message.text.strip()
+    context.user_data['pet']['microchip_id'] = normalize_microchip(update.message.text)
     await update.message.reply_text('Vaccination notes (short):')
     return PET_VACC
 
@@ -99,26 +99,28 @@ async def owner_phone(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def confirm_save(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.message.from_user
-    owner_row = await fetchrow('SELECT id FROM owners WHERE telegram_id=$1', user.id)
+    owner_row = await fetchrow_named('owner_by_telegram_id', user.id)
     if owner_row:
         owner_id = owner_row['id']
     else:
-        owner_res = await fetchrow('INSERT INTO owners (telegram_id, name, phone) VALUES ($1,$2,$3) RETURNING id', user.id, context.user_data.get('owner_name'), context.user_data.get('owner_phone'))
-        owner_id = owner_res['id']
+        owner_id = await fetchval_named('insert_owner', user.id, context.user_data.get('owner_name'), context.user_data.get('owner_phone'), None)
     pet = context.user_data['pet']
-    await execute(
-        '''INSERT INTO pets (owner_id, name, species, breed, color, age, weight_kg, length_cm, microchip_id, vaccination_notes, special_needs, photo_file_id)
-           VALUES ($1,$2,$3,$4,$5,$6,$7,$8,$9,$10,$11,$12)
-        ''',
+    await fetchval_named(
+        'insert_pet',
         owner_id, pet.get('name'), pet.get('species'), pet.get('breed'), pet.get('color'), pet.get('age'), pet.get('weight_kg'), pet.get('length_cm'), pet.get('microchip_id'), pet.get('vaccination_notes'), pet.get('special_needs'), pet.get('photo_file_id')
     )
     await update.message.reply_text('Pet registered! Use /my_pets to see your pets or /book to make a booking.')
-    context.user_data.clear()
+    clear_registration(context)
     return ConversationHandler.END
 
+def clear_registration(context):
+    # only the registration keys; bookings and the admin flag live in user_data too
+    for key in ('pet', 'owner_name', 'owner_phone'):
+        context.user_data.pop(key, None)
+
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text('Registration cancelled.')
-    context.user_data.clear()
+    clear_registration(context)
     return ConversationHandler.END
 
 # ConversationHandler object to be imported
@@ -140,5 +142,8 @@ conv = ConversationHandler(
         OWNER_PHONE: [MessageHandler(filters.TEXT & ~filters.COMMAND, owner_phone)],
         CONFIRM: [CommandHandler('confirm', confirm_save), CommandHandler('cancel', cancel)]
     },
-    fallbacks=[CommandHandler('cancel', cancel)]
+    fallbacks=[CommandHandler('cancel', cancel)],
+    name='registration',
+    # PTB refuses a persistent conversation on an application without persistence
+    persistent=BOT_PERSISTENCE,
 )
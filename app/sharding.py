@@ -0,0 +1,37 @@
+# app/sharding.py - consistent hashing of Telegram updates onto worker shards
+import hashlib
+from bisect import bisect_right
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'big')
+
+class HashRing:
+    """Maps keys onto shards so that adding or removing a shard only moves
+    about 1/N of the keys; each shard owns `replicas` points on the ring."""
+
+    def __init__(self, shards, replicas: int = 64):
+        points = sorted((_hash(f'{shard}:{i}'), shard) for shard in shards for i in range(replicas))
+        self._hashes = [h for h, _ in points]
+        self._shards = [s for _, s in points]
+
+    def shard_for(self, key):
+        if not self._hashes:
+            raise ValueError('HashRing has no shards')
+        i = bisect_right(self._hashes, _hash(str(key)))
+        return self._shards[i % len(self._shards)]
+
+def update_shard_key(data: dict):
+    """Sharding key of a raw update: the sending user, else the chat, else the update id.
+
+    Works on the JSON dict so the intake never has to build telegram objects.
+    """
+    for key, value in data.items():
+        if not isinstance(value, dict):
+            continue
+        user = value.get('from') or value.get('user')
+        if user and 'id' in user:
+            return user['id']
+        chat = value.get('chat')
+        if chat and 'id' in chat:
+            return chat['id']
+    return data.get('update_id')
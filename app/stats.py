@@ -0,0 +1,106 @@
+# app/stats.py - admin dashboard stats from the trigger-maintained summary tables
+import os
+import json
+import time
+import asyncio
+import logging
+from db import fetch, fetchrow, listen
+import refdata
+from analytics import occupancy_series
+
+logger = logging.getLogger(__name__)
+
+# absorbs bursts of dashboard refreshes; counters themselves are always current
+STATS_TTL = float(os.getenv('STATS_TTL', 5))
+# memoized occupancy series, kept until a booking changes
+ANALYTICS_CACHE_SIZE = int(os.getenv('ANALYTICS_CACHE_SIZE', 128))
+ANALYTICS_MAX_DAYS = int(os.getenv('ANALYTICS_MAX_DAYS', 1096))
+
+STATS_QUERY = '''SELECT t.pets, t.bookings, t.revenue, t.paid_bookings, t.paid_revenue,
+  COALESCE((SELECT json_agg(json_build_object(
+      'id', k.id, 'code', k.code, 'size', k.size, 'daily_price', k.daily_price, 'is_active', k.is_active,
+      'bookings', COALESCE(s.bookings, 0), 'booked_days', COALESCE(s.booked_days, 0), 'revenue', COALESCE(s.revenue, 0),
+      'occupied_today', EXISTS (SELECT 1 FROM bookings b WHERE b.kennel_id = k.id AND current_date BETWEEN b.start_date AND b.end_date)
+    ) ORDER BY k.id)
+    FROM kennels k LEFT JOIN kennel_stats s ON s.kennel_id = k.id), '[]') AS kennels
+FROM stats_totals t'''
+
+_cached = None  # (loaded_at, stats)
+_lock = asyncio.Lock()
+
+async def get_stats():
+    global _cached
+    if _cached and time.monotonic() - _cached[0] < STATS_TTL:
+        return _cached[1]
+    async with _lock:
+        if _cached and time.monotonic() - _cached[0] < STATS_TTL:
+            return _cached[1]
+        row = await fetchrow(STATS_QUERY)
+        stats = {
+            'pets': row['pets'],
+            'bookings': row['bookings'],
+            'revenue': float(row['revenue']),
+            'paid_bookings': row['paid_bookings'],
+            'paid_revenue': float(row['paid_revenue']),
+            'kennels': json.loads(row['kennels']),
+        }
+        stats['unpaid_bookings'] = stats['bookings'] - stats['paid_bookings']
+        stats['unpaid_revenue'] = stats['revenue'] - stats['paid_revenue']
+        _cached = (time.monotonic(), stats)
+        return stats
+
+def format_stats(stats) -> str:
+    lines = [
+        'Stats:',
+        f"Pets: {stats['pets']}",
+        f"Bookings: {stats['bookings']} (paid {stats['paid_bookings']}, unpaid {stats['unpaid_bookings']})",
+        f"Estimated revenue: ${stats['revenue']:.2f} (paid ${stats['paid_revenue']:.2f}, unpaid ${stats['unpaid_revenue']:.2f})",
+        'Kennels:',
+    ]
+    for k in stats['kennels']:
+        lines.append(f"{k['code']} ({k['size']}): {k['bookings']} bookings, {k['booked_days']} days, ${float(k['revenue']):.2f}{' - occupied today' if k['occupied_today'] else ''}")
+    return '\n'.join(lines)
+
+
+OCCUPANCY_QUERY = '''SELECT kennel_id, start_date, end_date, estimated_price FROM bookings
+WHERE kennel_id IS NOT NULL AND start_date <= $2 AND end_date >= $1'''
+
+# (start, end, granularity, group) -> task, so concurrent requests for the same
+# series share one query; cleared by the bookings_changed/refdata_changed NOTIFYs
+_occupancy = {}
+
+async def _load_occupancy(start, end, granularity, group):
+    kennels = await refdata.get_kennels(active_only=False)
+    key = (lambda k: k['size']) if group == 'size' else (lambda k: k['code'])
+    groups = {k['id']: key(k) for k in kennels}
+    capacity = {}
+    for k in kennels:
+        if k['is_active']:
+            capacity[key(k)] = capacity.get(key(k), 0) + 1
+    rows = await fetch(OCCUPANCY_QUERY, start, end)
+    series = occupancy_series(((r['kennel_id'], r['start_date'], r['end_date'], r['estimated_price']) for r in rows), groups, capacity, start, end, granularity)
+    return {'start': start.isoformat(), 'end': end.isoformat(), 'granularity': granularity, 'group': group, 'series': series}
+
+async def get_occupancy(start, end, granularity: str = 'day', group: str = 'size'):
+    """Occupancy and revenue per day/week/month, by kennel size or kennel code."""
+    if (end - start).days + 1 > ANALYTICS_MAX_DAYS:
+        raise ValueError(f'Range is limited to {ANALYTICS_MAX_DAYS} days')
+    if group not in ('size', 'kennel'):
+        raise ValueError("group must be 'size' or 'kennel'")
+    key = (start, end, granularity, group)
+    task = _occupancy.get(key)
+    if task is None or (task.done() and task.exception() is not None):
+        if len(_occupancy) >= ANALYTICS_CACHE_SIZE:
+            _occupancy.pop(next(iter(_occupancy)))
+        task = _occupancy[key] = asyncio.ensure_future(_load_occupancy(start, end, granularity, group))
+    return await asyncio.shield(task)
+
+def invalidate_analytics(*_):
+    _occupancy.clear()
+
+async def start_listener():
+    for channel in ('bookings_changed', refdata.REFDATA_CHANNEL):
+        try:
+            await listen(channel, invalidate_analytics)
+        except Exception:
+            logger.exception('Could not LISTEN on %s; analytics may be stale', channel)
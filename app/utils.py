@@ -13,3 +13,19 @@ def days_between(start, end):
 def ranges_overlap(a_start, a_end, b_start, b_end) -> bool:
     """Return True if two closed date ranges overlap."""
     return (a_start <= b_end) and (a_end >= b_start)
+
+# answers to "Microchip ID (or "none")" that mean there is no chip
+NO_MICROCHIP = {'none', 'no', 'na', 'n/a', 'nil', 'null', 'unknown'}
+
+def normalize_microchip(text):
+    """Return the microchip id, or None for a blank or placeholder answer like "none".
+
+    Placeholders are kept out of the database so they never match another
+    owner's pet on import.
+    """
+    if text is None:
+        return None
+    chip = str(text).strip()
+    if chip.lower().strip(' .') in NO_MICROCHIP or not chip.strip('0-'):
+        return None
+    return chip
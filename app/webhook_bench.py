@@ -0,0 +1,78 @@
+# app/webhook_bench.py - POST synthetic Telegram updates to /telegram and measure throughput
+#
+#   BOT_MODE=webhook TELEGRAM_WEBHOOK_SECRET=s3cret uvicorn admin_web:app --port 8080
+#   python webhook_bench.py --url http://localhost:8080 --secret s3cret -n 5000 -c 50
+#
+# Updates are plain text messages from users without a booking in progress, so
+# the handlers only touch the database (persistence, lookups) and never call the
+# Telegram API. "accepted" is how fast the route queues updates; "processed"
+# waits for bot_updates_total on /metrics to catch up, i.e. end to end.
+import argparse
+import asyncio
+import time
+import httpx
+
+def synthetic_update(update_id: int, user_id: int, text: str = 'hello') -> dict:
+    user = {'id': user_id, 'is_bot': False, 'first_name': f'bench{user_id}'}
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private', 'first_name': user['first_name']},
+            'from': user,
+            'text': text,
+        },
+    }
+
+async def processed_updates(client, url: str) -> float:
+    r = await client.get(url + '/metrics')
+    return sum(float(line.rsplit(' ', 1)[1]) for line in r.text.splitlines() if line.startswith('bot_updates_total'))
+
+async def run(url: str, secret: str, total: int, concurrency: int, users: int, wait: float):
+    headers = {'X-Telegram-Bot-Api-Secret-Token': secret}
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+        before = await processed_updates(client, url)
+        next_id = iter(range(1, total + 1))
+        latencies, failures = [], 0
+
+        async def worker():
+            nonlocal failures
+            for update_id in next_id:
+                start = time.perf_counter()
+                r = await client.post(url + '/telegram', json=synthetic_update(update_id, 1_000_000 + update_id % users), headers=headers)
+                latencies.append(time.perf_counter() - start)
+                if r.status_code != 200:
+                    failures += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        accepted = time.perf_counter() - start
+
+        done = 0
+        while time.perf_counter() - start < accepted + wait:
+            done = await processed_updates(client, url) - before
+            if done >= total:
+                break
+            await asyncio.sleep(0.2)
+        processed = time.perf_counter() - start
+
+    latencies.sort()
+    print(f'{total} updates, {concurrency} connections, {users} users, {failures} failed')
+    print(f'accepted:  {total / accepted:8.0f} updates/s  (p50 {latencies[len(latencies) // 2] * 1000:.1f} ms, p99 {latencies[int(len(latencies) * 0.99)] * 1000:.1f} ms)')
+    if done >= total:
+        print(f'processed: {total / processed:8.0f} updates/s  ({processed:.2f} s end to end)')
+    else:
+        print(f'processed: only {done:.0f}/{total} after {processed:.1f} s')
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser()
+    p.add_argument('--url', default='http://localhost:8080')
+    p.add_argument('--secret', required=True)
+    p.add_argument('-n', '--total', type=int, default=2000)
+    p.add_argument('-c', '--concurrency', type=int, default=20)
+    p.add_argument('--users', type=int, default=500)
+    p.add_argument('--wait', type=float, default=60, help='seconds to wait for processing after the last POST')
+    a = p.parse_args()
+    asyncio.run(run(a.url, a.secret, a.total, a.concurrency, a.users, a.wait))
@@ -0,0 +1,42 @@
+# app modules import their siblings by plain name (they run from the app dir);
+# appended, not prepended, so app/calendar.py cannot shadow the stdlib module
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app'))
+
+import asyncio
+import pytest
+
+@pytest.fixture
+def scratch_schema(request):
+    """A freshly migrated schema in TEST_DATABASE_URL named after the test module, dropped afterwards.
+
+    Tests connect themselves and `SET search_path TO <schema>, public`.
+    """
+    url = os.getenv('TEST_DATABASE_URL')
+    if not url:
+        pytest.skip('TEST_DATABASE_URL not set')
+    asyncpg = pytest.importorskip('asyncpg')
+    from app.migrate import migrate, MIGRATIONS_DIR
+    schema = request.module.__name__.rsplit('.', 1)[-1]
+
+    async def setup():
+        conn = await asyncpg.connect(url)
+        try:
+            await conn.execute(f'DROP SCHEMA IF EXISTS {schema} CASCADE; CREATE SCHEMA {schema}')
+            await conn.execute(f'SET search_path TO {schema}, public')
+            await migrate(conn, MIGRATIONS_DIR)
+        finally:
+            await conn.close()
+
+    async def teardown():
+        conn = await asyncpg.connect(url)
+        try:
+            await conn.execute(f'DROP SCHEMA IF EXISTS {schema} CASCADE')
+        finally:
+            await conn.close()
+
+    asyncio.run(setup())
+    yield schema
+    asyncio.run(teardown())
@@ -0,0 +1,58 @@
+import asyncio
+import pytest
+
+pytest.importorskip('telegram')
+pytest.importorskip('asyncpg')
+from app import admin_handlers
+from app.admin_handlers import _clients_query, _clients_page
+
+@pytest.fixture
+def page_size(monkeypatch):
+    monkeypatch.setattr(admin_handlers, 'CLIENTS_PAGE_SIZE', 3)
+    return 3
+
+def test_clients_query_arguments(page_size):
+    sql, args = _clients_query()
+    assert args == [4] and 'WHERE' not in sql and 'ORDER BY o.id ASC LIMIT $1' in sql
+    sql, args = _clients_query(after=10, search='ann')
+    assert args == ['%ann%', 10, 4]
+    assert '(o.name ILIKE $1 OR o.phone ILIKE $1) AND o.id > $2' in sql and 'ASC LIMIT $3' in sql
+    sql, args = _clients_query(before=10)
+    assert args == [10, 4] and 'o.id < $1' in sql and 'DESC LIMIT $2' in sql
+    # pages always come back in id order
+    assert sql.rstrip().endswith('ORDER BY o.id')
+
+@pytest.fixture
+def owners(monkeypatch, page_size):
+    ids = list(range(1, 9))
+
+    async def fetch(sql, *args):
+        # the query's semantics over owners 1..8: inner keyset LIMIT, outer ORDER BY id
+        limit = args[-1]
+        if 'o.id < ' in sql:
+            rows = sorted((i for i in ids if i < args[-2]), reverse=True)[:limit]
+        else:
+            after = args[-2] if 'o.id > ' in sql else 0
+            rows = [i for i in ids if i > after][:limit]
+        return [{'id': i, 'name': f'Owner {i}', 'phone': '', 'pets': None} for i in sorted(rows)]
+
+    monkeypatch.setattr(admin_handlers, 'fetch', fetch)
+
+def _page(**kwargs):
+    text, markup = asyncio.run(_clients_page(**kwargs))
+    shown = [int(line.split('#')[1].split(':')[0]) for line in text.splitlines()[1:]]
+    nav = [b.callback_data for b in markup.inline_keyboard[0]] if markup else []
+    return shown, nav
+
+def test_clients_pages_forward_and_back(owners):
+    assert _page() == ([1, 2, 3], ['clients:next:3'])
+    assert _page(after=3) == ([4, 5, 6], ['clients:prev:4', 'clients:next:6'])
+    assert _page(after=6) == ([7, 8], ['clients:prev:7'])
+    # going back from 7 shows 4-6 with both directions open
+    assert _page(before=7) == ([4, 5, 6], ['clients:prev:4', 'clients:next:6'])
+    # and from 4 the first page, with nothing before it
+    assert _page(before=4) == ([1, 2, 3], ['clients:next:3'])
+
+def test_clients_page_empty(owners):
+    assert asyncio.run(_clients_page(after=8)) == ('No clients yet.', None)
+    assert asyncio.run(_clients_page(after=8, search='x')) == ('No clients found.', None)
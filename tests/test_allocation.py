@@ -0,0 +1,87 @@
+from app.allocation import best_fit, pet_size, repack, short_gaps
+from app.availability import AvailabilityIndex
+from datetime import date, timedelta
+import asyncio
+import os
+import pytest
+
+KENNELS = [{'id': 1, 'size': 'small'}, {'id': 2, 'size': 'small'}, {'id': 3, 'size': 'large'}]
+
+def test_pet_size():
+    assert pet_size(None) == 'small'
+    assert pet_size(8) == 'small'
+    assert pet_size(20) == 'medium'
+    assert pet_size(40) == 'large'
+
+def test_best_fit_prefers_size_then_no_short_gaps():
+    idx = AvailabilityIndex()
+    idx.load([(1, date(2025,1,1), date(2025,1,4)), (2, date(2025,1,1), date(2025,1,5))])
+    # kennel 1 would leave a one-day gap, kennel 2 is touched exactly
+    assert best_fit(idx, KENNELS, date(2025,1,6), date(2025,1,8))['id'] == 2
+    assert best_fit(idx, KENNELS, date(2025,1,6), date(2025,1,8), 'medium')['id'] == 3
+    idx.add(3, date(2025,1,6), date(2025,1,8))
+    assert best_fit(idx, KENNELS, date(2025,1,6), date(2025,1,8), 'large') is None
+
+def test_repack_closes_gaps():
+    fixed = [(1, date(2025,1,1), date(2025,1,3)), (2, date(2025,1,1), date(2025,1,5))]
+    # kennel 1 has a two-day hole between stays 11 and 10; moving 12 into it closes it
+    movable = [(10, 1, date(2025,1,8), date(2025,1,9), 'small'),
+               (11, 1, date(2025,1,4), date(2025,1,5), 'small'),
+               (12, 2, date(2025,1,6), date(2025,1,7), 'small')]
+    plan = repack([k for k in KENNELS if k['size'] == 'small'], fixed, movable)
+    assert plan['unplaced'] == []
+    assert plan['moves'] == [(12, 2, 1)]
+    assert (plan['short_gaps_before'], plan['short_gaps_after']) == (1, 0)
+    plan = repack(KENNELS[:2], fixed, [(10, 1, date(2025,1,6), date(2025,1,8), 'small')])
+    assert plan['moves'] == [(10, 1, 2)]
+    assert (plan['short_gaps_before'], plan['short_gaps_after']) == (1, 0)
+
+def test_short_gaps():
+    idx = AvailabilityIndex()
+    idx.load([(1, date(2025,1,1), date(2025,1,2)), (1, date(2025,1,4), date(2025,1,5)), (1, date(2025,1,20), date(2025,1,21))])
+    assert short_gaps(idx, [1]) == 1
+
+@pytest.mark.skipif(not os.getenv('TEST_DATABASE_URL'), reason='TEST_DATABASE_URL not set')
+def test_repack_keeps_off_held_dates(scratch_schema, monkeypatch):
+    asyncpg = pytest.importorskip('asyncpg')
+    import db
+    import refdata
+    from app.allocation import repack_bookings
+    soon = date.today() + timedelta(days=10)
+
+    async def run():
+        conn = await asyncpg.connect(os.getenv('TEST_DATABASE_URL'))
+        try:
+            await conn.execute(f'SET search_path TO {scratch_schema}, public')
+            owner = await conn.fetchval("INSERT INTO owners (telegram_id, name) VALUES (1, 'Ann') RETURNING id")
+            pet = await conn.fetchval("INSERT INTO pets (owner_id, name, species) VALUES ($1, 'Rex', 'dog') RETURNING id", owner)
+            kennels = [dict(r) for r in await conn.fetch(
+                "INSERT INTO kennels (code, size, daily_price) VALUES ('S1', 'small', 20), ('S2', 'small', 20) RETURNING id, size")]
+            s1, s2 = (k['id'] for k in kennels)
+            book = 'INSERT INTO bookings (pet_id, kennel_id, start_date, end_date, paid) VALUES ($1, $2, $3, $4, $5) RETURNING id'
+            # a paid stay in S1 ends the day before ours: best fit would move ours from S2 next to it
+            await conn.execute(book, pet, s1, soon - timedelta(days=3), soon - timedelta(days=1), True)
+            ours = await conn.fetchval(book, pet, s2, soon, soon + timedelta(days=2), False)
+            await conn.execute("INSERT INTO booking_holds (kennel_id, start_date, end_date, telegram_id, expires_at) "
+                               "VALUES ($1, $2, $3, 99, now() + interval '10 minutes')", s1, soon + timedelta(days=1), soon + timedelta(days=4))
+
+            async def get_kennels(active_only=True):
+                return kennels
+
+            async def with_transaction(tx, label=None):
+                async with conn.transaction():
+                    return await tx(conn)
+
+            monkeypatch.setattr(refdata, 'get_kennels', get_kennels)
+            monkeypatch.setattr(db, 'with_transaction', with_transaction)
+            held = await repack_bookings(apply=True)
+            kennel = await conn.fetchval('SELECT kennel_id FROM bookings WHERE id = $1', ours)
+            await conn.execute("UPDATE booking_holds SET expires_at = now() - interval '1 second'")
+            expired = await repack_bookings()
+            return held, kennel == s2, expired['moves'] == [(ours, s2, s1)]
+        finally:
+            await conn.close()
+
+    held, stayed, moved_once_expired = asyncio.run(run())
+    assert held['moves'] == [] and not held['applied']
+    assert stayed and moved_once_expired
@@ -0,0 +1,34 @@
+from app.analytics import occupancy_series, daily_totals, period_start
+from datetime import date
+import pytest
+
+GROUPS = {1: 'small', 2: 'small', 3: 'large'}
+CAPACITY = {'small': 2, 'large': 1}
+BOOKINGS = [
+    (1, date(2025,1,1), date(2025,1,4), 40),    # 10/day
+    (2, date(2025,1,3), date(2025,1,3), 5),
+    (3, date(2024,12,30), date(2025,1,2), 80),  # 20/day, clipped at the range start
+    (9, date(2025,1,1), date(2025,1,2), 99),    # unknown kennel, ignored
+]
+
+def test_daily_totals_sweep():
+    daily = daily_totals(BOOKINGS, GROUPS, date(2025,1,1), date(2025,1,5))
+    assert daily['small'][0] == [1, 1, 2, 1, 0]
+    assert daily['small'][1] == pytest.approx([10, 10, 15, 10, 0])
+    assert daily['large'][0] == [1, 1, 0, 0, 0]
+
+def test_occupancy_series_by_day_and_week():
+    days = occupancy_series(BOOKINGS, GROUPS, CAPACITY, date(2025,1,1), date(2025,1,5))
+    assert [b['occupancy'] for b in days['small']] == [0.5, 0.5, 1.0, 0.5, 0.0]
+    assert days['total'][0] == {'period': '2025-01-01', 'days': 1, 'occupied_days': 2, 'capacity_days': 3, 'occupancy': 0.6667, 'revenue': 30.0}
+
+    # 2025-01-01 is a Wednesday; the 5th starts nothing new, the 6th starts week 2
+    weeks = occupancy_series(BOOKINGS, GROUPS, CAPACITY, date(2025,1,1), date(2025,1,6), 'week')
+    assert [b['period'] for b in weeks['total']] == ['2024-12-30', '2025-01-06']
+    assert weeks['total'][0]['occupied_days'] == 7 and weeks['total'][0]['revenue'] == 85.0
+    assert weeks['large'][1]['occupied_days'] == 0
+
+def test_period_start_rejects_unknown():
+    assert period_start(date(2025,1,15), 'month') == date(2025,1,1)
+    with pytest.raises(ValueError):
+        period_start(date(2025,1,15), 'year')
@@ -0,0 +1,64 @@
+from app.availability import AvailabilityIndex, HoldIndex
+from datetime import date
+
+def make_index():
+    idx = AvailabilityIndex()
+    idx.load([
+        (1, date(2025,1,1), date(2025,1,5)),
+        (1, date(2025,1,10), date(2025,1,12)),
+        (2, date(2025,1,3), date(2025,1,4)),
+    ])
+    return idx
+
+def test_is_free():
+    idx = make_index()
+    assert not idx.is_free(1, date(2025,1,5), date(2025,1,6))
+    assert idx.is_free(1, date(2025,1,6), date(2025,1,9))
+    assert not idx.is_free(1, date(2024,12,1), date(2025,2,1))
+    assert idx.is_free(3, date(2025,1,1), date(2025,1,31))
+
+def test_free_kennels_and_add():
+    idx = make_index()
+    assert idx.free_kennels([1, 2, 3], date(2025,1,6), date(2025,1,8)) == [1, 2, 3]
+    v = idx.version(2)
+    idx.add(2, date(2025,1,7), date(2025,1,7))
+    assert idx.version(2) == v + 1
+    assert idx.free_kennels([1, 2, 3], date(2025,1,6), date(2025,1,8)) == [1, 3]
+
+def test_contains():
+    idx = make_index()
+    assert idx.contains(1, date(2025,1,10), date(2025,1,12))
+    assert not idx.contains(1, date(2025,1,10), date(2025,1,11))
+    assert not idx.contains(3, date(2025,1,10), date(2025,1,12))
+
+def test_neighbours():
+    idx = make_index()
+    assert idx.neighbours(1, date(2025,1,6), date(2025,1,8)) == (date(2025,1,5), date(2025,1,10))
+    assert idx.neighbours(1, date(2025,1,13), date(2025,1,20)) == (date(2025,1,12), None)
+    assert idx.neighbours(3, date(2025,1,1), date(2025,1,2)) == (None, None)
+
+def test_next_free_day():
+    idx = make_index()
+    idx.add(1, date(2025,1,6), date(2025,1,9))
+    assert idx.next_free_day(1, date(2025,1,2)) == date(2025,1,13)
+    assert idx.next_free_day(2, date(2025,1,1)) == date(2025,1,1)
+
+def test_month_bitmap():
+    idx = make_index()
+    idx.add(1, date(2024,12,30), date(2025,1,1))
+    bits = idx.month_bitmap(1, 2025, 1)
+    booked = [d for d in range(1, 32) if bits >> (d - 1) & 1]
+    assert booked == [1, 2, 3, 4, 5, 10, 11, 12]
+    assert idx.month_bitmap(1, 2025, 2) == 0
+
+def test_hold_index():
+    holds = HoldIndex()
+    holds.load([(1, 1, date(2025,1,5), date(2025,1,8), 100.0, 'ann')])
+    assert not holds.is_free(1, date(2025,1,8), date(2025,1,9), owner='bob', now=50)
+    assert holds.is_free(1, date(2025,1,8), date(2025,1,9), owner='ann', now=50)
+    assert holds.is_free(1, date(2025,1,9), date(2025,1,9), owner='bob', now=50)
+    assert holds.is_free(1, date(2025,1,8), date(2025,1,9), owner='bob', now=100)
+    holds.add(2, 1, date(2025,1,1), date(2025,1,2), 200.0, 'bob')
+    holds.purge(now=150)
+    holds.remove(2)
+    assert holds.is_free(1, date(2025,1,1), date(2025,1,9), now=0)
@@ -0,0 +1,146 @@
+import asyncio
+from datetime import date
+from types import SimpleNamespace
+import pytest
+
+pytest.importorskip('telegram')
+pytest.importorskip('asyncpg')
+from app import booking_steps as steps
+
+KENNELS = [
+    {'id': 1, 'code': 'S1', 'size': 'small', 'daily_price': 20, 'is_active': True},
+    {'id': 2, 'code': 'S2', 'size': 'small', 'daily_price': 20, 'is_active': True},
+    {'id': 3, 'code': 'L1', 'size': 'large', 'daily_price': 40, 'is_active': True},
+]
+
+class Message:
+    def __init__(self, text):
+        self.text = text
+        self.replies = []
+
+    async def reply_text(self, text, reply_markup=None):
+        self.replies.append((text, reply_markup))
+
+def make_update(text, user_id=7):
+    return SimpleNamespace(message=Message(text), effective_user=SimpleNamespace(id=user_id))
+
+@pytest.fixture
+def refdata(monkeypatch):
+    async def get_kennels(active_only=True):
+        return KENNELS
+
+    async def get_kennel(kennel_id):
+        return {k['id']: k for k in KENNELS}.get(kennel_id)
+
+    async def food_keyboard():
+        return 'food-keyboard'
+
+    holds = []
+
+    async def place_hold(kennel_id, start, end, telegram_id):
+        holds.append((kennel_id, start, end, telegram_id))
+        return len(holds)
+
+    monkeypatch.setattr(steps.refdata, 'get_kennels', get_kennels)
+    monkeypatch.setattr(steps.refdata, 'get_kennel', get_kennel)
+    monkeypatch.setattr(steps, 'food_keyboard', food_keyboard)
+    monkeypatch.setattr(steps, 'place_hold', place_hold)
+    steps.kennel_index.load([])
+    steps.hold_index.load([])
+    yield holds
+    steps.kennel_index.load([])
+    steps.hold_index.load([])
+
+def test_typed_end_date_allocates_and_holds_auto_booking(refdata):
+    # kennel 1 is busy, kennel 2 ends a stay right before ours: best fit
+    steps.kennel_index.load([(1, date(2030, 1, 1), date(2030, 1, 20)), (2, date(2030, 1, 1), date(2030, 1, 9))])
+    booking = {'pet_id': 5, 'auto': True, 'kennel_id': None, 'min_size': 'small', 'start_date': date(2030, 1, 10)}
+    steps.set_step(booking, 'end_date')
+    context = SimpleNamespace(user_data={'booking': booking})
+    update = make_update('2030-01-12')
+    asyncio.run(steps.book_end_date_handler(update, context))
+    assert booking['kennel_id'] == 2 and booking['hold_id'] == 1
+    assert refdata == [(2, date(2030, 1, 10), date(2030, 1, 12), 7)]
+    assert booking['step'] == 'food'
+    text, markup = update.message.replies[-1]
+    assert text.startswith('Kennel S2') and markup == 'food-keyboard'
+
+def test_typed_end_date_offers_alternatives_when_held(refdata):
+    # someone else holds kennel 1; the user never gets past the dates onto it
+    steps.hold_index.add(99, 1, date(2030, 2, 1), date(2030, 2, 5), 1e12, 42)
+    booking = {'pet_id': 5, 'kennel_id': 1, 'min_size': 'small', 'start_date': date(2030, 2, 2)}
+    steps.set_step(booking, 'end_date')
+    context = SimpleNamespace(user_data={'booking': booking})
+    update = make_update('2030-02-03')
+    asyncio.run(steps.book_end_date_handler(update, context))
+    assert refdata == []
+    assert booking['step'] == 'kennel'
+    text, markup = update.message.replies[-1]
+    assert 'taken' in text
+    assert [row[0].callback_data for row in markup.inline_keyboard] == ['altkennel:2', 'altkennel:3']
+
+def test_set_step_applies_the_step_timeout(monkeypatch):
+    monkeypatch.setattr(steps.time, 'time', lambda: 1000.0)
+    booking = {}
+    steps.set_step(booking, 'kennel')
+    assert booking == {'step': 'kennel', 'expires_at': 1000.0 + steps.BOOKING_STEP_TIMEOUTS['kennel']}
+    steps.set_step(booking, 'start_date')
+    assert booking['expires_at'] == 1000.0 + steps.BOOKING_STEP_TIMEOUTS['start_date']
+    assert not steps.booking_expired(booking, now=1000.0 + steps.BOOKING_STEP_TIMEOUTS['start_date'] - 1)
+    assert steps.booking_expired(booking, now=1000.0 + steps.BOOKING_STEP_TIMEOUTS['start_date'] + 1)
+
+def test_text_is_routed_to_the_current_step():
+    booking = {'pet_id': 5, 'kennel_id': 1}
+    steps.set_step(booking, 'food_quantity')
+    context = SimpleNamespace(user_data={'booking': booking})
+    update = make_update('3')
+    asyncio.run(steps.booking_text_dispatcher(update, context))
+    assert booking['food_quantity'] == 3 and booking['step'] == 'feeding_frequency'
+    assert update.message.replies == [('Feeding frequency per day (e.g. 2):', None)]
+
+    # a button step does not take typed input
+    steps.set_step(booking, 'food')
+    update = make_update('3')
+    asyncio.run(steps.booking_text_dispatcher(update, context))
+    assert booking['step'] == 'food' and 'buttons' in update.message.replies[0][0]
+
+def test_expired_booking_is_dropped_on_access():
+    booking = {'pet_id': 5, 'step': 'food_quantity', 'expires_at': 1.0}
+    context = SimpleNamespace(user_data={'booking': booking})
+    update = make_update('3')
+    asyncio.run(steps.booking_text_dispatcher(update, context))
+    assert 'booking' not in context.user_data and 'food_quantity' not in booking
+    assert 'expired' in update.message.replies[0][0]
+
+def test_sweep_drops_expired_bookings_and_marks_them_for_persistence(monkeypatch):
+    async def no_holds():
+        pass
+
+    monkeypatch.setattr(steps, 'sweep_expired_holds', no_holds)
+    live = {'step': 'food', 'expires_at': 1e12}
+    marked = []
+    application = SimpleNamespace(
+        user_data={1: {'booking': {'step': 'food', 'expires_at': 1.0}, 'is_admin': True}, 2: {'booking': live}, 3: {}},
+        mark_data_for_update_persistence=lambda user_ids: marked.extend(user_ids))
+    asyncio.run(steps.sweep_expired_bookings(SimpleNamespace(application=application)))
+    assert application.user_data == {1: {'is_admin': True}, 2: {'booking': live}, 3: {}}
+    assert marked == [1]
+
+def test_payment_link_is_sent_when_the_reference_cannot_be_stored(monkeypatch):
+    class Provider:
+        name = 'fake'
+
+        async def create_checkout(self, booking_id, amount):
+            return {'id': 'cs_1', 'url': 'https://pay.example/cs_1'}
+
+    async def fetchval_named(name, *args):
+        raise ConnectionError('database went away')
+
+    sent = []
+
+    async def send_message(chat_id, text):
+        sent.append((chat_id, text))
+
+    monkeypatch.setattr(steps, 'fetchval_named', fetchval_named)
+    asyncio.run(steps.send_payment_link(SimpleNamespace(send_message=send_message), 7, 12, 40.0, Provider()))
+    assert sent == [(7, 'Pay for booking #12 here: https://pay.example/cs_1')]
@@ -0,0 +1,61 @@
+import asyncio
+import pytest
+
+pytest.importorskip('telegram')
+pytest.importorskip('asyncpg')
+from telegram.error import Forbidden
+from app import broadcast
+from app.broadcast import Broadcaster, FakeBot, MESSAGES
+
+async def _send_all(bot, messages, **kwargs):
+    b = Broadcaster(bot, **kwargs)
+    b.start()
+    try:
+        for chat_id, text in messages:
+            await b.submit(chat_id, text)
+        await asyncio.wait_for(b.drain(), 10)
+    finally:
+        await b.stop()
+
+def test_everything_is_delivered_within_limits():
+    bot = FakeBot(latency=0, limit=1000, chat_limit=1000)
+    asyncio.run(_send_all(bot, [(i % 10, 'hi') for i in range(50)], rate=1000, chat_rate=1000, queue_size=5))
+    assert bot.sent == 50 and bot.rejected == 0
+
+def test_retry_after_pauses_and_retries():
+    # the fake bot allows a burst of 3 per chat; our chat bucket lets 4 through, so one 429
+    bot = FakeBot(latency=0, limit=1000, chat_limit=1)
+    limited = MESSAGES.value('rate_limited')
+    asyncio.run(_send_all(bot, [(1, 'hi')] * 4, rate=1000, chat_rate=100, senders=1))
+    assert bot.sent == 4 and bot.rejected == 1
+    assert MESSAGES.value('rate_limited') == limited + 1
+
+def test_blocked_chat_is_not_retried():
+    class BlockingBot(FakeBot):
+        async def send_message(self, chat_id, text):
+            if chat_id == 13:
+                self.rejected += 1
+                raise Forbidden('bot was blocked by the user')
+            await super().send_message(chat_id, text)
+
+    bot = BlockingBot(latency=0, limit=1000, chat_limit=1000)
+    blocked = MESSAGES.value('blocked')
+    asyncio.run(_send_all(bot, [(12, 'hi'), (13, 'hi'), (14, 'hi')], rate=1000, chat_rate=1000))
+    assert bot.sent == 2 and bot.rejected == 1
+    assert MESSAGES.value('blocked') == blocked + 1
+
+def test_recipients_are_fetched_in_keyset_pages(monkeypatch):
+    owners = [{'telegram_id': i} for i in range(1, 8)]
+    calls = []
+
+    async def fetch(query, after, limit):
+        calls.append((after, limit))
+        return [r for r in owners if r['telegram_id'] > after][:limit]
+
+    monkeypatch.setattr(broadcast, 'fetch', fetch)
+
+    async def collect():
+        return [r['telegram_id'] async for r in broadcast.recipients(broadcast.OWNERS_QUERY, 'telegram_id', batch=3)]
+
+    assert asyncio.run(collect()) == list(range(1, 8))
+    assert calls == [(0, 3), (3, 3), (6, 3)]
@@ -0,0 +1,116 @@
+from app.bulk_import import read_rows, validated_records, ImportReport, IMPORT_COLUMNS, format_from_name
+from decimal import Decimal
+import asyncio
+import io
+import os
+import pytest
+
+CSV = '''owner_telegram_id,owner_name,owner_phone,pet_name,species,age,weight_kg,microchip_id
+100,Ann,+123,Rex,dog,3,12.5,CHIP1
+abc,Bob,,Tom,cat,,,CHIP2
+101,Cid,,Max,dog,-1,,CHIP3
+102,Dee,,Pip,cat,,,
+103,Eve,,Rex2,dog,,,CHIP1
+'''
+
+def test_csv_validation_reports_errors_and_keeps_good_rows():
+    report = ImportReport()
+    records = list(validated_records(read_rows(io.StringIO(CSV), 'csv'), report))
+    assert len(records) == 1
+    line, *values = records[0]
+    row = dict(zip(IMPORT_COLUMNS, values))
+    assert line == 2
+    assert row['owner_telegram_id'] == 100 and row['age'] == 3 and row['weight_kg'] == Decimal('12.5')
+    assert row['owner_email'] is None
+    assert report.rows == 5 and report.error_count == 4
+    assert [line for line, _ in report.errors] == [3, 4, 5, 6]
+    assert 'duplicate microchip_id' in report.errors[-1][1]
+
+def test_ndjson_rows():
+    text = io.StringIO('{"owner_telegram_id": 1, "owner_name": "A", "pet_name": "P", "species": "dog", "microchip_id": "X"}\n'
+                       '\n'
+                       'not json\n'
+                       '[1, 2]\n')
+    report = ImportReport()
+    records = list(validated_records(read_rows(text, 'ndjson'), report))
+    assert len(records) == 1 and records[0][0] == 1
+    assert [line for line, _ in report.errors] == [3, 4]
+    assert 'rows skipped' in report.summary()
+
+def test_non_finite_numbers_are_row_errors():
+    text = io.StringIO('owner_telegram_id,owner_name,pet_name,species,weight_kg,length_cm,microchip_id\n'
+                       '1,A,P,dog,NaN,,C1\n'
+                       '2,B,Q,cat,,sNaN,C2\n'
+                       '3,C,R,dog,Infinity,,C3\n'
+                       '4,D,S,dog,4.5,30,C4\n')
+    report = ImportReport()
+    records = list(validated_records(read_rows(text, 'csv'), report))
+    assert [r[0] for r in records] == [5]
+    assert [line for line, _ in report.errors] == [2, 3, 4]
+    assert all('is not a number' in msg for _, msg in report.errors)
+
+def test_format_from_name():
+    assert format_from_name('partner.CSV') == 'csv'
+    assert format_from_name('dump.jsonl') == 'ndjson'
+    assert format_from_name('notes.txt') is None
+
+def test_placeholder_microchips_are_row_errors():
+    text = io.StringIO('owner_telegram_id,owner_name,pet_name,species,microchip_id\n'
+                       '1,A,P,dog,none\n'
+                       '2,B,Q,cat,Unknown\n'
+                       '3,C,R,dog,000\n'
+                       '4,D,S,dog,C4\n')
+    report = ImportReport()
+    records = list(validated_records(read_rows(text, 'csv'), report))
+    assert [r[0] for r in records] == [5]
+    assert all('placeholder' in msg for _, msg in report.errors) and report.error_count == 3
+
+def test_values_beyond_column_limits_are_row_errors():
+    text = io.StringIO('owner_telegram_id,owner_name,pet_name,species,age,weight_kg,microchip_id\n'
+                       + '9' * 25 + ',A,P,dog,,,C1\n'
+                       '2,B,Q,cat,99999999999,,C2\n'
+                       '3,C,R,dog,,1e200000,C3\n'
+                       '9223372036854775807,D,S\x00,dog,2147483647,4.5,C4\n')
+    report = ImportReport()
+    records = list(validated_records(read_rows(text, 'csv'), report))
+    assert [line for line, _ in report.errors] == [2, 3, 4]
+    assert all('out of range' in msg for _, msg in report.errors)
+    line, *values = records[0]
+    assert line == 5 and dict(zip(IMPORT_COLUMNS, values))['pet_name'] == 'S'
+
+@pytest.mark.skipif(not os.getenv('TEST_DATABASE_URL'), reason='TEST_DATABASE_URL not set')
+def test_shared_chip_does_not_move_other_owners_pets(scratch_schema, tmp_path, monkeypatch):
+    asyncpg = pytest.importorskip('asyncpg')
+    import db
+    from app.bulk_import import import_file
+
+    path = tmp_path / 'pets.csv'
+    path.write_text('owner_telegram_id,owner_name,pet_name,species,microchip_id\n'
+                    '300,Cat Lady,Tom,cat,DUP\n'
+                    '300,Cat Lady,Kit,cat,ONE\n')
+
+    async def run():
+        conn = await asyncpg.connect(os.getenv('TEST_DATABASE_URL'))
+        try:
+            await conn.execute(f'SET search_path TO {scratch_schema}, public')
+            for tg, chip in ((100, 'DUP'), (200, 'DUP'), (100, 'ONE')):
+                owner = await conn.fetchval("INSERT INTO owners (telegram_id, name) VALUES ($1, 'x') "
+                                            "ON CONFLICT (telegram_id) DO UPDATE SET name = 'x' RETURNING id", tg)
+                await conn.execute("INSERT INTO pets (owner_id, name, species, microchip_id) VALUES ($1, 'p', 'dog', $2)", owner, chip)
+
+            async def with_transaction(tx, label=None):
+                async with conn.transaction():
+                    return await tx(conn)
+
+            monkeypatch.setattr(db, 'with_transaction', with_transaction)
+            report = await import_file(str(path), 'csv')
+            owners = await conn.fetch('SELECT o.telegram_id, p.microchip_id FROM pets p JOIN owners o ON o.id = p.owner_id ORDER BY p.id')
+            return report, [tuple(r) for r in owners]
+        finally:
+            await conn.close()
+
+    report, owners = asyncio.run(run())
+    assert report.errors == [(2, "microchip_id 'DUP' matches pets of several owners")]
+    assert report.pets_updated == 1 and report.pets_inserted == 0
+    # the shared chip stays put; the unique one moves to the importing owner
+    assert owners == [(100, 'DUP'), (200, 'DUP'), (300, 'ONE')]
@@ -5,3 +5,11 @@ def test_calendar_keyboard():
     assert isinstance(kb, list)
     # header row + weeks + nav row
     assert len(kb) >= 5
+
+def test_calendar_taken_days_disabled():
+    # 2025-08-01 is a Friday; mark the 1st and 3rd as taken
+    kb = build_month_keyboard(2025,8,'endcal', taken=0b101)
+    cells = [c for row in kb[1:-1] for c in row if c['text'].strip()]
+    assert cells[0]['callback_data'] == 'noop'
+    assert cells[1]['callback_data'] == 'endcal:day:2025-08-02'
+    assert cells[2]['callback_data'] == 'noop'
@@ -0,0 +1,39 @@
+import asyncio
+import pytest
+
+pytest.importorskip('asyncpg')
+pytest.importorskip('dotenv')
+from app import db
+
+class Conn:
+    def __init__(self, pid):
+        self.pid = pid
+        self.listeners = []
+
+    def get_server_pid(self):
+        return self.pid
+
+    async def prepare(self, sql):
+        return sql
+
+    def add_termination_listener(self, callback):
+        self.listeners.append(callback)
+
+    def close(self):
+        for cb in self.listeners:
+            cb(self)
+
+def test_statements_are_forgotten_when_the_pool_closes_a_connection(monkeypatch):
+    monkeypatch.setattr(db, '_prepared', {})
+    old, other = Conn(100), Conn(200)
+    asyncio.run(db._init_connection(old))
+    asyncio.run(db._init_connection(other))
+    assert db.statement_cache_stats()['connections'] == 2
+    old.close()
+    assert set(db._prepared) == {200}
+    # a new backend reusing pid 200 keeps its statements when the old one's close arrives late
+    reused = Conn(200)
+    asyncio.run(db._init_connection(reused))
+    other.close()
+    assert set(db._prepared) == {200}
+    assert db.statement_cache_stats()['connections'] == 1
@@ -0,0 +1,85 @@
+import os
+import pytest
+from app.exports import build_export_query, csv_chunks, gzip_chunks, EXPORT_HEADER
+from datetime import date
+import asyncio, gzip
+
+ROW = {'id': 1, 'owner_name': 'Ann', 'pet_name': 'Rex', 'kennel_code': 'K1-S', 'start_date': date(2025,1,1), 'end_date': date(2025,1,2), 'food_name': 'Basic Kibble', 'food_quantity': 2, 'feeding_frequency_per_day': 2, 'services': 'none', 'estimated_price': 8, 'created_at': None, 'paid': False}
+
+async def records(n):
+    for i in range(n):
+        yield dict(ROW, id=i)
+
+async def collect(chunks):
+    return [c async for c in chunks]
+
+def test_build_export_query_filters():
+    sql, args = build_export_query(date(2025,1,1), None, 'K1-S')
+    assert 'b.end_date >= $1' in sql and 'k.code = $2' in sql
+    assert args == [date(2025,1,1), 'K1-S']
+    sql, args = build_export_query()
+    assert 'WHERE' not in sql and args == []
+
+def test_csv_chunks_streams():
+    chunks = asyncio.run(collect(csv_chunks(records(5), chunk_rows=2)))
+    assert len(chunks) == 3
+    lines = b''.join(chunks).decode().splitlines()
+    assert lines[0] == ','.join(EXPORT_HEADER)
+    assert len(lines) == 6
+
+def test_gzip_chunks_roundtrip():
+    plain = b''.join(asyncio.run(collect(csv_chunks(records(3)))))
+    packed = b''.join(asyncio.run(collect(gzip_chunks(csv_chunks(records(3))))))
+    assert gzip.decompress(packed) == plain
+
+def test_incremental_query_orders_by_id():
+    sql, args = build_export_query(since=10)
+    assert 'b.write_xid >= $1' in sql
+    assert sql.endswith('ORDER BY b.id')
+    assert args == [10]
+
+def test_ndjson_chunks():
+    import json
+    from app.exports import ndjson_chunks
+    lines = b''.join(asyncio.run(collect(ndjson_chunks(records(3), chunk_rows=2)))).decode().splitlines()
+    assert [json.loads(l)['booking_id'] for l in lines] == [0, 1, 2]
+    assert json.loads(lines[0])['start_date'] == '2025-01-01'
+
+@pytest.mark.skipif(not os.getenv('TEST_DATABASE_URL'), reason='TEST_DATABASE_URL not set')
+def test_watermark_picks_up_late_commits_and_updates(scratch_schema):
+    asyncpg = pytest.importorskip('asyncpg')
+    from app.exports import WATERMARK_QUERY
+
+    async def export(conn, since):
+        watermark = await conn.fetchval(WATERMARK_QUERY)
+        sql, args = build_export_query(since=since)
+        return [(r['id'], r['paid']) for r in await conn.fetch(sql, *args)], watermark
+
+    async def run():
+        url = os.getenv('TEST_DATABASE_URL')
+        conn, writer = await asyncpg.connect(url), await asyncpg.connect(url)
+        try:
+            for c in (conn, writer):
+                await c.execute(f'SET search_path TO {scratch_schema}, public')
+            owner = await conn.fetchval("INSERT INTO owners (telegram_id, name) VALUES (1, 'Ann') RETURNING id")
+            pet = await conn.fetchval("INSERT INTO pets (owner_id, name, species) VALUES ($1, 'Rex', 'dog') RETURNING id", owner)
+            insert = "INSERT INTO bookings (pet_id, start_date, end_date) VALUES ($1, '2030-01-01', '2030-01-02') RETURNING id"
+            first = await conn.fetchval(insert, pet)
+            # this booking's id is taken while the export runs, but it commits only afterwards
+            slow = writer.transaction()
+            await slow.start()
+            late = await writer.fetchval(insert, pet)
+            rows, watermark = await export(conn, 0)
+            assert rows == [(first, False)]
+            await slow.commit()
+            rows, watermark = await export(conn, watermark)
+            assert rows == [(late, False)]
+            # a booking paid later comes out again
+            await conn.execute('UPDATE bookings SET paid = true WHERE id = $1', first)
+            rows, watermark = await export(conn, watermark)
+            assert rows == [(first, True)]
+        finally:
+            await writer.close()
+            await conn.close()
+
+    asyncio.run(run())
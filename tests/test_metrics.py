@@ -0,0 +1,41 @@
+from app.metrics import Registry
+
+def test_render_counter_gauge_histogram():
+    reg = Registry()
+    c = reg.counter('hits_total', 'Hits', ('kind',))
+    c.inc('a')
+    c.inc('a', amount=2)
+    reg.gauge('pool', 'Pool', ('state',), callback=lambda: {('idle',): 3})
+    h = reg.histogram('latency_seconds', 'Latency', ('q',), buckets=(0.1, 1.0))
+    h.observe('x', value=0.05)
+    h.observe('x', value=5)
+    assert reg.counter('hits_total', 'Hits', ('kind',)) is c
+    text = reg.render()
+    assert 'hits_total{kind="a"} 3' in text
+    assert 'pool{state="idle"} 3' in text
+    assert 'latency_seconds_bucket{q="x",le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{q="x",le="1.0"} 1' in text
+    assert 'latency_seconds_bucket{q="x",le="+Inf"} 2' in text
+    assert 'latency_seconds_count{q="x"} 2' in text
+    assert '# TYPE latency_seconds histogram' in text
+
+def test_metrics_server_serves_registry():
+    import asyncio
+    from app.metrics import start_metrics_server
+
+    async def run():
+        reg = Registry()
+        reg.counter('up_total', 'Up').inc()
+        server = await start_metrics_server('127.0.0.1', 0, reg)
+        port = server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(b'GET /metrics HTTP/1.1\r\nHost: x\r\n\r\n')
+        data = await reader.read()
+        writer.close()
+        server.close()
+        await server.wait_closed()
+        return data.decode()
+
+    resp = asyncio.run(run())
+    assert resp.startswith('HTTP/1.1 200 OK')
+    assert 'up_total 1' in resp
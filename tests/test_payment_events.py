@@ -0,0 +1,25 @@
+import json
+import pytest
+
+pytest.importorskip('asyncpg')
+from app.payment_events import paid_sessions
+
+def event(type_, session_id, payment_status='paid', **session):
+    session.update(id=session_id, payment_status=payment_status)
+    return {'type': type_, 'payload': json.dumps({'data': {'object': session}})}
+
+def test_paid_sessions_picks_paid_checkouts_and_their_bookings():
+    events = [
+        event('checkout.session.completed', 'cs_1', client_reference_id='17'),
+        event('checkout.session.async_payment_succeeded', 'cs_2', metadata={'booking_id': '18'}),
+        # paid, but no usable booking reference: matched on the session id later
+        event('checkout.session.completed', 'cs_3', client_reference_id='abc'),
+        event('checkout.session.completed', 'cs_4', payment_status='no_payment_required'),
+        # not paid yet / not a payment event
+        event('checkout.session.completed', 'cs_5', payment_status='unpaid', client_reference_id='20'),
+        event('payment_intent.created', 'pi_1', client_reference_id='21'),
+    ]
+    assert paid_sessions(events) == ([17, 18, None, None], ['cs_1', 'cs_2', 'cs_3', 'cs_4'])
+
+def test_paid_sessions_empty():
+    assert paid_sessions([]) == ([], [])
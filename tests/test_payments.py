@@ -0,0 +1,69 @@
+import asyncio
+import json
+import pytest
+
+stripe = pytest.importorskip('stripe')
+pytest.importorskip('dotenv')
+from app.payments import PaymentProvider, StripeProvider, FakeProvider, PaymentError
+
+class ScriptedClient(type(stripe.new_default_http_client())):
+    """Stripe HTTP client answering from a script instead of the network."""
+
+    def __init__(self, *responses):
+        super().__init__()
+        self.responses = list(responses)
+        self.keys = []
+
+    def _sleep_time_seconds(self, num_retries):
+        return 0
+
+    def request(self, method, url, headers, post_data=None, **kwargs):
+        self.keys.append(headers.get('Idempotency-Key'))
+        r = self.responses.pop(0)
+        if isinstance(r, Exception):
+            raise r
+        status, body = r
+        return json.dumps(body), status, {}
+
+SESSION = (200, {'id': 'cs_1', 'object': 'checkout.session', 'url': 'https://pay.example/cs_1'})
+CONFLICT = (409, {'error': {'type': 'idempotency_error', 'message': 'request in flight'}})
+
+def timeout():
+    return stripe.error.APIConnectionError('Request timed out', should_retry=True)
+
+@pytest.fixture(autouse=True)
+def stripe_globals(monkeypatch):
+    monkeypatch.setattr(stripe, 'default_http_client', None)
+    monkeypatch.setattr(stripe, 'max_network_retries', 0)
+
+def test_timeout_and_idempotency_conflict_are_retried_with_the_same_key():
+    client = ScriptedClient(timeout(), CONFLICT, SESSION)
+    provider = StripeProvider('sk_test', workers=1, retries=3, http_client=client)
+    assert asyncio.run(provider.create_checkout(42, 10.0)) == {'id': 'cs_1', 'url': 'https://pay.example/cs_1'}
+    assert client.keys == ['booking-42'] * 3
+
+def test_retries_exhausted_and_at_least_one_attempt():
+    provider = StripeProvider('sk_test', workers=1, retries=2, http_client=ScriptedClient(timeout(), timeout()))
+    with pytest.raises(PaymentError):
+        asyncio.run(provider.create_checkout(1, 10.0))
+    client = ScriptedClient(SESSION)
+    provider = StripeProvider('sk_test', workers=1, retries=0, http_client=client)
+    assert asyncio.run(provider.create_checkout(1, 10.0))['id'] == 'cs_1'
+    assert len(client.keys) == 1
+
+def test_http_timeout_is_set_on_the_stripe_client():
+    StripeProvider('sk_test', workers=1, timeout=7)
+    assert stripe.default_http_client._timeout == 7
+
+def test_fake_provider():
+    session = asyncio.run(FakeProvider(latency=0).create_checkout(5, 12.5))
+    assert session['id'].startswith('fake_') and session['id'] in session['url']
+    with pytest.raises(PaymentError):
+        asyncio.run(FakeProvider(latency=0, failure_rate=1).create_checkout(5, 12.5))
+
+def test_incomplete_provider_fails_when_created():
+    class NoCheckout(PaymentProvider):
+        name = 'broken'
+
+    with pytest.raises(TypeError):
+        NoCheckout()
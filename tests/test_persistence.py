@@ -0,0 +1,90 @@
+import asyncio
+import pickle
+from types import SimpleNamespace
+import pytest
+
+pytest.importorskip('telegram')
+pytest.importorskip('asyncpg')
+from app import persistence
+from app.persistence import PostgresPersistence
+
+@pytest.fixture
+def db(monkeypatch):
+    """Records each flush transaction as a list of (verb, args); `fail` makes the next one raise."""
+    state = SimpleNamespace(flushes=[], fail=[])
+
+    class Conn:
+        async def execute(self, sql, *args):
+            state.flushes[-1].append((sql.split()[0], args))
+
+    async def with_transaction(tx, label=None):
+        state.flushes.append([])
+        if state.fail:
+            raise state.fail.pop()
+        return await tx(Conn())
+
+    async def fetchrow(sql, *args):
+        return None
+
+    monkeypatch.setattr(persistence, 'with_transaction', with_transaction)
+    monkeypatch.setattr(persistence, 'fetchrow', fetchrow)
+    return state
+
+def written(statements):
+    """{(kind, key): value} upserted and {(kind, key)} deleted by one flush."""
+    upserts, deletes = {}, set()
+    for verb, args in statements:
+        if verb == 'INSERT':
+            upserts.update({(k, key): pickle.loads(d) for k, key, d in zip(*args)})
+        else:
+            deletes.update(zip(*args))
+    return upserts, deletes
+
+def test_updates_coalesce_into_one_write(db):
+    async def run():
+        p = PostgresPersistence()
+        await p.update_user_data(1, {'step': 'a'})
+        await p.update_user_data(1, {'step': 'b'})
+        await p.update_chat_data(9, {'x': 1})
+        await p.update_conversation('registration', (9, 1), 3)
+        await p.drop_user_data(2)
+        await asyncio.sleep(0.2)
+
+    asyncio.run(run())
+    assert len(db.flushes) == 1
+    upserts, deletes = written(db.flushes[0])
+    assert upserts == {('user', '1'): {'step': 'b'}, ('chat', '9'): {'x': 1}, ('conversation:registration', '[9, 1]'): 3}
+    assert deletes == {('user', '2')}
+
+def test_unchanged_bot_data_is_not_written(db):
+    async def run():
+        p = PostgresPersistence()
+        data = await p.get_bot_data()
+        await p.update_bot_data(data)
+        await p.flush()
+        assert db.flushes == []
+        data['rates'] = [1, 2]
+        await p.update_bot_data(data)
+        await p.flush()
+        await p.update_bot_data({'rates': [1, 2]})
+        await p.flush()
+
+    asyncio.run(run())
+    assert len(db.flushes) == 1
+    assert written(db.flushes[0])[0] == {('bot', ''): {'rates': [1, 2]}}
+
+def test_failed_flush_is_retried_without_losing_newer_writes(db):
+    async def run():
+        p = PostgresPersistence()
+        await p.update_user_data(1, {'v': 1})
+        await p.update_user_data(3, {'v': 1})
+        db.fail.append(RuntimeError('connection lost'))
+        await p.flush()
+        # a newer value arrived before the retry
+        await p.update_user_data(1, {'v': 2})
+        await p.flush()
+        await asyncio.sleep(0.2)
+
+    asyncio.run(run())
+    assert len(db.flushes) == 2
+    assert written(db.flushes[1])[0] == {('user', '1'): {'v': 2}, ('user', '3'): {'v': 1}}
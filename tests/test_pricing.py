@@ -0,0 +1,27 @@
+from app.pricing import PricingRules, quote, quote_many
+from datetime import date
+
+def test_default_rules_match_flat_pricing():
+    rules = PricingRules()
+    # 3 days x 5 + 2 units x 3 + grooming 5 + walking 2
+    assert quote(rules, 5, 3, date(2025,1,1), date(2025,1,3), 2, 'Grooming, walking') == 28.0
+    assert quote(rules, 5, 3, date(2025,1,1), date(2025,1,1), 0, 'none') == 5.0
+
+def test_weekday_and_season_multipliers():
+    # 2025-01-04 is a Saturday
+    rules = PricingRules(weekday_multipliers=[1, 1, 1, 1, 1, 2, 2], seasons=[(date(2025,1,3), date(2025,1,3), 1.5)])
+    assert rules.day_multiplier(date(2025,1,3)) == 1.5
+    # Fri 1.5 + Sat 2 + Sun 2 days at 10/day
+    assert quote(rules, 10, 0, date(2025,1,3), date(2025,1,5)) == 55.0
+
+def test_quote_many_matches_single_quotes():
+    rules = PricingRules(weekday_multipliers=[1, 1, 1, 1, 1.1, 1.3, 1.3])
+    kennels, foods = {1: 3, 2: 8}, {1: 1, 2: 3}
+    stays = [
+        (1, date(2025,1,1), date(2025,1,10), 1, 4, 'walk'),
+        (2, date(2025,2,27), date(2025,3,2), 2, 1, 'grooming'),
+        (2, date(2025,1,5), date(2025,1,5), None, 0, None),
+    ]
+    batch = quote_many(rules, stays, kennels, foods)
+    singles = [quote(rules, kennels[k], foods.get(f), a, b, q, s) for k, a, b, f, q, s in stays]
+    assert batch == singles
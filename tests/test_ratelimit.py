@@ -0,0 +1,62 @@
+from app.ratelimit import TokenBucket, KeyedBuckets, DuplicateFilter, LatestOnly
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+    def __call__(self):
+        return self.now
+
+def test_bucket_bursts_then_paces():
+    clock = Clock()
+    b = TokenBucket(rate=10, capacity=2, clock=clock)
+    assert b.reserve() == 0 and b.reserve() == 0
+    # later callers queue behind earlier reservations
+    assert b.reserve() == 0.1
+    assert round(b.reserve(), 6) == 0.2
+    clock.now = 1.0
+    assert b.reserve() == 0
+
+def test_pause_blocks_for_retry_after():
+    clock = Clock()
+    b = TokenBucket(rate=5, capacity=5, clock=clock)
+    b.pause(3)
+    assert round(b.reserve(), 6) == 3.2
+    clock.now = 10
+    assert b.reserve() == 0
+
+def test_keyed_buckets_prune_idle():
+    clock = Clock()
+    buckets = KeyedBuckets(rate=1, capacity=1, max_keys=2, clock=clock)
+    buckets.get('a').reserve()
+    buckets.get('b').reserve()
+    clock.now = 0.5
+    buckets.get('a')
+    assert len(buckets) == 2
+    clock.now = 5
+    buckets.get('c')  # a and b have refilled and are dropped
+    assert len(buckets) == 1
+
+
+def test_try_take_throttles_without_debt():
+    clock = Clock()
+    b = TokenBucket(rate=2, capacity=3, clock=clock)
+    assert [b.try_take() for _ in range(4)] == [True, True, True, False]
+    clock.now = 0.5
+    assert b.try_take() and not b.try_take()
+
+def test_duplicate_filter_and_latest_only():
+    clock = Clock()
+    dup = DuplicateFilter(window=1, clock=clock)
+    assert not dup.seen((1, 10), 'selectpet:5')
+    assert dup.seen((1, 10), 'selectpet:5')
+    assert not dup.seen((1, 10), 'selectpet:6')
+    clock.now = 2
+    assert not dup.seen((1, 10), 'selectpet:6')
+
+    nav = LatestOnly()
+    first, second = nav.mark((1, 10)), nav.mark((1, 10))
+    assert not nav.is_latest((1, 10), first) and nav.is_latest((1, 10), second)
+    nav.done((1, 10), first)
+    assert len(nav) == 1
+    nav.done((1, 10), second)
+    assert len(nav) == 0
@@ -0,0 +1,46 @@
+import asyncio
+import pytest
+
+pytest.importorskip('asyncpg')
+from app import refdata
+
+@pytest.fixture
+def kennels(monkeypatch):
+    """The kennels table as the fetch sees it; `during_fetch` runs while a load is in flight."""
+    state = {'price': 20, 'during_fetch': None, 'fetches': 0}
+
+    async def fetch(sql):
+        state['fetches'] += 1
+        rows = [{'id': 1, 'code': 'S1', 'size': 'small', 'daily_price': state['price'], 'is_active': True}]
+        during_fetch, state['during_fetch'] = state['during_fetch'], None
+        if during_fetch:
+            during_fetch()
+        return rows
+
+    monkeypatch.setattr(refdata, 'fetch', fetch)
+    refdata.invalidate()
+    yield state
+    refdata.invalidate()
+
+def test_rows_are_cached(kennels):
+    async def run():
+        await refdata.get_kennels()
+        return await refdata.get_kennel(1)
+
+    assert asyncio.run(run())['daily_price'] == 20
+    assert kennels['fetches'] == 1
+
+def test_load_racing_a_notify_is_not_cached(kennels):
+    def price_change_notified():
+        kennels['price'] = 25
+        refdata._on_notify(None, 0, refdata.REFDATA_CHANNEL, 'kennels')
+
+    kennels['during_fetch'] = price_change_notified
+
+    async def run():
+        stale = await refdata.get_kennel(1)
+        return stale, await refdata.get_kennel(1)
+
+    stale, fresh = asyncio.run(run())
+    assert stale['daily_price'] == 20 and fresh['daily_price'] == 25
+    assert kennels['fetches'] == 2
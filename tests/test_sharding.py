@@ -0,0 +1,24 @@
+from app.sharding import HashRing, update_shard_key
+
+def test_ring_is_stable_and_balanced():
+    ring = HashRing(range(4))
+    counts = [0] * 4
+    for user_id in range(20000):
+        shard = ring.shard_for(user_id)
+        assert shard == ring.shard_for(user_id)
+        counts[shard] += 1
+    assert min(counts) > 20000 / 4 * 0.7
+
+def test_adding_shard_moves_few_keys():
+    before, after = HashRing(range(4)), HashRing(range(5))
+    moved = sum(before.shard_for(k) != after.shard_for(k) for k in range(20000))
+    # ideal is 1/5 of the keys, all of them onto the new shard
+    assert moved < 20000 * 0.3
+    assert all(after.shard_for(k) == 4 for k in range(20000) if before.shard_for(k) != after.shard_for(k))
+
+def test_update_shard_key():
+    assert update_shard_key({'update_id': 1, 'message': {'from': {'id': 42}, 'chat': {'id': 7}}}) == 42
+    assert update_shard_key({'update_id': 2, 'callback_query': {'id': 'x', 'from': {'id': 43}}}) == 43
+    assert update_shard_key({'update_id': 3, 'poll_answer': {'user': {'id': 44}}}) == 44
+    assert update_shard_key({'update_id': 4, 'channel_post': {'chat': {'id': -100}}}) == -100
+    assert update_shard_key({'update_id': 5}) == 5
@@ -1,4 +1,4 @@
-from app.utils import parse_yyyy_mm_dd, days_between, ranges_overlap
+from app.utils import parse_yyyy_mm_dd, days_between, ranges_overlap, normalize_microchip
 from datetime import date
 
 def test_parse_date():
@@ -12,3 +12,8 @@ def test_days_between():
 def test_ranges_overlap():
     assert ranges_overlap(date(2025,1,1), date(2025,1,5), date(2025,1,4), date(2025,1,10))
     assert not ranges_overlap(date(2025,1,1), date(2025,1,3), date(2025,1,4), date(2025,1,5))
+
+def test_normalize_microchip():
+    assert normalize_microchip(' 985112003456789 ') == '985112003456789'
+    for placeholder in ('none', 'None.', 'N/A', 'unknown', '', '  ', '0', '000', '-', None):
+        assert normalize_microchip(placeholder) is None